@@ -0,0 +1,323 @@
+# src/artifact_store.py
+
+import os
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from contextlib import contextmanager
+
+from warehouse import connect as warehouse_connect, get_db_path, utc_now
+
+DEFAULT_ARTIFACT_DIR = os.path.join('data', 'artifacts')
+# Report versions kept per ticker and output file; older ones become evictable
+KEEP_VERSIONS = 5
+# Artifacts not pinned by a kept version are evicted once unused this long, or least recently
+# used first while the store is larger than MAX_STORE_BYTES
+MAX_UNUSED_DAYS = 30
+MAX_STORE_BYTES = 512 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    last_used_at TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_artifacts_last_used ON artifacts (last_used_at);
+
+CREATE TABLE IF NOT EXISTS artifact_versions (
+    ticker TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (ticker, name, version)
+);
+CREATE INDEX IF NOT EXISTS idx_artifact_versions_key ON artifact_versions (key);
+"""
+
+_initialized_paths = set()
+
+
+@contextmanager
+def connect(db_path=None):
+    """
+    Opens a warehouse connection and makes sure the artifact tables exist.
+    """
+    path = db_path or get_db_path()
+    with warehouse_connect(path) as conn:
+        if path not in _initialized_paths:
+            conn.executescript(SCHEMA)
+            _initialized_paths.add(path)
+        yield conn
+
+
+def get_artifact_dir():
+    """
+    Returns the artifact directory, honouring the HSFINANCE_ARTIFACT_DIR environment variable.
+    """
+    return os.getenv('HSFINANCE_ARTIFACT_DIR', DEFAULT_ARTIFACT_DIR)
+
+
+def _feed(digest, value):
+    """
+    Adds value to digest. Handles the inputs of the render stages: plain values, dictionaries and
+    sequences, NumPy arrays, pandas objects and slotted records such as records.PriceBars.
+    Every value is prefixed with its type so that e.g. 1 and '1' hash differently.
+    """
+    digest.update(type(value).__name__.encode('utf-8') + b':')
+    if value is None or isinstance(value, (bool, int, float, str)):
+        digest.update(repr(value).encode('utf-8'))
+    elif isinstance(value, bytes):
+        digest.update(value)
+    elif isinstance(value, dict):
+        digest.update(str(len(value)).encode('utf-8'))
+        for key in sorted(value, key=str):
+            _feed(digest, str(key))
+            _feed(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(str(len(value)).encode('utf-8'))
+        for item in value:
+            _feed(digest, item)
+    elif hasattr(value, 'dtype') and hasattr(value, 'tobytes'):  # NumPy array or scalar
+        if value.dtype.kind == 'O':
+            _feed(digest, value.tolist())
+        else:
+            digest.update(f"{value.dtype.str}{getattr(value, 'shape', ())}".encode('utf-8'))
+            digest.update(value.tobytes())
+    elif hasattr(value, 'to_numpy') and hasattr(value, 'index'):  # pandas Series or DataFrame
+        _feed(digest, [str(column) for column in getattr(value, 'columns', ())])
+        _feed(digest, value.index.to_numpy())
+        _feed(digest, value.to_numpy())
+    elif hasattr(value, 'to_numpy'):  # pandas Index
+        _feed(digest, value.to_numpy())
+    elif hasattr(type(value), '__slots__'):
+        for cls in type(value).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                _feed(digest, slot)
+                _feed(digest, getattr(value, slot, None))
+    else:
+        digest.update(repr(value).encode('utf-8'))
+
+
+def input_key(*parts):
+    """
+    Returns the content address of an artifact: the SHA-256 of everything it is rendered from
+    (data slices, render parameters and a version of the rendering code).
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        _feed(digest, part)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """
+    Content-addressed store of rendered artifacts (charts and report files). An artifact is stored
+    once under the hash of its inputs (see input_key), so a render whose inputs have not changed
+    is a lookup instead of a new rendering. Report outputs are published from the store as
+    numbered versions per ticker; the last keep_versions of each are kept, and evict() removes
+    the artifacts no kept version refers to once they go unused or the store grows too large.
+    """
+
+    def __init__(self, root=None, db_path=None, keep_versions=KEEP_VERSIONS):
+        self.root = root or get_artifact_dir()
+        self.db_path = db_path
+        self.keep_versions = keep_versions
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_written = 0
+
+    def _path(self, key, kind, extension):
+        return os.path.join(self.root, kind, key[:2], f'{key}.{extension}')
+
+    def lookup(self, key):
+        """
+        Returns the path of a stored artifact, or None if it is not stored (or its file is gone).
+        """
+        with connect(self.db_path) as conn:
+            row = conn.execute("SELECT path FROM artifacts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(row['path']):
+                conn.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE artifacts SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (utc_now(), key))
+        with self._lock:
+            self.hits += 1
+        return row['path']
+
+    def create(self, key, kind, extension, write):
+        """
+        Renders an artifact with write(path) and stores it under key. write may return False to
+        signal a failed render. Returns the stored path, or None if nothing was written.
+        """
+        path = self._path(key, kind, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Keep the extension last: matplotlib picks the image format from it
+        temporary_path = f'{path[:-len(extension) - 1]}.tmp{os.getpid()}-{threading.get_ident()}.{extension}'
+        try:
+            if write(temporary_path) is False or not os.path.exists(temporary_path):
+                return None
+            os.replace(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        size = os.path.getsize(path)
+        now = utc_now()
+        with connect(self.db_path) as conn:
+            conn.execute(
+                """
+                INSERT INTO artifacts (key, kind, path, size, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET path = excluded.path, size = excluded.size, last_used_at = excluded.last_used_at
+                """,
+                (key, kind, path, size, now, now)
+            )
+        with self._lock:
+            self.misses += 1
+            self.bytes_written += size
+        return path
+
+    def get_or_create(self, key, kind, extension, write):
+        """
+        Returns the stored artifact of key, rendering it with write(path) first if it is not stored.
+        """
+        return self.lookup(key) or self.create(key, kind, extension, write)
+
+    def put_bytes(self, key, kind, extension, data):
+        """
+        Stores data as an artifact unless it is stored already. Returns its path.
+        """
+        def write(path):
+            with open(path, 'wb') as f:
+                f.write(data)
+        return self.get_or_create(key, kind, extension, write)
+
+    def publish(self, key, output_path, ticker, name):
+        """
+        Copies a stored artifact to output_path and records it as the next version of the ticker's
+        output name (e.g. 'final_report.pdf'), unless it already is the latest one. Versions beyond
+        keep_versions are dropped. Returns the version number.
+        """
+        with connect(self.db_path) as conn:
+            row = conn.execute("SELECT path FROM artifacts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                raise KeyError(f"Artifact {key} is not stored")
+            directory = os.path.dirname(output_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temporary_path = f'{output_path}.tmp{os.getpid()}-{threading.get_ident()}'
+            shutil.copyfile(row['path'], temporary_path)
+            os.replace(temporary_path, output_path)
+
+            latest = conn.execute(
+                "SELECT version, key FROM artifact_versions WHERE ticker = ? AND name = ? ORDER BY version DESC LIMIT 1",
+                (ticker, name)
+            ).fetchone()
+            if latest and latest['key'] == key:
+                return latest['version']
+            version = latest['version'] + 1 if latest else 1
+            conn.execute(
+                "INSERT INTO artifact_versions (ticker, name, version, key, created_at) VALUES (?, ?, ?, ?, ?)",
+                (ticker, name, version, key, utc_now())
+            )
+            conn.execute(
+                "DELETE FROM artifact_versions WHERE ticker = ? AND name = ? AND version <= ?",
+                (ticker, name, version - self.keep_versions)
+            )
+        return version
+
+    def versions(self, ticker, name=None):
+        """
+        Returns the kept versions of a ticker's outputs, newest first, as dictionaries with the
+        output name, version number, creation time and stored path.
+        """
+        query = """
+            SELECT v.name, v.version, v.created_at, a.path FROM artifact_versions v
+            LEFT JOIN artifacts a ON a.key = v.key WHERE v.ticker = ?
+        """
+        params = [ticker]
+        if name:
+            query += " AND v.name = ?"
+            params.append(name)
+        with connect(self.db_path) as conn:
+            rows = conn.execute(query + " ORDER BY v.name, v.version DESC", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def evict(self, max_bytes=MAX_STORE_BYTES, max_unused_days=MAX_UNUSED_DAYS):
+        """
+        Deletes artifacts that no kept version refers to: those unused for max_unused_days, then the
+        least recently used ones while the store is larger than max_bytes.
+        Returns a tuple (artifacts deleted, bytes freed).
+        """
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=max_unused_days)).isoformat(timespec='seconds')
+        with connect(self.db_path) as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+            candidates = conn.execute(
+                "SELECT key, path, size, last_used_at FROM artifacts "
+                "WHERE key NOT IN (SELECT key FROM artifact_versions) ORDER BY last_used_at"
+            ).fetchall()
+            evicted = []
+            for row in candidates:
+                if row['last_used_at'] >= cutoff and total <= max_bytes:
+                    break
+                evicted.append(row)
+                total -= row['size']
+            conn.executemany("DELETE FROM artifacts WHERE key = ?", [(row['key'],) for row in evicted])
+        for row in evicted:
+            try:
+                os.remove(row['path'])
+            except FileNotFoundError:
+                pass
+        freed = sum(row['size'] for row in evicted)
+        if evicted:
+            logging.info("Evicted %s artifact(s), %s bytes.", len(evicted), freed)
+        return len(evicted), freed
+
+    def summary(self):
+        """
+        Returns the hits, misses and bytes written of this store's renders as a JSON-serializable dictionary.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'bytes_written': self.bytes_written}
+
+
+def parse_arguments():
+    """
+    Parses command-line arguments.
+    """
+    parser = argparse.ArgumentParser(description='List report versions and evict unused artifacts.')
+    parser.add_argument('tickers', nargs='*', help='Tickers whose kept report versions are listed')
+    parser.add_argument('--evict', action='store_true', help='Evict artifacts no kept version refers to')
+    parser.add_argument('--max-mb', type=float, default=MAX_STORE_BYTES / (1024 * 1024),
+                        help='Store size above which the least recently used artifacts are evicted')
+    parser.add_argument('--max-unused-days', type=int, default=MAX_UNUSED_DAYS,
+                        help='Evict artifacts unused for this many days')
+    return parser.parse_args()
+
+
+def main():
+    """
+    Entry point of the artifact store maintenance tool.
+    """
+    args = parse_arguments()
+    from structured_logging import configure_logging
+    configure_logging()
+    store = ArtifactStore()
+    for ticker in args.tickers:
+        for version in store.versions(ticker.upper()):
+            print(f"{ticker.upper()} {version['name']} v{version['version']} {version['created_at']} {version['path']}")
+    if args.evict:
+        count, freed = store.evict(max_bytes=int(args.max_mb * 1024 * 1024), max_unused_days=args.max_unused_days)
+        print(f"Evicted {count} artifact(s), {freed} bytes.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+# src/batch_endpoint.py
+
+import json
+import time
+import uuid
+import logging
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from structured_logging import configure_logging
+
+
+def echo_responder(body):
+    """
+    Answers a chat completion request without a model, quoting the start of its last message.
+    Used to exercise batch runs offline.
+    """
+    messages = body.get('messages') or [{}]
+    content = ' '.join(str(messages[-1].get('content', '')).split())[:200]
+    return {
+        'id': f'chatcmpl-{uuid.uuid4().hex[:12]}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', ''),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': f"Local batch endpoint reply to: {content}"},
+            'finish_reason': 'stop'
+        }],
+        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+    }
+
+
+def openai_responder(body):
+    """
+    Answers a chat completion request with a synchronous OpenAI call.
+    """
+    import os
+    import openai
+    from dotenv import load_dotenv
+    load_dotenv()
+    openai.api_key = os.getenv('OPENAI_API_KEY')
+    return json.loads(json.dumps(openai.ChatCompletion.create(**body)))
+
+
+class LocalBatchEndpoint:
+    """
+    Stand-in for the OpenAI Files and Batches API, serving the calls batch_llm.BatchClient makes:
+    POST /v1/files, POST /v1/batches, GET /v1/batches/<id> and GET /v1/files/<id>/content.
+    A batch is answered line by line by responder(body) in a background thread, after
+    completion_delay seconds.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, responder=echo_responder, completion_delay=0.0):
+        self.responder = responder
+        self.completion_delay = completion_delay
+        self.files = {}
+        self.batches = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def start(self):
+        """
+        Serves requests in a background thread and returns the endpoint.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, name='batch-endpoint', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """
+        Serves requests in the calling thread until interrupted.
+        """
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _create_file(self, data, purpose):
+        file_id = f'file-{uuid.uuid4().hex[:24]}'
+        with self._lock:
+            self.files[file_id] = data
+        return {'id': file_id, 'object': 'file', 'bytes': len(data), 'created_at': int(time.time()), 'purpose': purpose}
+
+    def _create_batch(self, request):
+        input_file_id = request.get('input_file_id')
+        if input_file_id not in self.files:
+            return None
+        batch = {
+            'id': f'batch_{uuid.uuid4().hex[:24]}',
+            'object': 'batch',
+            'endpoint': request.get('endpoint'),
+            'input_file_id': input_file_id,
+            'completion_window': request.get('completion_window', '24h'),
+            'status': 'in_progress',
+            'output_file_id': None,
+            'error_file_id': None,
+            'created_at': int(time.time()),
+            'request_counts': {'total': 0, 'completed': 0, 'failed': 0}
+        }
+        with self._lock:
+            self.batches[batch['id']] = batch
+        threading.Thread(target=self._run_batch, args=(batch['id'],), daemon=True).start()
+        return batch
+
+    def _run_batch(self, batch_id):
+        time.sleep(self.completion_delay)
+        batch = self.batches[batch_id]
+        outputs, errors = [], []
+        for line in self.files[batch['input_file_id']].decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            result = {'id': f'batch_req_{uuid.uuid4().hex[:12]}', 'custom_id': request.get('custom_id')}
+            try:
+                result['response'] = {'status_code': 200, 'request_id': uuid.uuid4().hex, 'body': self.responder(request.get('body', {}))}
+                result['error'] = None
+                outputs.append(result)
+            except Exception as e:
+                result['response'] = None
+                result['error'] = {'code': 'responder_error', 'message': str(e)}
+                errors.append(result)
+        output_file = self._create_file('\n'.join(json.dumps(r) for r in outputs).encode('utf-8'), 'batch_output') if outputs else None
+        error_file = self._create_file('\n'.join(json.dumps(r) for r in errors).encode('utf-8'), 'batch_output') if errors else None
+        with self._lock:
+            batch['request_counts'] = {'total': len(outputs) + len(errors), 'completed': len(outputs), 'failed': len(errors)}
+            batch['output_file_id'] = output_file['id'] if output_file else None
+            batch['error_file_id'] = error_file['id'] if error_file else None
+            batch['status'] = 'completed'
+            batch['completed_at'] = int(time.time())
+        logging.info("Local batch %s completed: %s request(s), %s failed.", batch_id, len(outputs) + len(errors), len(errors))
+
+    def _handler_class(self):
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status, payload, content_type='application/json'):
+                data = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _not_found(self):
+                self._send(404, {'error': {'message': f'No route for {self.command} {self.path}'}})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if self.path == '/v1/files':
+                    # Multipart upload with a 'file' part and a 'purpose' field
+                    header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode('utf-8')
+                    form = BytesParser(policy=HTTP).parsebytes(header + body)
+                    parts = {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+                             for part in form.iter_parts()}
+                    if 'file' not in parts:
+                        return self._send(400, {'error': {'message': "Missing 'file' part"}})
+                    purpose = (parts.get('purpose') or b'batch').decode('utf-8')
+                    return self._send(200, endpoint._create_file(parts['file'], purpose))
+                if self.path == '/v1/batches':
+                    batch = endpoint._create_batch(json.loads(body or b'{}'))
+                    if batch is None:
+                        return self._send(400, {'error': {'message': 'Unknown input_file_id'}})
+                    return self._send(200, batch)
+                self._not_found()
+
+            def do_GET(self):
+                parts = self.path.strip('/').split('/')
+                if len(parts) == 3 and parts[:2] == ['v1', 'batches'] and parts[2] in endpoint.batches:
+                    with endpoint._lock:
+                        return self._send(200, dict(endpoint.batches[parts[2]]))
+                if len(parts) == 4 and parts[:2] == ['v1', 'files'] and parts[3] == 'content' and parts[2] in endpoint.files:
+                    return self._send(200, endpoint.files[parts[2]], content_type='application/jsonl')
+                self._not_found()
+
+            def log_message(self, format, *args):
+                logging.debug("Local batch endpoint: " + format, *args)
+
+        return Handler
+
+
+def parse_arguments():
+    """
+    Parses command-line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Serve a local stand-in for the OpenAI batch API.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8089, help='Port to listen on')
+    parser.add_argument('--mode', choices=['echo', 'openai'], default='echo',
+                        help='Answer requests with a canned echo (offline) or with synchronous OpenAI calls')
+    parser.add_argument('--completion-delay', type=float, default=0.0, help='Seconds before each batch completes')
+    return parser.parse_args()
+
+
+def main():
+    """
+    Runs the stand-in endpoint until interrupted.
+    """
+    args = parse_arguments()
+    configure_logging()
+    responder = openai_responder if args.mode == 'openai' else echo_responder
+    endpoint = LocalBatchEndpoint(args.host, args.port, responder=responder, completion_delay=args.completion_delay)
+    logging.info("Local batch endpoint listening on %s (%s mode).", endpoint.url, args.mode)
+    endpoint.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
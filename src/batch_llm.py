@@ -0,0 +1,260 @@
+# src/batch_llm.py
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+
+from warehouse import today
+from structured_logging import configure_logging, log_context
+from llm import BatchStore, BatchPending, use_batch
+from main import add_pipeline_arguments, check_environment, run_pipeline
+
+DEFAULT_BATCH_URL = 'https://api.openai.com/v1'
+CHAT_COMPLETIONS_PATH = '/v1/chat/completions'
+# Batch API limit on the requests of one input file
+MAX_BATCH_REQUESTS = 50000
+# Batch statuses after which a batch will not change any more
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+REQUEST_TIMEOUT = 60
+
+# Ticker states of a batch run
+WAITING = 'waiting'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class BatchClient:
+    """
+    Minimal client of an OpenAI-style Files and Batches API (the OpenAI API itself, or the local
+    stand-in of batch_endpoint.py).
+    """
+
+    def __init__(self, base_url=DEFAULT_BATCH_URL, api_key=None):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+
+    def _headers(self):
+        return {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
+
+    def submit(self, requests_by_id, completion_window='24h'):
+        """
+        Uploads the requests (custom_id -> chat completion body) as a JSONL file and creates a batch.
+        Returns the batch id.
+        """
+        import requests
+        lines = [
+            json.dumps({'custom_id': custom_id, 'method': 'POST', 'url': CHAT_COMPLETIONS_PATH, 'body': body})
+            for custom_id, body in requests_by_id.items()
+        ]
+        response = requests.post(f'{self.base_url}/files', headers=self._headers(), data={'purpose': 'batch'},
+                                 files={'file': ('requests.jsonl', '\n'.join(lines).encode('utf-8'))}, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        response = requests.post(f'{self.base_url}/batches', headers=self._headers(), timeout=REQUEST_TIMEOUT, json={
+            'input_file_id': response.json()['id'],
+            'endpoint': CHAT_COMPLETIONS_PATH,
+            'completion_window': completion_window
+        })
+        response.raise_for_status()
+        return response.json()['id']
+
+    def retrieve(self, batch_id):
+        """
+        Returns the batch object.
+        """
+        import requests
+        response = requests.get(f'{self.base_url}/batches/{batch_id}', headers=self._headers(), timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def _file_lines(self, file_id):
+        import requests
+        response = requests.get(f'{self.base_url}/files/{file_id}/content', headers=self._headers(), timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return [json.loads(line) for line in response.text.splitlines() if line.strip()]
+
+    def results(self, batch):
+        """
+        Reads the output and error files of a finished batch. Returns a dictionary mapping each
+        custom_id to (response body, error message); exactly one of the two is None.
+        """
+        results = {}
+        for file_id in (batch.get('output_file_id'), batch.get('error_file_id')):
+            if not file_id:
+                continue
+            for item in self._file_lines(file_id):
+                response = item.get('response') or {}
+                body = response.get('body') or {}
+                if item.get('error'):
+                    results[item['custom_id']] = (None, item['error'].get('message') or str(item['error']))
+                elif response.get('status_code') == 200:
+                    results[item['custom_id']] = (body, None)
+                else:
+                    message = (body.get('error') or {}).get('message', '')
+                    results[item['custom_id']] = (None, f"HTTP {response.get('status_code')}: {message}")
+        return results
+
+
+def run_pass(store, tickers, args):
+    """
+    Runs the pipeline of every unfinished ticker until it completes or needs a model result that
+    is not available yet. On later passes the stages that already ran are served from the run's
+    checkpoints (see llm.checkpoint), so no live data is fetched again.
+    Returns the tickers that are waiting for results.
+    """
+    waiting = []
+    for ticker in tickers:
+        if store.ticker_status(ticker) in (DONE, FAILED):
+            continue
+        try:
+            with use_batch(store):
+                report = run_pipeline(ticker, args)
+        except BatchPending as pending:
+            logging.info("%s is waiting for batch results (first missing: %s).", ticker, pending)
+            store.set_ticker_status(ticker, WAITING)
+            waiting.append(ticker)
+            continue
+        except Exception as e:
+            logging.error("The pipeline of %s failed: %s", ticker, e)
+            report = None
+        store.set_ticker_status(ticker, DONE if report else FAILED)
+    return waiting
+
+
+def submit_queued(store, client, completion_window='24h'):
+    """
+    Submits the queued requests of the run in batches of at most MAX_BATCH_REQUESTS.
+    Returns the number of requests submitted.
+    """
+    queued = store.unsubmitted()
+    custom_ids = list(queued)
+    for start in range(0, len(custom_ids), MAX_BATCH_REQUESTS):
+        chunk = {custom_id: queued[custom_id] for custom_id in custom_ids[start:start + MAX_BATCH_REQUESTS]}
+        batch_id = client.submit(chunk, completion_window=completion_window)
+        store.mark_submitted(chunk, batch_id)
+        logging.info("Submitted batch %s with %s request(s).", batch_id, len(chunk))
+    return len(custom_ids)
+
+
+def wait_for_batches(store, client, poll_seconds=60):
+    """
+    Polls the run's open batches until each has finished and its results are stored.
+    Requests left without a result by a failed, expired or cancelled batch are marked as failed.
+    """
+    open_batches = set(store.open_batches())
+    while open_batches:
+        for batch_id in sorted(open_batches):
+            try:
+                batch = client.retrieve(batch_id)
+                if batch.get('status') not in TERMINAL_STATUSES:
+                    continue
+                results = client.results(batch)
+            except Exception as e:
+                logging.error("An error occurred while polling batch %s: %s", batch_id, e)
+                continue
+            store.store_results(batch_id, results, missing_error=f"batch {batch['status']} without a result")
+            logging.info("Batch %s %s with %s result(s).", batch_id, batch['status'], len(results))
+            open_batches.discard(batch_id)
+        if open_batches:
+            time.sleep(poll_seconds)
+
+
+def run_batch(tickers, args, store, client, max_passes=8, poll_seconds=60, completion_window='24h'):
+    """
+    Two-phase batch run of a watchlist: every pass runs the unfinished pipelines until they need
+    model results, the requests of all tickers are submitted as batches, and the next pass resumes
+    once the results are in. Runs interrupted while waiting resume with the same run id: submitted
+    batches are polled again instead of being resubmitted, and finished tickers are skipped.
+    Returns a dictionary mapping each ticker to its state.
+    """
+    # Prefetched extractions are only indexed when a pipeline finishes, so they would be lost
+    # whenever a pass stops at the selection
+    args.prefetch = 0
+    wait_for_batches(store, client, poll_seconds=poll_seconds)
+    for number in range(1, max_passes + 1):
+        waiting = run_pass(store, tickers, args)
+        logging.info("Pass %s: %s ticker(s) waiting for batch results; requests: %s", number, len(waiting), store.counts())
+        if not waiting:
+            break
+        try:
+            submitted = submit_queued(store, client, completion_window=completion_window)
+        except Exception as e:
+            logging.error("An error occurred while submitting the batch: %s", e)
+            break
+        if not submitted and not store.open_batches():
+            logging.error("Tickers are waiting but no request is queued or open; stopping.")
+            break
+        wait_for_batches(store, client, poll_seconds=poll_seconds)
+    else:
+        logging.warning("Stopped after %s passes with tickers still waiting.", max_passes)
+    return {ticker: store.ticker_status(ticker) or WAITING for ticker in tickers}
+
+
+def write_batch_report(run_id, statuses, counts, output_dir='outputs'):
+    """
+    Saves the ticker states and request counts of a batch run as JSON and returns its path.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f'batch_llm_{run_id}.json')
+    with open(path, 'w') as f:
+        json.dump({'run_id': run_id, 'tickers': statuses, 'requests': counts}, f, indent=4)
+    return path
+
+
+def parse_arguments():
+    """
+    Parses command-line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Generate reports for a watchlist with batched model calls.')
+    parser.add_argument('tickers', nargs='+', help='Stock ticker symbols')
+    parser.add_argument('--run-id', type=str, default=None,
+                        help="Run identifier (default: nightly-<today>); reuse it to resume an interrupted run")
+    parser.add_argument('--endpoint', type=str, default=None,
+                        help=f'Base URL of the batch API (default: $OPENAI_BATCH_URL or {DEFAULT_BATCH_URL})')
+    parser.add_argument('--local-endpoint', action='store_true',
+                        help='Start the offline stand-in endpoint of batch_endpoint.py (echo replies) and use it')
+    parser.add_argument('--poll-seconds', type=int, default=60, help='Seconds between batch status checks')
+    parser.add_argument('--max-passes', type=int, default=8, help='Most pipeline passes before giving up on waiting tickers')
+    parser.add_argument('--completion-window', type=str, default='24h', help='Completion window requested for each batch')
+    add_pipeline_arguments(parser)
+    return parser.parse_args()
+
+
+def main():
+    """
+    Entry point of the batch model-call runner.
+    """
+    args = parse_arguments()
+    run_id = args.run_id or f'nightly-{today()}'
+    configure_logging(run_id=run_id)
+    if not check_environment():
+        sys.exit(1)
+
+    local_endpoint = None
+    if args.local_endpoint:
+        from batch_endpoint import LocalBatchEndpoint
+        local_endpoint = LocalBatchEndpoint().start()
+        base_url = local_endpoint.url
+        logging.info("Using the local batch endpoint at %s.", base_url)
+    else:
+        base_url = args.endpoint or os.getenv('OPENAI_BATCH_URL', DEFAULT_BATCH_URL)
+    client = BatchClient(base_url, api_key=os.getenv('OPENAI_API_KEY'))
+    store = BatchStore(run_id, db_path=args.db_path)
+
+    try:
+        with log_context(run_id=run_id):
+            statuses = run_batch([ticker.upper() for ticker in args.tickers], args, store, client, max_passes=args.max_passes,
+                                 poll_seconds=args.poll_seconds, completion_window=args.completion_window)
+    finally:
+        if local_endpoint:
+            local_endpoint.stop()
+    path = write_batch_report(run_id, statuses, store.counts())
+    logging.info("Batch run %s: %s; report saved to %s", run_id, statuses, path)
+    if any(status != DONE for status in statuses.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
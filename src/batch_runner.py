@@ -0,0 +1,212 @@
+# src/batch_runner.py
+
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+from work_queue import open_queue, DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS, PENDING, LEASED, DONE, FAILED
+from structured_logging import configure_logging, log_context
+from main import add_pipeline_arguments, check_environment, run_pipeline
+
+# Seconds an idle worker waits before polling again while other workers still hold leases
+IDLE_POLL_SECONDS = 10
+# Options that describe the node rather than the run, so they are not sent with the jobs
+NODE_OPTIONS = ('db_path', 'memory_budget')
+
+
+def pipeline_options(args):
+    """
+    Returns the report options of a run (see main.add_pipeline_arguments) to send with its jobs.
+    """
+    defaults = vars(add_pipeline_arguments(argparse.ArgumentParser()).parse_args([]))
+    return {name: getattr(args, name) for name in defaults if name not in NODE_OPTIONS}
+
+
+def job_arguments(job, args):
+    """
+    Builds the pipeline arguments of a job: the run's options on top of the defaults, with this
+    node's options.
+    """
+    options = vars(add_pipeline_arguments(argparse.ArgumentParser()).parse_args([]))
+    options.update(job.options)
+    options.update({name: getattr(args, name) for name in NODE_OPTIONS})
+    return argparse.Namespace(**options)
+
+
+def enqueue(queue, run_id, tickers, options, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Producer: enqueues one job per ticker. Tickers already enqueued in the run are skipped, so the
+    producer can safely be run again.
+    """
+    added = sum(queue.enqueue(run_id, ticker, options, max_attempts=max_attempts) for ticker in tickers)
+    logging.info("Run %s: enqueued %s job(s), %s already queued.", run_id, added, len(tickers) - added)
+    return added
+
+
+def process_job(queue, job, args, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    Runs the pipeline for a claimed job while a heartbeat thread renews its lease, then acks or fails it.
+    The pipeline's stages upsert into the warehouse, so running a job again after a lost lease is harmless.
+    Returns True if the job was acked.
+    """
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(lease_seconds / 3):
+            if not queue.renew(job, lease_seconds):
+                logging.warning("Lost the lease on %s; another worker may run it again.", job.job_id)
+                return
+
+    heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+    started_at = time.monotonic()
+    error = None
+    report = None
+    try:
+        report = run_pipeline(job.ticker, job_arguments(job, args))
+    except Exception as e:
+        logging.exception("An error occurred while processing %s: %s", job.job_id, e)
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        stop.set()
+        heartbeat_thread.join()
+    duration = time.monotonic() - started_at
+
+    if report is None:
+        released = queue.fail(job, error or 'the pipeline did not produce a report')
+        logging.error("Attempt %s of %s failed after %.1fs (released: %s).", job.attempts, job.job_id, duration, released)
+        return False
+    result = {'worker': job.lease_owner, 'seconds': round(duration, 3), 'report_chars': len(report)}
+    if not queue.ack(job, result):
+        logging.warning("Finished %s after its lease was lost; the result was not recorded.", job.job_id)
+        return False
+    logging.info("Finished %s in %.1fs.", job.job_id, duration)
+    return True
+
+
+def run_worker(queue, args, worker_id=None, lease_seconds=DEFAULT_LEASE_SECONDS, max_jobs=0):
+    """
+    Worker: claims and processes jobs until the queue has no pending or leased jobs left (or max_jobs
+    jobs were processed). Start one worker process per core or node; they coordinate only through the queue.
+    Returns the number of jobs acked.
+    """
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    processed = 0
+    acked = 0
+    while not max_jobs or processed < max_jobs:
+        job = queue.claim(worker_id, lease_seconds=lease_seconds)
+        if job is None:
+            if not queue.has_open_jobs():
+                break
+            # Other workers hold the remaining leases; wait in case one of them expires
+            time.sleep(IDLE_POLL_SECONDS)
+            continue
+        logging.info("Worker %s claimed %s (attempt %s).", worker_id, job.job_id, job.attempts)
+        with log_context(run_id=job.run_id):
+            acked += process_job(queue, job, args, lease_seconds=lease_seconds)
+        processed += 1
+    logging.info("Worker %s stopped after %s job(s), %s done.", worker_id, processed, acked)
+    return acked
+
+
+def build_run_report(queue, run_id):
+    """
+    Aggregates the jobs of a run: counts per status, attempts and retries, durations, per-worker
+    totals and the errors of failed jobs.
+    """
+    jobs = queue.run_jobs(run_id)
+    durations = [job['result']['seconds'] for job in jobs if job['result']]
+    workers = {}
+    for job in jobs:
+        if job['result']:
+            worker = job['result']['worker']
+            workers[worker] = workers.get(worker, 0) + 1
+    enqueued = [job['enqueued_at'] for job in jobs if job['enqueued_at']]
+    finished = [job['finished_at'] for job in jobs if job['finished_at']]
+    return {
+        'run_id': run_id,
+        'jobs': len(jobs),
+        'status': {status: sum(job['status'] == status for job in jobs) for status in (PENDING, LEASED, DONE, FAILED)},
+        'attempts': sum(job['attempts'] for job in jobs),
+        'retried_jobs': sum(job['attempts'] > 1 for job in jobs),
+        'job_seconds_total': round(sum(durations), 3),
+        'job_seconds_mean': round(sum(durations) / len(durations), 3) if durations else None,
+        'job_seconds_max': max(durations) if durations else None,
+        'wall_seconds': round(max(finished) - min(enqueued), 3) if finished and enqueued else None,
+        'jobs_per_worker': workers,
+        'failures': {job['ticker']: job['last_error'] for job in jobs if job['status'] == FAILED},
+        'tickers': {job['ticker']: job['status'] for job in jobs}
+    }
+
+
+def write_run_report(report, output_dir='outputs'):
+    """
+    Saves a run report as JSON and returns its path.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"batch_{report['run_id']}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=4)
+    return path
+
+
+def parse_arguments():
+    """
+    Parses command-line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Generate reports for a watchlist through a shared work queue.')
+    parser.add_argument('--queue', type=str, default=None,
+                        help='Queue URL: sqlite:///path, redis://host:port/db (default: the warehouse file)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = subparsers.add_parser('enqueue', help='Enqueue one job per ticker')
+    enqueue_parser.add_argument('tickers', nargs='+', help='Stock ticker symbols')
+    enqueue_parser.add_argument('--run-id', type=str, default=None, help='Run identifier (default: the current time); reuse it to retry a run idempotently')
+    enqueue_parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS, help='Attempts per job before it is marked as failed')
+    add_pipeline_arguments(enqueue_parser)
+
+    worker_parser = subparsers.add_parser('worker', help='Claim and process jobs until the queue is drained')
+    worker_parser.add_argument('--worker-id', type=str, default=None, help='Worker identifier (default: host:pid)')
+    worker_parser.add_argument('--lease-seconds', type=int, default=DEFAULT_LEASE_SECONDS, help='Lease length; a job whose worker stops renewing it is handed to another worker')
+    worker_parser.add_argument('--max-jobs', type=int, default=0, help='Stop after this many jobs (0 runs until the queue is drained)')
+    worker_parser.add_argument('--db-path', type=str, default=None, help="Path to this node's SQLite research warehouse")
+    worker_parser.add_argument('--memory-budget', type=int, default=0, help='RSS in MB above which a job spills article bodies and price arrays to disk (0 disables)')
+
+    report_parser = subparsers.add_parser('report', help='Aggregate the results of a run')
+    report_parser.add_argument('run_id', type=str, help='Run identifier')
+    return parser.parse_args()
+
+
+def main():
+    """
+    Entry point of the batch runner.
+    """
+    args = parse_arguments()
+    configure_logging()
+    queue = open_queue(args.queue)
+
+    if args.command == 'enqueue':
+        run_id = args.run_id or datetime.now().strftime('%Y%m%d-%H%M%S')
+        enqueue(queue, run_id, [ticker.upper() for ticker in args.tickers], pipeline_options(args), max_attempts=args.max_attempts)
+        print(run_id)
+    elif args.command == 'worker':
+        if not check_environment():
+            sys.exit(1)
+        run_worker(queue, args, worker_id=args.worker_id, lease_seconds=args.lease_seconds, max_jobs=args.max_jobs)
+    elif args.command == 'report':
+        report = build_run_report(queue, args.run_id)
+        if not report['jobs']:
+            logging.error("Run %s has no jobs.", args.run_id)
+            sys.exit(1)
+        path = write_run_report(report)
+        logging.info("Run %s: %s in %ss; report saved to %s", args.run_id, report['status'], report['wall_seconds'], path)
+
+
+if __name__ == '__main__':
+    main()
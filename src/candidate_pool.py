@@ -0,0 +1,93 @@
+# src/candidate_pool.py
+
+import heapq
+import logging
+
+from utils import get_domain
+from records import Category, SearchHit
+
+
+class CandidatePool:
+    """
+    Replacement candidates of a run: one priority queue of SearchHit records per category, ordered
+    by reciprocal rank fusion score (then search rank), built once from the merged SERPER results.
+    Links that were chosen, fetched or failed and domains that were blacklisted are recorded as
+    they happen; stale entries are dropped lazily when they reach the front of a queue, so taking
+    the next-best candidates needs neither a rescan nor a model call.
+    """
+
+    def __init__(self, serper_data, blocked_domains=None):
+        self._queues = {}
+        for category, data in serper_data.items():
+            category = Category.parse(category)
+            queue = self._queues.setdefault(category, [])
+            for rank, news in enumerate(data.get('organic', [])):
+                if news.get('link'):
+                    hit = SearchHit.from_result(news, category)
+                    queue.append((-hit.rrf_score, rank, hit.link, hit))
+            heapq.heapify(queue)
+        self._used_links = set()
+        self._blocked_domains = set(blocked_domains or ())
+        self.taken = 0
+        self.dropped = 0
+
+    def discard(self, links):
+        """
+        Removes links (selected, fetched or known to fail) from the pool.
+        """
+        self._used_links.update(links)
+
+    def block_domain(self, domain):
+        """
+        Removes every remaining candidate from a blacklisted domain.
+        """
+        if domain:
+            self._blocked_domains.add(domain)
+
+    def _front(self, category):
+        """
+        Drops stale entries from the front of a category's queue and returns its best candidate, or None.
+        """
+        queue = self._queues.get(category)
+        while queue:
+            hit = queue[0][3]
+            if hit.link not in self._used_links and get_domain(hit.link) not in self._blocked_domains:
+                return hit
+            heapq.heappop(queue)
+            self.dropped += 1
+        return None
+
+    def _pop(self, category):
+        hit = heapq.heappop(self._queues[category])[3]
+        self._used_links.add(hit.link)
+        self.taken += 1
+        return hit
+
+    def remaining(self, categories=None):
+        """
+        Returns the number of queued entries (including stale ones not dropped yet) in the given categories.
+        """
+        return sum(len(self._queues.get(category, ())) for category in (categories or self._queues))
+
+    def take(self, count, categories=None):
+        """
+        Takes up to count of the best candidates from the given categories (default: all). Every
+        category first gives its best candidate, so each one is covered when it has any left; the
+        remaining slots go to the best candidates overall. Taken links are not returned again.
+        """
+        categories = [Category.parse(category) for category in (categories or self._queues)]
+        taken = []
+        for category in categories:
+            if len(taken) < count and self._front(category) is not None:
+                taken.append(self._pop(category))
+        while len(taken) < count:
+            fronts = [(self._front(category), category) for category in categories]
+            fronts = [(hit, category) for hit, category in fronts if hit is not None]
+            if not fronts:
+                break
+            _, category = max(fronts, key=lambda front: front[0].rrf_score)
+            taken.append(self._pop(category))
+        if taken:
+            logging.info("Took %s replacement candidate(s) from the pool: %s",
+                         len(taken), ', '.join(f"{hit.category} ({hit.rrf_score:.4f})" for hit in taken))
+        return taken
@@ -0,0 +1,82 @@
+# src/check_import_time.py
+
+import os
+import sys
+import argparse
+import subprocess
+
+# Modules that must not be imported before argument parsing has finished
+HEAVY_MODULES = ('openai', 'yfinance', 'pandas', 'numpy', 'matplotlib', 'reportlab', 'requests', 'jina', 'dotenv')
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+def _run_importtime(command_args):
+    """
+    Runs the interpreter under `-X importtime` and returns a dictionary mapping each top-level
+    module name to its cumulative import time in microseconds.
+    """
+    command = [sys.executable, '-X', 'importtime', *command_args]
+    result = subprocess.run(command, capture_output=True, text=True)
+
+    top_level_modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, _, fields = line.partition('import time:')
+        parts = fields.split('|')
+        if len(parts) != 3:
+            continue
+        name = parts[2].rstrip()
+        # Nested imports are indented below the module that triggered them
+        if name.startswith('  '):
+            continue
+        top_level_modules[name.strip()] = int(parts[1].strip())
+    return top_level_modules
+
+
+def measure_import_time(script_args=('--help',)):
+    """
+    Measures the imports main.py adds on top of a bare interpreter start-up.
+    Returns a tuple (total_microseconds, top_level_modules) where top_level_modules maps each
+    top-level module name to its cumulative import time in microseconds.
+    """
+    baseline = _run_importtime(['-c', 'pass'])
+    modules = _run_importtime([MAIN_SCRIPT, *script_args])
+    added = {name: cumulative for name, cumulative in modules.items() if name not in baseline}
+    return sum(added.values()), added
+
+
+def parse_arguments():
+    """
+    Parses command-line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Check that main.py starts up without loading heavy dependencies.')
+    parser.add_argument('--budget-ms', type=float, default=50.0, help='Maximum import time main.py may add to interpreter start-up, in milliseconds')
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest top-level imports to display')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    total_us, modules = measure_import_time()
+
+    print(f"Import time added by 'main.py --help': {total_us / 1000:.1f} ms")
+    for name, cumulative_us in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    heavy_loaded = sorted(
+        name for name in modules
+        if name.split('.')[0] in HEAVY_MODULES
+    )
+    if heavy_loaded:
+        failures.append(f"Heavy modules imported at start-up: {', '.join(heavy_loaded)}")
+    if total_us / 1000 > args.budget_ms:
+        failures.append(f"Import time {total_us / 1000:.1f} ms exceeds the budget of {args.budget_ms:.1f} ms")
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print("OK: start-up import time is within budget.")
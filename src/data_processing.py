@@ -6,7 +6,26 @@ import openai
 import os
 from dotenv import load_dotenv
 import logging
-import re
+from domain_health import get_blocked_domains
+from utils import get_domain
+from records import Category, REQUIRED_CATEGORIES, SearchHit, PriceBars
+from deadline import network_timeout
+from llm import structured_completion
+
+SELECTION_INSTRUCTIONS = """
+You select news articles for a stock analysis report.
+Given a stock ticker, a number of articles to select and a numbered list of articles (title and snippet),
+select that many articles most relevant to the stock's performance, most relevant first.
+""".strip()
+SELECTION_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'selected': {'type': 'array', 'items': {'type': 'integer'}}
+    },
+    'required': ['selected'],
+    'additionalProperties': False
+}
+
 
 def load_json_file(filepath):
     """
@@ -15,10 +34,10 @@ def load_json_file(filepath):
     try:
         with open(filepath, 'r') as f:
             data = json.load(f)
-        logging.info(f"Loaded data from {filepath}.")
+        logging.info("Loaded data from %s.", filepath)
         return data
     except Exception as e:
-        logging.error(f"An error occurred while loading {filepath}: {e}")
+        logging.error("An error occurred while loading %s: %s", filepath, e)
         return None
 
 def validate_data(data, expected_keys):
@@ -29,33 +48,24 @@ def validate_data(data, expected_keys):
         return False
     missing_keys = [key for key in expected_keys if key not in data]
     if missing_keys:
-        logging.error(f"Data is missing keys: {missing_keys}")
+        logging.error("Data is missing keys: %s", missing_keys)
         return False
     return True
 
 def clean_stock_data(stock_data):
-    # Ensure 'history' is a list of dictionaries
+    """
+    Converts the stock history (a list of bar dictionaries) to array-backed PriceBars with
+    normalized dates, ordered by date, and forward-fills missing values.
+    """
     history = stock_data.get('history', [])
-    if not isinstance(history, list):
+    if not isinstance(history, (list, PriceBars)):
         logging.error("Invalid format for stock history data.")
         return None
 
-    # Convert date strings to datetime objects, handle missing values, etc.
-    df = pd.DataFrame(history)
-    if 'Date' in df.columns:
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        # Convert 'Date' column to string to avoid serialization issues
-        df['Date'] = df['Date'].dt.strftime('%Y-%m-%d')
-    else:
+    if history and not isinstance(history, PriceBars) and 'Date' not in history[0]:
         logging.warning("Date column not found in stock history data. Skipping date processing.")
 
-    # Forward fill missing values
-    df.ffill(inplace=True)
-
-    # Convert back to list of dictionaries
-    clean_history = df.to_dict(orient='records')
-    stock_data['history'] = clean_history
-
+    stock_data['history'] = PriceBars.from_records(history).ffill()
     return stock_data
 
 def clean_serper_data(serper_data):
@@ -79,17 +89,23 @@ def combine_data(stock_data, serper_data_dict):
     """
     Combines stock data and a dictionary of SERPER data dictionaries into a single data structure.
     """
+    history = stock_data.get('history', [])
     combined_data = {
         'stock_info': stock_data.get('info', {}),
-        'stock_history': stock_data.get('history', []),
+        'stock_history': history.to_records() if isinstance(history, PriceBars) else history,
         'serper_data': serper_data_dict  # Now serper_data_dict is organized by category
     }
 
     return combined_data
 
-def select_relevant_news(ticker, combined_data, top_n=5):
+def select_relevant_news(ticker, combined_data, top_n=5, exclude_links=None, blocked_domains=None, db_path=None):
     """
     Uses GPT to select the top N relevant news articles, ensuring at least one article from each category.
+    Returns a list of SearchHit records.
+    The model answers with article numbers as JSON (SELECTION_SCHEMA); a reply that does not parse falls
+    back to the best-ranked remaining articles rather than another call.
+    Articles from domains whose circuit breaker is open in the warehouse at db_path (or from blocked_domains,
+    when given), and links in exclude_links (e.g. prefetches that already failed), are not considered.
     """
     # Load environment variables
     load_dotenv()
@@ -100,36 +116,40 @@ def select_relevant_news(ticker, combined_data, top_n=5):
 
     openai.api_key = OPENAI_API_KEY
 
+    if blocked_domains is None:
+        blocked_domains = get_blocked_domains(db_path)
+    exclude_links = exclude_links or set()
     articles = []
     category_articles = {}
     for category, serper_data in combined_data['serper_data'].items():
         news_list = serper_data.get('organic', [])
+        category = Category.parse(category)
         category_articles[category] = []
         for news in news_list:
-            article = {
-                'title': news.get('title', ''),
-                'snippet': news.get('snippet', ''),
-                'link': news.get('link', ''),
-                'category': category
-            }
+            if get_domain(news.get('link', '')) in blocked_domains:
+                logging.info("Skipping candidate from blocked domain: %s", news.get('link', ''))
+                continue
+            if news.get('link', '') in exclude_links:
+                continue
+            article = SearchHit.from_result(news, category)
             articles.append(article)
             category_articles[category].append(article)
 
     # Ensure at least one article from each category
     selected_articles = []
     remaining_slots = top_n
-    for category in ['STOCK CONTEXT', 'GEOPOLITICS CONTEXT', 'SECTOR CONTEXT']:
+    for category in REQUIRED_CATEGORIES:
         category_article_list = category_articles.get(category, [])
         if category_article_list:
             selected_articles.append(category_article_list[0])
             remaining_slots -= 1
         else:
-            logging.warning(f"No articles found in category {category}")
+            logging.warning("No articles found in category %s", category)
 
     if remaining_slots > 0:
         # Remove already selected articles from the articles list
-        selected_links = set([article['link'] for article in selected_articles])
-        remaining_articles = [article for article in articles if article['link'] not in selected_links]
+        selected_links = set([article.link for article in selected_articles])
+        remaining_articles = [article for article in articles if article.link not in selected_links]
         # Limit the number of articles to prevent token overflow
         max_articles_in_prompt = 10  # Adjust based on token considerations
         remaining_articles = remaining_articles[:max_articles_in_prompt]
@@ -137,57 +157,43 @@ def select_relevant_news(ticker, combined_data, top_n=5):
         # Prepare articles for GPT analysis
         articles_text = ""
         for idx, article in enumerate(remaining_articles):
-            articles_text += f"Article {idx+1}:\nTitle: {article['title']}\nSnippet: {article['snippet']}\n\n"
+            articles_text += f"Article {idx+1}:\nTitle: {article.title}\nSnippet: {article.snippet}\n\n"
 
-        prompt = f"""
-Based on the following articles, select the top {remaining_slots} most relevant to {ticker}'s stock performance.
-
-Articles:
-{articles_text}
-
-Please provide a list of the article numbers that are most relevant, formatted as a comma-separated list (e.g., "Selected articles: 1, 2, 3").
-"""
+        content = f"Ticker: {ticker}\nNumber of articles to select: {remaining_slots}\n\nArticles:\n{articles_text}"
 
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+            value, _ = structured_completion(
+                f'selection:{ticker}',
+                SELECTION_INSTRUCTIONS,
+                content,
+                SELECTION_SCHEMA,
+                'article_selection',
                 max_tokens=150,
                 n=1,
                 stop=None,
                 temperature=0.5,
+                request_timeout=network_timeout(),
             )
+        except openai.error.InvalidRequestError as e:
+            logging.error("OpenAI API request exceeded token limit: %s", e)
+            return []
+        except Exception as e:
+            logging.error("An error occurred during GPT analysis: %s", e)
+            return []
 
-            gpt_reply = response['choices'][0]['message']['content'].strip()
-            # Extract article numbers from GPT response
-            match = re.search(r'Selected articles:\s*(.*)', gpt_reply, re.IGNORECASE)
-            if match:
-                article_numbers = re.findall(r'\d+', match.group(1))
-                selected_indices = [int(num)-1 for num in article_numbers if num.isdigit()]
-            else:
-                logging.error("Could not parse selected articles from GPT response.")
-                selected_indices = []
-
+        if value is None:
+            # Unusable reply: take the best-ranked remaining articles instead of asking again
+            gpt_selected_articles = sorted(remaining_articles, key=lambda article: -article.rrf_score)
+        else:
             # Remove duplicates and ensure valid indices
-            selected_indices = list(set(selected_indices))
+            selected_indices = list(dict.fromkeys(number - 1 for number in value['selected']))
             selected_indices = [idx for idx in selected_indices if 0 <= idx < len(remaining_articles)]
-
-            # Get the selected articles
             gpt_selected_articles = [remaining_articles[idx] for idx in selected_indices]
 
-            if not gpt_selected_articles:
-                logging.warning("No valid articles selected by GPT.")
-            else:
-                selected_articles.extend(gpt_selected_articles[:remaining_slots])  # Ensure we don't exceed remaining_slots
-
-        except openai.error.InvalidRequestError as e:
-            logging.error(f"OpenAI API request exceeded token limit: {e}")
-            return []
-        except Exception as e:
-            logging.error(f"An error occurred during GPT analysis: {e}")
-            return []
+        if not gpt_selected_articles:
+            logging.warning("No valid articles selected by GPT.")
+        else:
+            selected_articles.extend(gpt_selected_articles[:remaining_slots])  # Ensure we don't exceed remaining_slots
 
     # Limit the total number of articles to top_n
     return selected_articles[:top_n]
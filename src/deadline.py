@@ -0,0 +1,155 @@
+# src/deadline.py
+
+import time
+import logging
+import contextvars
+from contextlib import contextmanager
+
+# Share of a run's time reserved for each stage, in pipeline order. A stage may use all the time
+# that is not reserved for the stages after it, so time saved early is available later.
+STAGE_SHARES = {
+    'stock_data': 0.08,
+    'complementary_tickers': 0.04,
+    'theme_queries': 0.04,
+    'serper': 0.08,
+    'processing': 0.02,
+    'peer_comparison': 0.06,
+    'selection': 0.06,
+    'extraction': 0.25,
+    'replacement': 0.10,
+    'report': 0.22,
+    'render': 0.05
+}
+# Shortest timeout given to a network call, even when its stage is out of time
+MIN_NETWORK_TIMEOUT = 2.0
+
+_current = contextvars.ContextVar('deadline', default=None)
+
+
+class Deadline:
+    """
+    Time budget of a report run. enter_stage gives each stage the time left after reserving the
+    shares of the stages that follow it; network calls take their timeouts from the current stage.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + seconds
+        self.stage = None
+        self.stage_expires_at = self.expires_at
+        self.stages = []
+        self.degradations = []
+        self._stage_started_at = None
+
+    def _close_stage(self):
+        if self.stage is None:
+            return
+        stage = self.stages[-1]
+        stage['used_seconds'] = round(time.monotonic() - self._stage_started_at, 3)
+        stage['overran'] = time.monotonic() > self.stage_expires_at
+
+    def enter_stage(self, name):
+        """
+        Starts the named stage with the time not reserved for later stages.
+        """
+        self._close_stage()
+        now = time.monotonic()
+        names = list(STAGE_SHARES)
+        later = names[names.index(name) + 1:] if name in STAGE_SHARES else []
+        reserved = sum(STAGE_SHARES[stage] for stage in later) * self.seconds
+        self.stage = name
+        self._stage_started_at = now
+        self.stage_expires_at = max(now, self.expires_at - reserved)
+        self.stages.append({'stage': name, 'budget_seconds': round(self.stage_expires_at - now, 3)})
+
+    def remaining(self):
+        """
+        Seconds left in the whole run.
+        """
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def stage_remaining(self):
+        """
+        Seconds left in the current stage.
+        """
+        return max(self.stage_expires_at - time.monotonic(), 0.0)
+
+    def expired(self):
+        """
+        Returns True once the current stage is out of time.
+        """
+        return time.monotonic() >= self.stage_expires_at
+
+    def schedule_ratio(self):
+        """
+        Time left in the run divided by the time the current and later stages were allotted:
+        1.0 when the run is on schedule or ahead of it, lower when earlier stages ran late.
+        """
+        names = list(STAGE_SHARES)
+        upcoming = names[names.index(self.stage):] if self.stage in STAGE_SHARES else names
+        scheduled = sum(STAGE_SHARES[stage] for stage in upcoming) * self.seconds
+        return min(self.remaining() / scheduled, 1.0) if scheduled else 1.0
+
+    def timeout(self, default=None):
+        """
+        Returns the timeout for a network call: default (None meaning no limit) capped by the time
+        left in the current stage, and never below MIN_NETWORK_TIMEOUT.
+        """
+        remaining = max(self.stage_remaining(), MIN_NETWORK_TIMEOUT)
+        return remaining if default is None else min(default, remaining)
+
+    def degrade(self, message):
+        """
+        Records (and logs) a degradation applied to stay within the deadline.
+        """
+        self.degradations.append({'stage': self.stage, 'action': message})
+        logging.warning("Deadline: %s", message)
+
+    def summary(self):
+        """
+        Returns the budget, use and degradations of every stage as a JSON-serializable dictionary.
+        """
+        self._close_stage()
+        return {
+            'deadline_seconds': self.seconds,
+            'elapsed_seconds': round(time.monotonic() - self.started_at, 3),
+            'stages': self.stages,
+            'degradations': self.degradations
+        }
+
+
+@contextmanager
+def use_deadline(deadline):
+    """
+    Makes deadline the current deadline (None for no deadline) of the calls inside the block,
+    including tasks submitted to a structured_logging.ContextThreadPoolExecutor.
+    """
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def current_deadline():
+    """
+    Returns the current Deadline, or None if the run has no deadline.
+    """
+    return _current.get()
+
+
+def network_timeout(default=None):
+    """
+    Returns the timeout for a network call under the current deadline, or default if there is none.
+    """
+    deadline = _current.get()
+    return default if deadline is None else deadline.timeout(default)
+
+
+def out_of_time():
+    """
+    Returns True if the current stage of the current deadline is out of time (False without a deadline).
+    """
+    deadline = _current.get()
+    return deadline is not None and deadline.expired()
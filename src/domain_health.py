@@ -0,0 +1,227 @@
+# src/domain_health.py
+
+import time
+import sqlite3
+import logging
+from contextlib import contextmanager
+
+from warehouse import connect as warehouse_connect, get_db_path
+
+# Circuit breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Consecutive failed articles before a domain's circuit opens
+FAILURE_THRESHOLD = 3
+# How long an open circuit blocks a domain before a single probe request is allowed
+OPEN_COOLDOWN_SECONDS = 6 * 60 * 60
+# A half-open probe that has not reported back within this window may be retried by another run
+PROBE_TIMEOUT_SECONDS = 5 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS domain_health (
+    domain TEXT PRIMARY KEY,
+    successes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    consecutive_failures INTEGER NOT NULL DEFAULT 0,
+    total_latency REAL NOT NULL DEFAULT 0,
+    last_latency REAL,
+    total_content_length INTEGER NOT NULL DEFAULT 0,
+    last_content_length INTEGER,
+    last_success_at REAL,
+    last_failure_at REAL,
+    last_failure_reason TEXT,
+    state TEXT NOT NULL DEFAULT 'closed',
+    opened_at REAL,
+    probe_started_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_domain_health_state ON domain_health (state);
+"""
+
+_initialized_paths = set()
+
+
+@contextmanager
+def connect(db_path=None):
+    """
+    Opens a warehouse connection and makes sure the domain health table exists.
+    """
+    path = db_path or get_db_path()
+    with warehouse_connect(path) as conn:
+        if path not in _initialized_paths:
+            conn.executescript(SCHEMA)
+            _initialized_paths.add(path)
+        yield conn
+
+
+def _is_blocked(row, now):
+    """
+    Returns True if the circuit described by a domain_health row currently rejects requests.
+    """
+    if row is None or row['state'] == CLOSED:
+        return False
+    if row['state'] == OPEN:
+        return now - (row['opened_at'] or 0) < OPEN_COOLDOWN_SECONDS
+    # Half-open: blocked while a probe is in flight
+    return now - (row['probe_started_at'] or 0) < PROBE_TIMEOUT_SECONDS
+
+
+def allow_request(domain, db_path=None):
+    """
+    Consults the circuit breaker before fetching from a domain.
+    Closed circuits always allow the request. An open circuit whose cooldown has elapsed moves to
+    half-open and allows exactly one probe request; every other caller is rejected until the probe
+    reports its result through record_success or record_failure.
+    """
+    if not domain:
+        return True
+    now = time.time()
+    try:
+        with connect(db_path) as conn:
+            row = conn.execute("SELECT * FROM domain_health WHERE domain = ?", (domain,)).fetchone()
+            if not _is_blocked(row, now):
+                if row is None or row['state'] == CLOSED:
+                    return True
+                # Claim the probe atomically so concurrent runs do not all hit the domain
+                claimed = conn.execute(
+                    """
+                    UPDATE domain_health SET state = ?, probe_started_at = ?
+                    WHERE domain = ? AND state = ? AND COALESCE(probe_started_at, 0) = ?
+                    """,
+                    (HALF_OPEN, now, domain, row['state'], row['probe_started_at'] or 0)
+                ).rowcount
+                if claimed:
+                    logging.info("Circuit for %s is half-open; allowing a probe request.", domain)
+                    return True
+            return False
+    except sqlite3.Error as e:
+        logging.error("An error occurred while checking the circuit for %s: %s", domain, e)
+        return True
+
+
+def get_blocked_domains(db_path=None):
+    """
+    Returns the set of domains whose circuit currently rejects requests.
+    Used to drop candidates before they are sent for selection.
+    """
+    now = time.time()
+    try:
+        with connect(db_path) as conn:
+            rows = conn.execute(
+                "SELECT domain, state, opened_at, probe_started_at FROM domain_health WHERE state != ?",
+                (CLOSED,)
+            ).fetchall()
+        return {row['domain'] for row in rows if _is_blocked(row, now)}
+    except sqlite3.Error as e:
+        logging.error("An error occurred while loading blocked domains: %s", e)
+        return set()
+
+
+def record_success(domain, latency, content_length, db_path=None):
+    """
+    Records a successful extraction and closes the domain's circuit.
+    """
+    if not domain:
+        return
+    now = time.time()
+    try:
+        with connect(db_path) as conn:
+            conn.execute(
+                """
+                INSERT INTO domain_health
+                    (domain, successes, total_latency, last_latency, total_content_length,
+                     last_content_length, last_success_at, state)
+                VALUES (?, 1, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (domain) DO UPDATE SET
+                    successes = successes + 1,
+                    consecutive_failures = 0,
+                    total_latency = total_latency + excluded.last_latency,
+                    last_latency = excluded.last_latency,
+                    total_content_length = total_content_length + excluded.last_content_length,
+                    last_content_length = excluded.last_content_length,
+                    last_success_at = excluded.last_success_at,
+                    state = excluded.state,
+                    opened_at = NULL,
+                    probe_started_at = NULL
+                """,
+                (domain, latency, latency, content_length, content_length, now, CLOSED)
+            )
+    except sqlite3.Error as e:
+        logging.error("An error occurred while recording a success for %s: %s", domain, e)
+
+
+def record_failure(domain, latency, reason='', db_path=None):
+    """
+    Records a failed extraction. The circuit opens after FAILURE_THRESHOLD consecutive failures,
+    or immediately when a half-open probe fails.
+    """
+    if not domain:
+        return
+    now = time.time()
+    try:
+        with connect(db_path) as conn:
+            conn.execute(
+                """
+                INSERT INTO domain_health
+                    (domain, failures, consecutive_failures, total_latency, last_latency,
+                     last_failure_at, last_failure_reason)
+                VALUES (?, 1, 1, ?, ?, ?, ?)
+                ON CONFLICT (domain) DO UPDATE SET
+                    failures = failures + 1,
+                    consecutive_failures = consecutive_failures + 1,
+                    total_latency = total_latency + excluded.last_latency,
+                    last_latency = excluded.last_latency,
+                    last_failure_at = excluded.last_failure_at,
+                    last_failure_reason = excluded.last_failure_reason
+                """,
+                (domain, latency, latency, now, reason[:500])
+            )
+            row = conn.execute(
+                "SELECT state, consecutive_failures FROM domain_health WHERE domain = ?", (domain,)
+            ).fetchone()
+            if row['state'] == HALF_OPEN or (row['state'] == CLOSED and row['consecutive_failures'] >= FAILURE_THRESHOLD):
+                conn.execute(
+                    "UPDATE domain_health SET state = ?, opened_at = ?, probe_started_at = NULL WHERE domain = ?",
+                    (OPEN, now, domain)
+                )
+                logging.info("Circuit opened for %s after %s consecutive failure(s).", domain, row['consecutive_failures'])
+    except sqlite3.Error as e:
+        logging.error("An error occurred while recording a failure for %s: %s", domain, e)
+
+
+def get_domain_health(domain=None, db_path=None):
+    """
+    Returns health statistics (success rate, average latency and content length, circuit state)
+    for one domain, or for every known domain if none is given.
+    """
+    sql = "SELECT * FROM domain_health"
+    params = []
+    if domain:
+        sql += " WHERE domain = ?"
+        params.append(domain)
+    sql += " ORDER BY domain"
+    try:
+        with connect(db_path) as conn:
+            rows = [dict(row) for row in conn.execute(sql, params)]
+    except sqlite3.Error as e:
+        logging.error("An error occurred while loading domain health: %s", e)
+        return None if domain else []
+
+    for row in rows:
+        attempts = row['successes'] + row['failures']
+        row['success_rate'] = row['successes'] / attempts if attempts else None
+        row['avg_latency'] = row['total_latency'] / attempts if attempts else None
+        row['avg_content_length'] = row['total_content_length'] / row['successes'] if row['successes'] else None
+    if domain:
+        return rows[0] if rows else None
+    return rows
+
+
+if __name__ == '__main__':
+    # Print the registry
+    for health in get_domain_health():
+        success_rate = f"{health['success_rate']:.0%}" if health['success_rate'] is not None else 'N/A'
+        avg_latency = f"{health['avg_latency']:.1f}s" if health['avg_latency'] is not None else 'N/A'
+        print(f"{health['domain']:40} {health['state']:9} success {success_rate:>4} "
+              f"latency {avg_latency:>6} failures {health['failures']}")
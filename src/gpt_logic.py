@@ -5,10 +5,45 @@ import os
 from dotenv import load_dotenv
 import logging
 import re
+from records import Category
+from deadline import network_timeout
+from llm import structured_completion
+
+# Yahoo Finance symbols: letters and digits with an optional exchange or class suffix
+# (e.g. AAPL, BRK-B, JBSS3.SA, 7203.T, ^GSPC); the first form is checked, the second scrapes free text
+TICKER_PATTERN = re.compile(r'^\^?[A-Z0-9]{1,10}(?:[.\-=][A-Z0-9]{1,4})?$')
+TICKER_SCRAPE_PATTERN = re.compile(r'(?<![\w.^-])\^?[A-Z0-9]{1,10}(?:[.\-=][A-Z0-9]{1,4})?(?![\w-])')
+
+COMPLEMENTARY_TICKERS_INSTRUCTIONS = """
+You help a financial analyst compare a stock with its peers.
+Given a stock ticker, suggest three complementary stock tickers for comparative analysis: companies
+in the same industry or competing for the same customers. Use Yahoo Finance symbols, including the
+exchange suffix for stocks listed outside the US (e.g. JBSS3.SA, 7203.T). Never suggest the given ticker itself.
+""".strip()
+COMPLEMENTARY_TICKERS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'tickers': {'type': 'array', 'items': {'type': 'string'}}
+    },
+    'required': ['tickers'],
+    'additionalProperties': False
+}
+
+
+def _clean_tickers(candidates, ticker, limit=3):
+    """
+    Normalizes candidate symbols and keeps the first `limit` distinct valid ones other than ticker.
+    """
+    tickers = [candidate.strip().upper() for candidate in candidates]
+    tickers = [t for t in tickers if TICKER_PATTERN.match(t) and any(c.isalpha() for c in t) and t != ticker.upper()]
+    return list(dict.fromkeys(tickers))[:limit]  # dict.fromkeys preserves order
+
 
 def generate_complementary_tickers(ticker):
     """
     Generates complementary tickers for comparison using GPT.
+    The reply is a JSON object validated against COMPLEMENTARY_TICKERS_SCHEMA; if it does not parse,
+    ticker symbols are scraped from the reply text instead of making another call.
     Ensures that the tickers are unique and do not include the original ticker.
     """
     # Load environment variables
@@ -19,45 +54,41 @@ def generate_complementary_tickers(ticker):
 
     openai.api_key = OPENAI_API_KEY
 
-    # Prepare the prompt
-    prompt = f"""
-    Suggest three complementary stock tickers for {ticker} for comparative analysis.
-    Please provide only the ticker symbols, separated by commas, without any additional text.
-    Ensure that none of the suggested tickers are the same as {ticker}.
-    """
-
-    # Use the ChatCompletion API
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",  # or "gpt-4" if you have access
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
+        value, reply = structured_completion(
+            f'complementary_tickers:{ticker}',
+            COMPLEMENTARY_TICKERS_INSTRUCTIONS,
+            f"Ticker: {ticker}",
+            COMPLEMENTARY_TICKERS_SCHEMA,
+            'complementary_tickers',
             max_tokens=50,
             n=1,
             stop=None,
             temperature=0.7,
+            request_timeout=network_timeout(),
         )
-
-        # Extract the assistant's reply
-        reply = response['choices'][0]['message']['content'].strip()
-        # Extract ticker symbols using regex
-        tickers = re.findall(r'\b[A-Z]{1,5}\b', reply)
-
-        # Remove the original ticker if present
-        tickers = [t.strip().upper() for t in tickers if t.strip().upper() != ticker.upper()]
-
-        # Ensure uniqueness
-        unique_tickers = list(dict.fromkeys(tickers))  # Preserves order
-
-        # Limit to three tickers
-        complementary_tickers = unique_tickers[:3]
-
-        return complementary_tickers
+        candidates = value['tickers'] if value else TICKER_SCRAPE_PATTERN.findall(reply)
+        return _clean_tickers(candidates, ticker)
     except Exception as e:
-        logging.error(f"An error occurred while generating complementary tickers: {e}")
+        logging.error("An error occurred while generating complementary tickers: %s", e)
         return []
 
+# Report category fed by each default theme query
+THEME_CATEGORIES = {
+    'financial performance': Category.STOCK,
+    'market trends': Category.STOCK,
+    'geopolitical risks': Category.GEOPOLITICS,
+    'sector developments': Category.SECTOR,
+}
+
+def categorize_theme_query(ticker, query):
+    """
+    Returns the report category a theme query generated by generate_theme_queries belongs to.
+    Additional themes that do not map to a category are classified as 'OTHER'.
+    """
+    theme = query[len(ticker):].strip() if query.startswith(ticker) else query
+    return THEME_CATEGORIES.get(theme.lower(), Category.OTHER)
+
 def generate_theme_queries(ticker, additional_themes=None):
     """
     Generates theme-specific queries for SERPER API.
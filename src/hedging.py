@@ -0,0 +1,318 @@
+# src/hedging.py
+
+import time
+import atexit
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+from warehouse import connect as warehouse_connect, get_db_path
+
+# Latency quantile after which a call that has not answered gets a duplicate request
+HEDGE_QUANTILE = 0.95
+# Share of an endpoint's calls that may be hedged in a run, plus a few hedges allowed from the start
+HEDGE_BUDGET_RATIO = 0.1
+HEDGE_BUDGET_BURST = 2
+# The quantile is only trusted once an endpoint has this many latency samples
+MIN_SAMPLES = 20
+# Number of recent latencies kept (and stored) per endpoint
+LATENCY_WINDOW = 200
+# Never hedge earlier than this, however fast the endpoint usually answers
+MIN_HEDGE_DELAY = 0.2
+# Latencies are written to the warehouse in batches of this many samples (and at the end of a run)
+LATENCY_FLUSH_SIZE = 20
+HEDGE_WORKERS = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS request_latency (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    endpoint TEXT NOT NULL,
+    latency REAL NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_request_latency_endpoint ON request_latency (endpoint, id);
+"""
+
+_initialized_paths = set()
+_current = contextvars.ContextVar('hedger', default=None)
+# Set in the context of a hedged attempt whose result is no longer needed
+_cancel_event = contextvars.ContextVar('hedge_cancel_event', default=None)
+# Warehouse holding the latency history of the calls in this context (None for the default one)
+_db_path = contextvars.ContextVar('hedge_db_path', default=None)
+
+_lock = threading.Lock()
+# Recent latencies by (warehouse path, endpoint), and samples waiting to be written to their warehouse
+_windows = {}
+_pending = []
+_executor = None
+
+
+@contextmanager
+def connect(db_path=None):
+    """
+    Opens a warehouse connection and makes sure the request latency table exists.
+    """
+    path = db_path or get_db_path()
+    with warehouse_connect(path) as conn:
+        if path not in _initialized_paths:
+            conn.executescript(SCHEMA)
+            _initialized_paths.add(path)
+        yield conn
+
+
+def _window(endpoint, path):
+    """
+    Returns the recent latencies of an endpoint, loading them from the warehouse at path on first use.
+    Must be called with _lock held.
+    """
+    window = _windows.get((path, endpoint))
+    if window is None:
+        window = deque(maxlen=LATENCY_WINDOW)
+        try:
+            with connect(path) as conn:
+                rows = conn.execute(
+                    "SELECT latency FROM request_latency WHERE endpoint = ? ORDER BY id DESC LIMIT ?",
+                    (endpoint, LATENCY_WINDOW)
+                ).fetchall()
+            window.extend(row['latency'] for row in reversed(rows))
+        except Exception as e:
+            logging.error("An error occurred while loading latencies of %s: %s", endpoint, e)
+        _windows[(path, endpoint)] = window
+    return window
+
+
+def record_latency(endpoint, latency, db_path=None):
+    """
+    Adds a successful request's latency to the endpoint's window in the warehouse at db_path.
+    Samples are written in batches of LATENCY_FLUSH_SIZE by a background thread, so the request
+    path makes no database write; call flush_latencies() to write the rest.
+    """
+    path = db_path or get_db_path()
+    with _lock:
+        _window(endpoint, path).append(latency)
+        _pending.append((path, endpoint, latency, time.time()))
+        full = len(_pending) >= LATENCY_FLUSH_SIZE
+    if full:
+        _get_executor().submit(flush_latencies)
+
+
+def flush_latencies():
+    """
+    Writes the buffered latency samples to their warehouses and drops stored samples that have
+    fallen out of their endpoint's window.
+    """
+    with _lock:
+        samples = _pending[:]
+        del _pending[:]
+    rows_by_path = {}
+    for path, endpoint, latency, recorded_at in samples:
+        rows_by_path.setdefault(path, []).append((endpoint, latency, recorded_at))
+    for path, rows in rows_by_path.items():
+        try:
+            with connect(path) as conn:
+                conn.executemany("INSERT INTO request_latency (endpoint, latency, recorded_at) VALUES (?, ?, ?)", rows)
+                for endpoint in {row[0] for row in rows}:
+                    conn.execute(
+                        "DELETE FROM request_latency WHERE endpoint = ? AND id <= ("
+                        "SELECT id FROM request_latency WHERE endpoint = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                        (endpoint, endpoint, LATENCY_WINDOW)
+                    )
+        except Exception as e:
+            logging.error("An error occurred while recording %s request latencies in %s: %s", len(rows), path, e)
+
+
+atexit.register(flush_latencies)
+
+
+def latency_quantile(endpoint, quantile, db_path=None):
+    """
+    Returns the given quantile of the endpoint's recent latencies in the warehouse at db_path, or
+    None if it has fewer than MIN_SAMPLES of them.
+    """
+    path = db_path or get_db_path()
+    with _lock:
+        samples = sorted(_window(endpoint, path))
+    if len(samples) < MIN_SAMPLES:
+        return None
+    return samples[min(int(quantile * len(samples)), len(samples) - 1)]
+
+
+def _percentile(values, quantile):
+    ordered = sorted(values)
+    return round(ordered[min(int(quantile * len(ordered)), len(ordered) - 1)], 3) if ordered else None
+
+
+class Hedger:
+    """
+    Hedged-request policy and statistics of a report run. A call that has not answered after the
+    endpoint's observed HEDGE_QUANTILE latency is sent a second time; the first successful response
+    wins and the other attempt is cancelled. Hedges are capped at budget_ratio of the endpoint's
+    calls (plus HEDGE_BUDGET_BURST) so a slow endpoint does not get double the load.
+    """
+
+    def __init__(self, quantile=HEDGE_QUANTILE, budget_ratio=HEDGE_BUDGET_RATIO):
+        self.quantile = quantile
+        self.budget_ratio = budget_ratio
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def _endpoint_stats(self, endpoint):
+        return self.stats.setdefault(endpoint, {
+            'calls': 0, 'hedged': 0, 'hedge_wins': 0, 'budget_denied': 0, 'latencies': []
+        })
+
+    def hedge_delay(self, endpoint, db_path=None):
+        """
+        Returns how long a call to endpoint waits before it is hedged, or None if the endpoint has
+        too few latency samples in the warehouse at db_path to tell.
+        """
+        delay = latency_quantile(endpoint, self.quantile, db_path=db_path)
+        return None if delay is None else max(delay, MIN_HEDGE_DELAY)
+
+    def count_call(self, endpoint):
+        with self._lock:
+            self._endpoint_stats(endpoint)['calls'] += 1
+
+    def take_budget(self, endpoint):
+        """
+        Uses one hedge of the endpoint's budget. Returns False (and counts the denial) if it is spent.
+        """
+        with self._lock:
+            stats = self._endpoint_stats(endpoint)
+            if stats['hedged'] >= stats['calls'] * self.budget_ratio + HEDGE_BUDGET_BURST:
+                stats['budget_denied'] += 1
+                return False
+            stats['hedged'] += 1
+            return True
+
+    def record_call(self, endpoint, latency, hedge_won):
+        with self._lock:
+            stats = self._endpoint_stats(endpoint)
+            stats['latencies'].append(latency)
+            stats['hedge_wins'] += int(hedge_won)
+
+    def summary(self):
+        """
+        Returns the hedging statistics of every endpoint, with the p50/p95/p99 of its call latencies,
+        as a JSON-serializable dictionary.
+        """
+        with self._lock:
+            summary = {}
+            for endpoint, stats in self.stats.items():
+                latencies = stats['latencies']
+                summary[endpoint] = {
+                    'calls': stats['calls'],
+                    'hedged': stats['hedged'],
+                    'hedge_wins': stats['hedge_wins'],
+                    'budget_denied': stats['budget_denied'],
+                    'p50_seconds': _percentile(latencies, 0.5),
+                    'p95_seconds': _percentile(latencies, 0.95),
+                    'p99_seconds': _percentile(latencies, 0.99)
+                }
+            return summary
+
+
+@contextmanager
+def use_hedging(hedger, db_path=None):
+    """
+    Makes hedger the hedging policy (None for no hedging) of the calls inside the block,
+    including tasks submitted to a structured_logging.ContextThreadPoolExecutor. Their latencies
+    are read from and recorded in the warehouse at db_path.
+    """
+    token = _current.set(hedger)
+    path_token = _db_path.set(db_path)
+    try:
+        yield hedger
+    finally:
+        _db_path.reset(path_token)
+        _current.reset(token)
+
+
+def cancelled():
+    """
+    Returns True inside a hedged attempt whose result is no longer needed, so long reads can stop early.
+    """
+    event = _cancel_event.get()
+    return event is not None and event.is_set()
+
+
+def _get_executor():
+    # Imported on first use: concurrent.futures and structured_logging's handlers are not needed at start-up
+    from structured_logging import ContextThreadPoolExecutor
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ContextThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='hedge')
+        return _executor
+
+
+def _attempt(endpoint, cancel_event, is_success, function, args, kwargs):
+    """
+    Runs one attempt of a hedged call and records its latency if it succeeded and was not
+    cancelled; fast failures (e.g. an immediate 4xx) would otherwise pull the hedge delay down.
+    """
+    _cancel_event.set(cancel_event)
+    started_at = time.monotonic()
+    result = function(*args, **kwargs)
+    if not cancel_event.is_set() and is_success(result):
+        record_latency(endpoint, time.monotonic() - started_at, db_path=_db_path.get())
+    return result
+
+
+def hedged_call(endpoint, function, *args, is_success=None, **kwargs):
+    """
+    Calls function(*args, **kwargs), hedging it under the current Hedger (see use_hedging).
+    The latency of every successful attempt is recorded for the endpoint even without hedging, so
+    the quantiles are known when hedging is turned on.
+    A result is successful if is_success(result) is true (default: it is not None); a failed first
+    response waits for the other attempt. Returns the winning result, or the last failed one; if every
+    attempt raised, the last exception is raised.
+    """
+    hedger = _current.get()
+    delay = hedger.hedge_delay(endpoint, db_path=_db_path.get()) if hedger else None
+    if hedger:
+        hedger.count_call(endpoint)
+    is_success = is_success or (lambda result: result is not None)
+    started_at = time.monotonic()
+    if delay is None:
+        result = _attempt(endpoint, threading.Event(), is_success, function, args, kwargs)
+        if hedger:
+            hedger.record_call(endpoint, time.monotonic() - started_at, False)
+        return result
+
+    from concurrent.futures import wait, FIRST_COMPLETED
+    executor = _get_executor()
+    primary_cancel = threading.Event()
+    primary = executor.submit(_attempt, endpoint, primary_cancel, is_success, function, args, kwargs)
+    attempts = {primary: primary_cancel}
+    done, _ = wait([primary], timeout=delay)
+    if not done and hedger.take_budget(endpoint):
+        logging.info("%s call still running after %.2fs; sending a hedged request.", endpoint, delay)
+        cancel_event = threading.Event()
+        attempts[executor.submit(_attempt, endpoint, cancel_event, is_success, function, args, kwargs)] = cancel_event
+
+    winner, result, error, returned = None, None, None, False
+    pending = set(attempts)
+    while pending and winner is None:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+                returned = True
+            except Exception as e:
+                error = e
+                continue
+            if is_success(result):
+                winner = future
+                break
+
+    for future, cancel_event in attempts.items():
+        if future is not winner and not future.done():
+            future.cancel()
+            cancel_event.set()
+    hedger.record_call(endpoint, time.monotonic() - started_at, winner is not None and winner is not primary)
+    if not returned:
+        raise error
+    return result
@@ -0,0 +1,249 @@
+# src/indicators.py
+
+import logging
+import numpy as np
+import pandas as pd
+from records import PriceBars
+
+TRADING_DAYS_PER_YEAR = 252
+
+# Look-back windows (in bars) used for the return summary
+RETURN_WINDOWS = {'1D': 1, '1W': 5, '1M': 21, '3M': 63, '6M': 126}
+
+
+def build_price_panel(histories, field='Close'):
+    """
+    Aligns one field of several price histories on a common date index.
+    Parameters:
+        histories (dict): Maps each ticker to its PriceBars (as produced by clean_stock_data) or list of bar dictionaries.
+        field (str): The bar field to extract (e.g., 'Close', 'Volume').
+    Returns a DataFrame indexed by date with one column per ticker.
+    """
+    series = {}
+    for ticker, history in histories.items():
+        bars = PriceBars.from_records(history)
+        if field not in PriceBars.FIELDS or not len(bars) or np.isnan(bars.field(field)).all():
+            logging.warning("No '%s' history available for %s.", field, ticker)
+            continue
+        column = bars.series(field)
+        series[ticker] = column[~column.index.duplicated(keep='last')]
+
+    if not series:
+        return pd.DataFrame()
+    return pd.DataFrame(series).sort_index()
+
+
+def compute_returns(close):
+    """
+    Simple period-over-period returns for every column of a price panel.
+    """
+    return close.pct_change(fill_method=None)
+
+
+def rolling_volatility(returns, window=20, periods_per_year=TRADING_DAYS_PER_YEAR):
+    """
+    Annualized rolling standard deviation of returns.
+    """
+    return returns.rolling(window).std() * np.sqrt(periods_per_year)
+
+
+def sma(close, window):
+    """
+    Simple moving average over the given window.
+    """
+    return close.rolling(window).mean()
+
+
+def ema(close, span):
+    """
+    Exponential moving average with the given span.
+    """
+    return close.ewm(span=span, adjust=False).mean()
+
+
+def rsi(close, window=14):
+    """
+    Relative Strength Index using Wilder's smoothing.
+    """
+    delta = close.diff()
+    gains = delta.clip(lower=0.0)
+    losses = -delta.clip(upper=0.0)
+    avg_gain = gains.ewm(alpha=1.0 / window, adjust=False, min_periods=window).mean()
+    avg_loss = losses.ewm(alpha=1.0 / window, adjust=False, min_periods=window).mean()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = 100.0 - 100.0 / (1.0 + avg_gain.to_numpy() / avg_loss.to_numpy())
+    # No losses over the window means maximum strength
+    values = np.where((avg_loss.to_numpy() == 0) & avg_gain.notna().to_numpy(), 100.0, values)
+    return pd.DataFrame(values, index=close.index, columns=close.columns)
+
+
+def macd(close, fast=12, slow=26, signal=9):
+    """
+    MACD line, signal line and histogram.
+    """
+    macd_line = ema(close, fast) - ema(close, slow)
+    signal_line = macd_line.ewm(span=signal, adjust=False).mean()
+    return macd_line, signal_line, macd_line - signal_line
+
+
+def drawdowns(close):
+    """
+    Drawdown from the running maximum, as a fraction (0 at a new high, negative below it).
+    """
+    return close / close.cummax() - 1.0
+
+
+def volume_zscores(volume, window=20):
+    """
+    Z-score of each bar's volume against its trailing window.
+    """
+    mean = volume.rolling(window).mean()
+    std = volume.rolling(window).std()
+    return (volume - mean) / std.replace(0.0, np.nan)
+
+
+def compute_indicators(close, volume=None):
+    """
+    Computes every indicator for a whole price panel at once.
+    Parameters:
+        close (DataFrame): Close prices, one column per ticker (see build_price_panel).
+        volume (DataFrame): Optional volumes aligned with close.
+    Returns a dictionary of DataFrames with the same shape as close.
+    """
+    returns = compute_returns(close)
+    macd_line, signal_line, histogram = macd(close)
+    indicators = {
+        'close': close,
+        'returns': returns,
+        'volatility_20': rolling_volatility(returns, 20),
+        'sma_20': sma(close, 20),
+        'sma_50': sma(close, 50),
+        'sma_200': sma(close, 200),
+        'ema_12': ema(close, 12),
+        'ema_26': ema(close, 26),
+        'rsi_14': rsi(close, 14),
+        'macd': macd_line,
+        'macd_signal': signal_line,
+        'macd_histogram': histogram,
+        'drawdown': drawdowns(close),
+    }
+    if volume is not None and not volume.empty:
+        indicators['volume'] = volume
+        indicators['volume_zscore_20'] = volume_zscores(volume.reindex_like(close), 20)
+    return indicators
+
+
+def compute_indicators_from_histories(histories):
+    """
+    Builds aligned close/volume panels for several tickers and computes their indicators.
+    """
+    close = build_price_panel(histories, 'Close')
+    if close.empty:
+        return {}
+    volume = build_price_panel(histories, 'Volume')
+    return compute_indicators(close, volume)
+
+
+def latest_indicator_table(indicators):
+    """
+    Collapses the indicator panels into one row per ticker with the latest values
+    and the look-back statistics used in the report summary.
+    """
+    close = indicators['close']
+    last_valid = close.ffill().iloc[-1]
+    table = pd.DataFrame(index=close.columns)
+    table['last_close'] = last_valid
+    table['bars'] = close.notna().sum()
+
+    filled = close.ffill()
+    for label, window in RETURN_WINDOWS.items():
+        if len(filled) > window:
+            table[f'return_{label}'] = filled.iloc[-1] / filled.iloc[-1 - window] - 1.0
+        else:
+            table[f'return_{label}'] = np.nan
+    first_valid = close.bfill().iloc[0]
+    table['return_period'] = last_valid / first_valid - 1.0
+
+    for name in ('volatility_20', 'sma_20', 'sma_50', 'sma_200', 'ema_12', 'ema_26',
+                 'rsi_14', 'macd', 'macd_signal', 'macd_histogram', 'drawdown'):
+        table[name] = indicators[name].iloc[-1]
+    table['max_drawdown'] = indicators['drawdown'].min()
+    if 'volume_zscore_20' in indicators:
+        table['volume_zscore_20'] = indicators['volume_zscore_20'].iloc[-1]
+    return table
+
+
+def _fmt(value, pattern):
+    if value is None or pd.isna(value):
+        return 'N/A'
+    return pattern.format(value)
+
+
+def summarize_indicators(indicators, ticker, table=None):
+    """
+    Produces a compact text block with the latest indicator values for one ticker,
+    suitable for inclusion in the report prompt.
+    """
+    if not indicators or ticker not in indicators['close'].columns:
+        return ''
+    table = table if table is not None else latest_indicator_table(indicators)
+    row = table.loc[ticker]
+    last_date = indicators['close'][ticker].dropna().index[-1].strftime('%Y-%m-%d')
+
+    returns = ', '.join(
+        f"{label} {_fmt(row[f'return_{label}'], '{:+.2%}')}" for label in RETURN_WINDOWS
+    )
+    price_vs_sma50 = row['last_close'] / row['sma_50'] - 1.0 if row['sma_50'] else np.nan
+    price_vs_sma200 = row['last_close'] / row['sma_200'] - 1.0 if row['sma_200'] else np.nan
+
+    lines = [
+        f"Technical indicators computed from {int(row['bars'])} bars (last bar {last_date}):",
+        f"- Last Close: {_fmt(row['last_close'], '{:.2f}')}",
+        f"- Returns: {returns}, full period {_fmt(row['return_period'], '{:+.2%}')}",
+        f"- Annualized Volatility (20 bars): {_fmt(row['volatility_20'], '{:.2%}')}",
+        f"- SMA 20/50/200: {_fmt(row['sma_20'], '{:.2f}')} / {_fmt(row['sma_50'], '{:.2f}')} / {_fmt(row['sma_200'], '{:.2f}')}"
+        f" (price vs SMA50 {_fmt(price_vs_sma50, '{:+.2%}')}, vs SMA200 {_fmt(price_vs_sma200, '{:+.2%}')})",
+        f"- EMA 12/26: {_fmt(row['ema_12'], '{:.2f}')} / {_fmt(row['ema_26'], '{:.2f}')}",
+        f"- RSI (14): {_fmt(row['rsi_14'], '{:.1f}')}",
+        f"- MACD (12, 26, 9): line {_fmt(row['macd'], '{:.3f}')}, signal {_fmt(row['macd_signal'], '{:.3f}')},"
+        f" histogram {_fmt(row['macd_histogram'], '{:+.3f}')}",
+        f"- Drawdown: current {_fmt(row['drawdown'], '{:.2%}')}, maximum {_fmt(row['max_drawdown'], '{:.2%}')}",
+    ]
+    if 'volume_zscore_20' in table.columns:
+        lines.append(f"- Volume Z-Score (20 bars): {_fmt(row['volume_zscore_20'], '{:+.2f}')}")
+    return '\n'.join(lines)
+
+
+def summarize_intraday(bars, ticker, rule='15min'):
+    """
+    Produces a short-term text block from intraday bars (records.IntradayBars): statistics of the
+    last session (UTC date) and RSI and realized volatility on bars resampled to rule.
+    """
+    if bars is None or not len(bars):
+        return ''
+    sessions = bars.session_dates()
+    last_session = sessions[-1]
+    session = bars.take(sessions == last_session)
+    previous = bars.take(sessions < last_session)
+    session_close = float(session.close[-1])
+    previous_close = float(previous.close[-1]) if len(previous) else np.nan
+    total_volume = int(session.volume.sum())
+    typical_price = (session.high.astype(np.float64) + session.low + session.close) / 3.0
+    vwap = float((typical_price * session.volume).sum() / total_volume) if total_volume else np.nan
+
+    resampled = bars.resample(rule) if rule else bars
+    close = resampled.series('Close').astype(np.float64).to_frame(ticker)
+    last_rsi = rsi(close, 14)[ticker].iloc[-1]
+    session_returns = np.diff(np.log(session.close.astype(np.float64)))
+    realized_volatility = float(np.sqrt(np.sum(session_returns ** 2))) if len(session_returns) else np.nan
+
+    last_bar = np.datetime_as_string(bars.dates[-1], unit='m').replace('T', ' ')
+    return '\n'.join([
+        f"Intraday ({bars.interval} bars, {len(np.unique(sessions))} sessions, last bar {last_bar} UTC):",
+        f"- Last Session: open {_fmt(float(session.open[0]), '{:.2f}')}, high {_fmt(float(session.high.max()), '{:.2f}')}, "
+        f"low {_fmt(float(session.low.min()), '{:.2f}')}, last {_fmt(session_close, '{:.2f}')}"
+        f" ({_fmt(session_close / previous_close - 1.0, '{:+.2%}')} vs prior session close)",
+        f"- Session VWAP: {_fmt(vwap, '{:.2f}')}, volume {total_volume:,}",
+        f"- Session Realized Volatility: {_fmt(realized_volatility, '{:.2%}')}",
+        f"- RSI (14, {resampled.interval} bars): {_fmt(last_rsi, '{:.1f}')}",
+    ])
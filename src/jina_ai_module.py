@@ -4,97 +4,190 @@ import requests
 import os
 from dotenv import load_dotenv
 import logging
-from urllib.parse import urlparse
 import time
+from search_index import get_indexed_article
+from domain_health import allow_request, record_success, record_failure
+from utils import get_domain
+from text_cleaning import clean_article_text
+from records import Article
+from deadline import network_timeout, out_of_time
+from hedging import hedged_call, cancelled
 
-def fetch_full_article_content(articles, max_retries=3):
+# Seconds to wait for the Jina Reader (shortened when the run's deadline is close)
+REQUEST_TIMEOUT = 20
+# Maximum number of bytes read from a Jina response; larger pages are truncated and the download aborted
+MAX_ARTICLE_BYTES = 1_000_000
+# Number of bytes of an error response body included in the log
+MAX_ERROR_BODY_BYTES = 300
+STREAM_CHUNK_SIZE = 16384
+
+
+def read_capped(response, max_bytes):
+    """
+    Reads a streamed response body up to max_bytes and closes the connection early if the limit is hit
+    or the read belongs to a hedged attempt that lost. Returns a tuple (text, truncated).
+    """
+    chunks = []
+    received = 0
+    truncated = False
+    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+        if not chunk:
+            continue
+        if cancelled():
+            break
+        remaining = max_bytes - received
+        if len(chunk) >= remaining:
+            chunks.append(chunk[:remaining])
+            truncated = len(chunk) > remaining
+            break
+        chunks.append(chunk)
+        received += len(chunk)
+    response.close()
+    encoding = response.encoding or 'utf-8'
+    return b''.join(chunks).decode(encoding, errors='replace'), truncated
+
+def request_article(api_url, headers):
+    """
+    Makes one Jina Reader request and reads its (capped) body.
+    Returns a tuple (status_code, body, truncated).
+    """
+    response = requests.get(api_url, headers=headers, timeout=network_timeout(REQUEST_TIMEOUT), stream=True)
+    max_bytes = MAX_ARTICLE_BYTES if response.status_code == 200 else MAX_ERROR_BODY_BYTES
+    body, truncated = read_capped(response, max_bytes)
+    return response.status_code, body, truncated
+
+def get_jina_headers():
+    """
+    Builds the Jina AI Reader request headers. Returns None if the API key is not set.
+    """
+    load_dotenv()
+    JINA_READER_API_KEY = os.getenv('JINA_READER_API_KEY')
+    if not JINA_READER_API_KEY:
+        logging.error("JINA_READER_API_KEY environment variable is not set.")
+        return None
+    return {
+        'Authorization': f'Bearer {JINA_READER_API_KEY}',
+        'X-Return-Format': 'text'  # Request content in plain text format
+    }
+
+
+def fetch_article_text(url, headers, max_retries=3, use_index=True, db_path=None):
+    """
+    Fetches the full text of a single URL using the Jina AI Reader API.
+    Text previously indexed in the warehouse at db_path is returned without a network call unless use_index is False.
+    Domains whose circuit breaker is open are skipped, and the outcome is recorded in the domain health registry
+    of the same warehouse.
+    The response is streamed and capped at MAX_ARTICLE_BYTES, and navigation/boilerplate is stripped from the text.
+    Requests are hedged when the run enables hedging (see hedging.hedged_call).
+    Returns a tuple (full_text, failure_reason); full_text is None if the article could not be fetched.
+    """
+    indexed_text = get_indexed_article(url, db_path=db_path) if use_index else None
+    if indexed_text:
+        logging.info("Using indexed content for URL %s.", url)
+        return indexed_text, ''
+
+    domain = get_domain(url)
+    if not allow_request(domain, db_path=db_path):
+        logging.info("Skipping URL %s: circuit open for %s.", url, domain)
+        return None, 'circuit open'
+
+    # Directly append the target URL to the API endpoint without encoding
+    api_url = f'https://r.jina.ai/{url}'
+
+    retries = 0
+    failure_reason = ''
+    started_at = time.monotonic()
+    while retries < max_retries:
+        if retries and out_of_time():
+            logging.warning("No time left to retry URL %s.", url)
+            break
+        try:
+            request_started_at = time.monotonic()
+            status_code, body, truncated = hedged_call('jina', request_article, api_url, headers,
+                                                       is_success=lambda result: result[0] == 200)
+            if status_code == 200:
+                raw_text = body
+                if truncated:
+                    logging.warning("Content for URL %s exceeded %s bytes and was truncated.", url, MAX_ARTICLE_BYTES)
+                full_text = clean_article_text(raw_text).strip()
+                if not full_text:
+                    logging.warning("No content returned for URL %s.", url)
+                    failure_reason = 'empty content'
+                    retries += 1
+                    time.sleep(1)  # Wait before retrying
+                    continue
+
+                record_success(domain, time.monotonic() - request_started_at, len(full_text), db_path=db_path)
+                logging.info("Extracted %s characters from %s for URL %s.", len(full_text), len(raw_text), url)
+                return full_text, ''
+            else:
+                logging.error("Failed to fetch content for URL %s: %s - %s", url, status_code, body)
+                failure_reason = f'HTTP {status_code}'
+                retries += 1
+                time.sleep(1)  # Wait before retrying
+        except requests.RequestException as e:
+            logging.error("Request error for URL %s: %s", url, e)
+            failure_reason = str(e)
+            retries += 1
+            time.sleep(1)  # Wait before retrying
+
+    record_failure(domain, time.monotonic() - started_at, failure_reason, db_path=db_path)
+    return None, failure_reason
+
+
+def fetch_full_article_content(articles, max_retries=3, use_index=True, prefetcher=None, db_path=None):
     """
     Fetches the full text content of the articles using the Jina AI Reader API.
-    Saves all successfully fetched articles into a single text file in the desired format.
-    Returns two lists: successfully fetched articles and failed articles.
+    Articles already present in the full-text search index of the warehouse at db_path are served from it
+    without a network call unless use_index is False. Domains whose circuit breaker is open are skipped
+    without a request, and every extraction outcome is recorded in the domain health registry of the same warehouse.
+    If a prefetch.ArticlePrefetcher is given, articles it has already started extracting are taken from it.
+    Takes a list of SearchHit records. Returns a tuple (successful, failed, domain_failure_count) where
+    successful is a list of Article records and failed the list of hits that could not be fetched.
     """
     try:
-        # Load environment variables
-        load_dotenv()
-        JINA_READER_API_KEY = os.getenv('JINA_READER_API_KEY')
-        if not JINA_READER_API_KEY:
-            logging.error("JINA_READER_API_KEY environment variable is not set.")
-            return [], articles  # All articles failed
-
-        headers = {
-            'Authorization': f'Bearer {JINA_READER_API_KEY}',
-            'X-Return-Format': 'text'  # Request content in plain text format
-        }
-
-        combined_content = ""
+        headers = get_jina_headers()
+        if headers is None:
+            return [], articles, {}  # All articles failed
+
         successful_articles = []
         failed_articles = []
         domain_failure_count = {}
 
         for idx, article in enumerate(articles):
-            url = article.get('link', '')
-            title = article.get('title', f'Article {idx+1}')
-            category = article.get('category', 'OTHER')
+            url = article.link
+            title = article.title or f'Article {idx+1}'
             if not url:
-                logging.warning(f"Article '{title}' has no URL. Skipping.")
+                logging.warning("Article '%s' has no URL. Skipping.", title)
                 failed_articles.append(article)
                 continue
 
-            # Directly append the target URL to the API endpoint without encoding
-            api_url = f'https://r.jina.ai/{url}'
-
-            retries = 0
-            success = False
-            while retries < max_retries and not success:
-                try:
-                    response = requests.get(api_url, headers=headers, timeout=20)
-                    if response.status_code == 200:
-                        full_text = response.text.strip()
-                        if not full_text:
-                            logging.warning(f"No content returned for URL {url}.")
-                            retries += 1
-                            time.sleep(1)  # Wait before retrying
-                            continue
-
-                        article['full_content'] = full_text
-
-                        # Append to combined content
-                        combined_content += f"Title: {title}\n"
-                        combined_content += f"Link: {url}\n"
-                        combined_content += f"Category: {category}\n"
-                        combined_content += f"Text:\n{full_text}\n\n"
-
-                        successful_articles.append(article)
-                        success = True
-                    else:
-                        logging.error(f"Failed to fetch content for URL {url}: {response.status_code} - {response.text}")
-                        retries += 1
-                        time.sleep(1)  # Wait before retrying
-                except requests.RequestException as e:
-                    logging.error(f"Request error for URL {url}: {e}")
-                    retries += 1
-                    time.sleep(1)  # Wait before retrying
+            if out_of_time():
+                logging.warning("Extraction is out of time; skipping the remaining %s article(s).", len(articles) - idx)
+                failed_articles.extend(articles[idx:])
+                break
 
-            if not success:
+            prefetched = prefetcher.claim(url) if prefetcher else None
+            if prefetched is not None:
+                full_text, failure_reason = prefetched
+            else:
+                full_text, failure_reason = fetch_article_text(url, headers, max_retries=max_retries, use_index=use_index, db_path=db_path)
+
+            if full_text:
+                fetched = Article(hit=article, content=full_text)
+
+                successful_articles.append(fetched)
+            else:
                 failed_articles.append(article)
                 # Update domain failure count
-                domain = urlparse(url).netloc.lower()
+                domain = get_domain(url)
                 domain_failure_count[domain] = domain_failure_count.get(domain, 0) + 1
 
-        # Ensure the 'data' directory exists
-        os.makedirs('data', exist_ok=True)
-
-        # Save combined content to a single file
-        if successful_articles:
-            combined_filename = "data/full_articles.txt"
-            with open(combined_filename, 'w', encoding='utf-8') as f:
-                f.write(combined_content.strip())
-            logging.info(f"Full articles have been saved to {combined_filename}.")
-        else:
-            logging.warning("No articles were successfully fetched. 'full_articles.txt' was not created.")
+        if not successful_articles:
+            logging.warning("No articles were successfully fetched.")
 
         return successful_articles, failed_articles, domain_failure_count
 
     except Exception as e:
-        logging.error(f"An error occurred while fetching full article content: {e}")
+        logging.error("An error occurred while fetching full article content: %s", e)
         return [], articles, {}
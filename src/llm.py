@@ -0,0 +1,351 @@
+# src/llm.py
+
+import json
+import pickle
+import hashlib
+import sqlite3
+import logging
+import contextvars
+from contextlib import contextmanager
+
+from warehouse import connect as warehouse_connect, get_db_path, utc_now
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_batch_requests (
+    run_id TEXT NOT NULL,
+    custom_id TEXT NOT NULL,
+    body_json TEXT NOT NULL,
+    batch_id TEXT,
+    response_json TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    completed_at TEXT,
+    PRIMARY KEY (run_id, custom_id)
+);
+CREATE INDEX IF NOT EXISTS idx_llm_batch_requests_batch ON llm_batch_requests (run_id, batch_id);
+
+CREATE TABLE IF NOT EXISTS llm_batch_checkpoints (
+    run_id TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    value BLOB NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (run_id, ticker, stage)
+);
+
+CREATE TABLE IF NOT EXISTS llm_batch_tickers (
+    run_id TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    status TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (run_id, ticker)
+);
+"""
+
+# Models that accept a JSON schema as response_format (strict structured outputs); other chat models
+# get JSON mode. Either way the reply is validated against the schema before it is used.
+JSON_SCHEMA_MODELS = ('gpt-4o', 'gpt-4.1', 'o1', 'o3', 'o4')
+
+_initialized_paths = set()
+_current = contextvars.ContextVar('llm_batch', default=None)
+
+
+class BatchPending(BaseException):
+    """
+    Raised by chat_completion in batch mode when a request has no result yet: the request has been
+    queued for the next batch and the pipeline stops here, to resume once the batch has completed.
+    It derives from BaseException so the `except Exception` fallbacks around model calls do not
+    mistake it for a failed call.
+    """
+
+
+@contextmanager
+def connect(db_path=None):
+    """
+    Opens a warehouse connection and makes sure the batch request tables exist.
+    """
+    path = db_path or get_db_path()
+    with warehouse_connect(path) as conn:
+        if path not in _initialized_paths:
+            conn.executescript(SCHEMA)
+            _initialized_paths.add(path)
+        yield conn
+
+
+class BatchStore:
+    """
+    Model requests and results of one batch run (see batch_llm.py), kept in the warehouse so that
+    an interrupted run can resume: queued requests, the batch each was submitted in, and its result,
+    plus the stage checkpoints of every ticker's pipeline.
+    """
+
+    def __init__(self, run_id, db_path=None):
+        self.run_id = run_id
+        self.db_path = db_path
+
+    def lookup(self, custom_id):
+        """
+        Returns (found, response, error) for a request: found is False if it has no result yet.
+        """
+        with connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT response_json, error FROM llm_batch_requests WHERE run_id = ? AND custom_id = ?",
+                (self.run_id, custom_id)
+            ).fetchone()
+        if row is None or (row['response_json'] is None and row['error'] is None):
+            return False, None, None
+        return True, json.loads(row['response_json']) if row['response_json'] else None, row['error']
+
+    def add(self, custom_id, body):
+        """
+        Queues a request for the next batch. A request that is already queued is left as it is.
+        """
+        with connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO llm_batch_requests (run_id, custom_id, body_json, created_at) VALUES (?, ?, ?, ?)",
+                (self.run_id, custom_id, json.dumps(body), utc_now())
+            )
+
+    def unsubmitted(self):
+        """
+        Returns the queued requests not submitted yet, as a dictionary mapping custom_id to body.
+        """
+        with connect(self.db_path) as conn:
+            rows = conn.execute(
+                "SELECT custom_id, body_json FROM llm_batch_requests WHERE run_id = ? AND batch_id IS NULL ORDER BY created_at, custom_id",
+                (self.run_id,)
+            ).fetchall()
+        return {row['custom_id']: json.loads(row['body_json']) for row in rows}
+
+    def mark_submitted(self, custom_ids, batch_id):
+        with connect(self.db_path) as conn:
+            conn.executemany(
+                "UPDATE llm_batch_requests SET batch_id = ? WHERE run_id = ? AND custom_id = ?",
+                [(batch_id, self.run_id, custom_id) for custom_id in custom_ids]
+            )
+
+    def open_batches(self):
+        """
+        Returns the ids of submitted batches that still have requests without a result.
+        """
+        with connect(self.db_path) as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT batch_id FROM llm_batch_requests WHERE run_id = ? AND batch_id IS NOT NULL "
+                "AND response_json IS NULL AND error IS NULL",
+                (self.run_id,)
+            ).fetchall()
+        return [row['batch_id'] for row in rows]
+
+    def store_results(self, batch_id, results, missing_error='no result in batch output'):
+        """
+        Stores a dictionary mapping custom_id to (response, error). Requests of the batch missing
+        from results are marked as failed with missing_error, so their pipelines fall back instead
+        of waiting forever.
+        """
+        completed_at = utc_now()
+        with connect(self.db_path) as conn:
+            conn.executemany(
+                "UPDATE llm_batch_requests SET response_json = ?, error = ?, completed_at = ? "
+                "WHERE run_id = ? AND custom_id = ? AND batch_id = ?",
+                [(json.dumps(response) if response is not None else None, error, completed_at, self.run_id, custom_id, batch_id)
+                 for custom_id, (response, error) in results.items()]
+            )
+            conn.execute(
+                "UPDATE llm_batch_requests SET error = ?, completed_at = ? "
+                "WHERE run_id = ? AND batch_id = ? AND response_json IS NULL AND error IS NULL",
+                (missing_error, completed_at, self.run_id, batch_id)
+            )
+
+    def load_checkpoint(self, ticker, stage):
+        """
+        Returns (found, value) for a stage checkpoint of a ticker.
+        """
+        with connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT value FROM llm_batch_checkpoints WHERE run_id = ? AND ticker = ? AND stage = ?",
+                (self.run_id, ticker, stage)
+            ).fetchone()
+        return (False, None) if row is None else (True, pickle.loads(row['value']))
+
+    def save_checkpoint(self, ticker, stage, value):
+        with connect(self.db_path) as conn:
+            conn.execute(
+                """
+                INSERT INTO llm_batch_checkpoints (run_id, ticker, stage, value, created_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (run_id, ticker, stage) DO UPDATE SET value = excluded.value, created_at = excluded.created_at
+                """,
+                (self.run_id, ticker, stage, pickle.dumps(value), utc_now())
+            )
+
+    def ticker_status(self, ticker):
+        with connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT status FROM llm_batch_tickers WHERE run_id = ? AND ticker = ?", (self.run_id, ticker)
+            ).fetchone()
+        return row['status'] if row else None
+
+    def set_ticker_status(self, ticker, status):
+        with connect(self.db_path) as conn:
+            conn.execute(
+                """
+                INSERT INTO llm_batch_tickers (run_id, ticker, status, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (run_id, ticker) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at
+                """,
+                (self.run_id, ticker, status, utc_now())
+            )
+
+    def counts(self):
+        """
+        Returns the number of requests of the run by state: queued, submitted, completed and failed.
+        """
+        with connect(self.db_path) as conn:
+            row = conn.execute(
+                """
+                SELECT
+                    SUM(batch_id IS NULL) AS queued,
+                    SUM(batch_id IS NOT NULL AND response_json IS NULL AND error IS NULL) AS submitted,
+                    SUM(response_json IS NOT NULL) AS completed,
+                    SUM(error IS NOT NULL) AS failed
+                FROM llm_batch_requests WHERE run_id = ?
+                """,
+                (self.run_id,)
+            ).fetchone()
+        return {key: row[key] or 0 for key in ('queued', 'submitted', 'completed', 'failed')}
+
+
+@contextmanager
+def use_batch(store):
+    """
+    Sends the model calls inside the block to store (a BatchStore) instead of the API; None calls the API directly.
+    """
+    token = _current.set(store)
+    try:
+        yield store
+    finally:
+        _current.reset(token)
+
+
+def checkpoint(ticker, stage, compute):
+    """
+    Returns compute(). In batch mode (see use_batch) the value is computed once per run and stored,
+    and later passes of the run get the stored value, so a pipeline resumes from the same inputs
+    (live market data, search results, selected and extracted articles) that its queued requests
+    were built from. A compute() that raises, including BatchPending, stores nothing.
+    """
+    store = _current.get()
+    if store is None:
+        return compute()
+    try:
+        found, value = store.load_checkpoint(ticker, stage)
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Batch store unavailable for the {stage} checkpoint of {ticker}: {e}")
+    if found:
+        logging.info("Resuming from the %s checkpoint.", stage)
+        return value
+    value = compute()
+    store.save_checkpoint(ticker, stage, value)
+    return value
+
+
+def request_id(request_key, body):
+    """
+    Returns the batch custom_id of a request: its key plus a hash of its body, so a request whose
+    content changed between passes is queued as a new call instead of reusing the old answer.
+    """
+    digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return f'{request_key}#{digest}'
+
+
+def chat_completion(request_key, **request):
+    """
+    Makes a chat completion call with the keyword arguments of openai.ChatCompletion.create.
+    request_key names the request within a run (e.g. 'report:AAPL'). In batch mode (see use_batch)
+    the result stored for the same key and body is returned; a request without one is queued and
+    BatchPending is raised, and a request that failed in its batch raises RuntimeError so the
+    caller's usual fallback applies.
+    """
+    store = _current.get()
+    if store is None:
+        import openai
+        return openai.ChatCompletion.create(**request)
+
+    body = {key: value for key, value in request.items() if key != 'request_timeout'}
+    custom_id = request_id(request_key, body)
+    try:
+        found, response, error = store.lookup(custom_id)
+        if not found:
+            store.add(custom_id, body)
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Batch store unavailable for request {request_key}: {e}")
+    if not found:
+        raise BatchPending(custom_id)
+    if error:
+        raise RuntimeError(f"Batch request {custom_id} failed: {error}")
+    logging.debug("Using the batch result of %s.", custom_id)
+    return response
+
+
+def response_format(model, name, schema):
+    """
+    Returns the response_format constraining a model's reply to schema: the schema itself for models
+    with structured outputs, JSON mode otherwise.
+    """
+    if model.startswith(JSON_SCHEMA_MODELS):
+        return {'type': 'json_schema', 'json_schema': {'name': name, 'schema': schema, 'strict': True}}
+    return {'type': 'json_object'}
+
+
+_JSON_TYPES = {'object': dict, 'array': list, 'string': str, 'integer': int, 'number': (int, float), 'boolean': bool}
+
+
+def schema_errors(value, schema, path='$'):
+    """
+    Validates value against the subset of JSON Schema used by the structured calls (type, properties,
+    required, additionalProperties, items, maxItems). Returns a list of error messages, empty if valid.
+    """
+    expected = _JSON_TYPES.get(schema.get('type'))
+    if expected and (not isinstance(value, expected) or (isinstance(value, bool) and schema['type'] != 'boolean')):
+        return [f"{path}: expected {schema['type']}"]
+    errors = []
+    if isinstance(value, dict):
+        properties = schema.get('properties', {})
+        errors += [f"{path}: missing '{key}'" for key in schema.get('required', []) if key not in value]
+        if schema.get('additionalProperties') is False:
+            errors += [f"{path}: unexpected '{key}'" for key in value if key not in properties]
+        for key, subschema in properties.items():
+            if key in value:
+                errors += schema_errors(value[key], subschema, f"{path}.{key}")
+    elif isinstance(value, list):
+        if 'maxItems' in schema and len(value) > schema['maxItems']:
+            errors.append(f"{path}: more than {schema['maxItems']} items")
+        for index, item in enumerate(value):
+            errors += schema_errors(item, schema.get('items', {}), f"{path}[{index}]")
+    return errors
+
+
+def structured_completion(request_key, instructions, content, schema, name, model="gpt-3.5-turbo", **request):
+    """
+    Makes a chat completion call whose reply is a JSON object matching schema.
+    The instructions and the schema form a fixed system message and the variable content follows
+    in the user message, so calls share a stable prompt prefix that the model side can cache.
+    Returns (value, reply): value is the parsed object, or None if the reply is not valid JSON or
+    does not match the schema, in which case the caller falls back locally using the raw reply.
+    """
+    messages = [
+        {"role": "system", "content": f"{instructions}\n\nReply with a single JSON object matching this JSON schema:\n"
+                                      f"{json.dumps(schema, sort_keys=True)}"},
+        {"role": "user", "content": content}
+    ]
+    response = chat_completion(request_key, model=model, messages=messages,
+                               response_format=response_format(model, name, schema), **request)
+    reply = (response['choices'][0]['message']['content'] or '').strip()
+    try:
+        value = json.loads(reply)
+    except ValueError:
+        logging.warning("Reply to %s is not valid JSON; using the local fallback.", request_key)
+        return None, reply
+    errors = schema_errors(value, schema)
+    if errors:
+        logging.warning("Reply to %s does not match its schema (%s); using the local fallback.", request_key, '; '.join(errors[:3]))
+        return None, reply
+    return value, reply
@@ -1,31 +1,73 @@
 # src/main.py
 
 import os
-import re
+import math
 import sys
 import json
 import logging
 import argparse
 
-import openai
-from yahoo_finance_api import fetch_stock_data
-from serper_api import fetch_serper_data
-from data_processing import (
-    load_json_file,
-    validate_data,
-    clean_stock_data,
-    clean_serper_data,
-    combine_data,
-    select_relevant_news
+from warehouse import (
+    today,
+    store_stock_data,
+    store_serper_results,
+    load_serper_results,
+    store_query_stats,
+    load_redundant_queries,
+    store_articles,
+    store_report
 )
-from gpt_logic import (
-    generate_complementary_tickers,
-    generate_theme_queries
-)
-from jina_ai_module import fetch_full_article_content
-from report_generator import generate_report  # No need to import save_report_as_pdf
-from dotenv import load_dotenv
-from urllib.parse import urlparse
+from search_index import index_articles, index_report
+from utils import get_domain
+from domain_health import get_blocked_domains
+from memory_budget import MemoryTracker
+from deadline import Deadline, use_deadline, current_deadline, out_of_time
+from hedging import Hedger, use_hedging, flush_latencies
+from artifact_store import ArtifactStore, input_key
+from llm import checkpoint
+
+# Heavy dependencies (openai, yfinance, pandas, reportlab, matplotlib, requests) are imported
+# inside main() at the stage that needs them, so --help and argument errors return immediately.
+# structured_logging is imported the same way: its queue handlers pull in logging.handlers,
+# concurrent.futures and queue.
+# Run src/check_import_time.py to verify that start-up stays light.
+
+# Degradation under a run deadline (--deadline): the fewest articles selected when the run is
+# behind schedule, the least time worth starting the replacement rounds with, and the report's
+# completion limit derived from the report stage's time (at this many tokens per second, with a floor)
+MIN_DEGRADED_ARTICLES = 3
+REPLACEMENT_MIN_SECONDS = 20
+REPORT_TOKENS_PER_SECOND = 60
+MIN_REPORT_TOKENS = 800
+
+def add_pipeline_arguments(parser):
+    """
+    Adds the options of a report run (everything except the ticker) to an argument parser.
+    Shared with the watch and batch runners.
+    """
+    parser.add_argument('--articles', type=int, default=5, help='Number of relevant articles to select')
+    parser.add_argument('--period', type=str, default='1y', help='Period for stock history (options: 1d, 5d, 1mo, 3mo, 6mo, 1y, etc.)')
+    parser.add_argument('--interval', type=str, default='1d', choices=['1d', '1m', '2m', '5m', '15m', '30m', '60m', '90m', '1h'],
+                        help='Bar interval; an intraday interval adds intraday bars for the period (fetched in concurrent chunks) to the daily history')
+    parser.add_argument('--db-path', type=str, default=None, help='Path to the SQLite research warehouse (default: data/hsfinance.db or $HSFINANCE_DB_PATH)')
+    parser.add_argument('--prefetch', type=int, default=0, help='Speculatively extract the top K candidates of each category while selection runs (0 disables)')
+    parser.add_argument('--summarize', action='store_true', help='Condense each article into a cached fact summary before generating the report (map-reduce mode)')
+    parser.add_argument('--sectioned', action='store_true', help='Generate each report section with its own concurrent model call, followed by a conclusion call')
+    parser.add_argument('--format', dest='formats', nargs='*', choices=['pdf', 'html', 'markdown'], default=['pdf'],
+                        help='Rendered report formats besides the text report (default: pdf; pass no value for text only)')
+    parser.add_argument('--refresh', action='store_true', help="Ignore today's SERPER results and indexed article text and fetch them again")
+    parser.add_argument('--memory-budget', type=int, default=0,
+                        help='RSS in MB above which article bodies and price arrays are spilled to memory-mapped files (0 disables)')
+    parser.add_argument('--deadline', type=int, default=0,
+                        help='Time limit of the run in seconds, split into stage budgets; the run degrades to meet it (0 disables)')
+    parser.add_argument('--quote-fields', nargs='+', default=[],
+                        help='Extra yfinance .info fields (e.g. sector beta) to keep in the quote snapshot besides the ones the report uses')
+    parser.add_argument('--hedge', action='store_true',
+                        help='Send a duplicate SERPER or Jina request when a call is slower than the endpoint\'s usual p95 latency (first answer wins)')
+    parser.add_argument('--keep-versions', type=int, default=5,
+                        help='Report versions kept per ticker and output format in the artifact store')
+    parser.add_argument('--trace-memory', action='store_true', help='Record the tracemalloc peak of every stage in the run summary (slower)')
+    return parser
 
 def parse_arguments():
     """
@@ -33,392 +75,435 @@ def parse_arguments():
     """
     parser = argparse.ArgumentParser(description='Generate a stock analysis report.')
     parser.add_argument('ticker', type=str, help='Stock ticker symbol')
-    parser.add_argument('--articles', type=int, default=5, help='Number of relevant articles to select')
-    parser.add_argument('--period', type=str, default='1y', help='Period for stock history (options: 1d, 5d, 1mo, 3mo, 6mo, 1y, etc.)')
+    add_pipeline_arguments(parser)
     return parser.parse_args()
 
-def get_domain(url):
-    """
-    Extracts the domain from a given URL.
-    """
-    try:
-        parsed_url = urlparse(url)
-        domain = parsed_url.netloc.lower()
-        return domain
-    except:
-        return ''
-
-def main():
+def check_environment():
     """
-    Main function to orchestrate the stock report generation.
+    Loads environment variables and checks that the API keys needed by a run are set.
     """
-    args = parse_arguments()
-    ticker = args.ticker.upper()
-    top_n_articles = args.articles
-    stock_period = args.period
-
-    # Configure logging to output to both console and file
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler("hsfinance.log"),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
-
-    # Load environment variables
+    from dotenv import load_dotenv
     load_dotenv()
     SERPER_API_KEY = os.getenv('SERPER_API_KEY')
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
     if SERPER_API_KEY is None:
         logging.error("SERPER_API_KEY environment variable is not set.")
-        sys.exit(1)
+        return False
     if OPENAI_API_KEY is None:
         logging.error("OPENAI_API_KEY environment variable is not set.")
+        return False
+    return True
+
+def base_queries(ticker):
+    """
+    Returns the SERPER queries every run makes for a ticker, as two dictionaries keyed by the
+    query's file name: the query text and the report category it feeds.
+    """
+    queries = {
+        'serper_stock_context': f'{ticker} stock analysis',
+        'serper_geopolitics': f'Geopolitical events affecting {ticker}',
+        'serper_sector_news': f'{ticker} sector news'
+    }
+    query_categories = {
+        'serper_stock_context': 'STOCK CONTEXT',
+        'serper_geopolitics': 'GEOPOLITICS CONTEXT',
+        'serper_sector_news': 'SECTOR CONTEXT'
+    }
+    return queries, query_categories
+
+def main():
+    """
+    Main function to orchestrate the stock report generation.
+    """
+    args = parse_arguments()
+    from structured_logging import configure_logging
+    configure_logging()
+    if not check_environment():
+        sys.exit(1)
+    if run_pipeline(args.ticker.upper(), args) is None:
         sys.exit(1)
 
+def run_pipeline(ticker, args):
+    """
+    Runs the whole report pipeline for one ticker with the options of add_pipeline_arguments.
+    Log records of the run carry the ticker and the current stage.
+    Returns the report text, or None if the run failed.
+    """
+    from structured_logging import log_context
+    with log_context(ticker=ticker):
+        memory = MemoryTracker(budget_mb=args.memory_budget, trace=args.trace_memory)
+        deadline = Deadline(args.deadline) if args.deadline else None
+        hedger = Hedger() if args.hedge else None
+        store = ArtifactStore(db_path=args.db_path, keep_versions=args.keep_versions)
+        try:
+            with use_deadline(deadline), use_hedging(hedger, db_path=args.db_path):
+                return _run_pipeline(ticker, args, memory, store)
+        finally:
+            flush_latencies()
+            memory.finish()
+            summary = memory.summary()
+            memory.close()
+            logging.info("Peak RSS %s MB; by stage: %s", summary['peak_rss_mb'],
+                         ', '.join(f"{stage['stage']} {stage['rss_end_mb']} MB" for stage in summary['stages']))
+            run_summary = {'ticker': ticker, 'run_date': today(), 'memory': summary}
+            if deadline:
+                run_summary['deadline'] = deadline.summary()
+                logging.info("Run took %ss of its %ss deadline with %s degradation(s).",
+                             run_summary['deadline']['elapsed_seconds'], args.deadline, len(deadline.degradations))
+            if hedger:
+                run_summary['hedging'] = hedger.summary()
+                logging.info("Hedged requests: %s", ', '.join(
+                    f"{endpoint} {stats['hedged']}/{stats['calls']} ({stats['hedge_wins']} won)"
+                    for endpoint, stats in run_summary['hedging'].items()))
+            run_summary['artifacts'] = store.summary()
+            write_run_summary(ticker, run_summary)
+
+def enter_stage(memory, stage):
+    """
+    Marks the start of a pipeline stage in the log context, the memory accounting and the run's deadline.
+    """
+    from structured_logging import set_log_context
+    set_log_context(stage=stage)
+    memory.enter_stage(stage)
+    deadline = current_deadline()
+    if deadline:
+        deadline.enter_stage(stage)
+
+def write_run_summary(ticker, summary, output_dir='outputs'):
+    """
+    Saves the summary of a run (memory accounting, deadline budgets per stage and hedging statistics) as JSON.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    summary_path = os.path.join(output_dir, f'{ticker}_run_summary.json')
+    with open(summary_path, 'w') as f:
+        json.dump(summary, f, indent=4)
+    logging.info("Run summary has been saved to %s.", summary_path)
+
+def extract_articles(ticker, args, memory, combined_data, relevant_articles, top_n_articles, prefetcher, run_date):
+    """
+    Fetches the full content of the selected articles, replaces failed ones with the next-best
+    candidates (prioritizing missing categories) and indexes every fetched article.
+    Returns at most top_n_articles Article records.
+    """
+    from records import REQUIRED_CATEGORIES
+    from candidate_pool import CandidatePool
+    db_path = args.db_path
+    deadline = current_deadline()
+
+    # Fetch full article content using Jina AI
+    enter_stage(memory, 'extraction')
+    from jina_ai_module import fetch_full_article_content
+    logging.info("Fetching full article content...")
+    successful_articles, failed_articles, domain_failure_count = fetch_full_article_content(relevant_articles, max_retries=3, use_index=not args.refresh, prefetcher=prefetcher, db_path=db_path)
+    logging.info("Successfully fetched %s articles.", len(successful_articles))
+    successful_articles = memory.spill_articles(successful_articles)
+    if failed_articles:
+        logging.warning("Failed to fetch %s articles.", len(failed_articles))
+
+    # Blacklist domains with consistent failures, starting from the persistent registry's open circuits
+    blacklist_domains = get_blocked_domains(db_path)
+    for domain, count in domain_failure_count.items():
+        if count >= 3:  # Blacklist if failed 3 times
+            blacklist_domains.add(domain)
+            logging.info("Blacklisted domain after multiple failures: %s", domain)
+
+    # Replace failed articles with the next-best candidates of the pool, prioritizing missing contexts
+    enter_stage(memory, 'replacement')
+    # Identify which contexts are covered by successful articles
+    covered_contexts = set(article.category for article in successful_articles)
+    required_contexts = set(REQUIRED_CATEGORIES)
+    missing_contexts = required_contexts - covered_contexts
+    skip_replacement = False
+    if deadline and len(successful_articles) < top_n_articles and deadline.stage_remaining() < REPLACEMENT_MIN_SECONDS:
+        deadline.degrade(f"skipping the replacement rounds for {top_n_articles - len(successful_articles)} missing article(s)")
+        skip_replacement = True
+
+    pool = CandidatePool(combined_data['serper_data'], blocked_domains=blacklist_domains)
+    pool.discard(article.link for article in relevant_articles)
+    while not skip_replacement and len(successful_articles) < top_n_articles and not out_of_time():
+        needed = top_n_articles - len(successful_articles)
+        if prefetcher:
+            pool.discard(prefetcher.failed_links())
+        # Missing contexts come first; once they are covered or have no candidates left, any context will do
+        replacements = []
+        if missing_contexts:
+            logging.info("Selecting %s replacement article(s) to cover missing contexts: %s", needed, ', '.join(sorted(missing_contexts)))
+            replacements = pool.take(needed, categories=missing_contexts)
+        if not replacements:
+            logging.info("Selecting %s replacement article(s) from any context.", needed)
+            replacements = pool.take(needed)
+        if not replacements:
+            logging.warning("No more articles available for replacement.")
+            break
+
+        # Fetch the content of the replacement articles
+        logging.info("Fetching content for %s replacement article(s)...", len(replacements))
+        replacement_success, replacement_failed, _ = fetch_full_article_content(replacements, max_retries=3, use_index=not args.refresh, prefetcher=prefetcher, db_path=db_path)
+        successful_articles.extend(replacement_success)
+        if replacement_failed:
+            logging.warning("Failed to fetch %s replacement article(s).", len(replacement_failed))
+            for article in replacement_failed:
+                domain = get_domain(article.link)
+                if domain:
+                    blacklist_domains.add(domain)
+                    pool.block_domain(domain)
+                    logging.info("Blacklisted domain: %s", domain)
+
+        # Update covered_contexts and missing_contexts
+        for article in replacement_success:
+            covered_contexts.add(article.category)
+        missing_contexts = required_contexts - covered_contexts
+    if pool.taken:
+        logging.info("Replacement rounds took %s candidate(s) from the pool and dropped %s stale one(s).", pool.taken, pool.dropped)
+
+    # Index every fetched article so later runs and searches can reuse the text
+    index_articles(ticker, successful_articles, as_of_date=run_date, db_path=db_path)
+
+    # Trim the successful_articles to top_n_articles
+    return successful_articles[:top_n_articles]
+
+def _run_pipeline(ticker, args, memory, store):
+    # Stages wrapped in checkpoint() run once per batch run (see llm.checkpoint); later passes resume
+    # from their stored output instead of fetching live data again
+    top_n_articles = args.articles
+    stock_period = args.period
+    db_path = args.db_path
+    run_date = checkpoint(ticker, 'run_date', today)
+
     # Fetch stock data
-    logging.info(f"Fetching stock data for {ticker}...")
-    stock_data = fetch_stock_data(ticker, period=stock_period)
+    enter_stage(memory, 'stock_data')
+    from yahoo_finance_api import fetch_stock_data, QUOTE_FIELDS
+    logging.info("Fetching stock data for %s...", ticker)
+    quote_fields = QUOTE_FIELDS + tuple(field for field in args.quote_fields if field not in QUOTE_FIELDS)
+    stock_data = checkpoint(ticker, 'stock_data', lambda: fetch_stock_data(
+        ticker, period=stock_period, interval=args.interval, db_path=db_path, quote_fields=quote_fields))
     if not stock_data:
-        logging.error(f"Failed to fetch stock data for {ticker}.")
-        sys.exit(1)
+        logging.error("Failed to fetch stock data for %s.", ticker)
+        return None
+    # Intraday bars are kept as compact arrays and are not part of the JSON file
+    intraday_bars = stock_data.get('intraday')
 
     # Generate complementary tickers
-    logging.info(f"Generating complementary tickers for {ticker}...")
+    enter_stage(memory, 'complementary_tickers')
+    from gpt_logic import generate_complementary_tickers, generate_theme_queries, categorize_theme_query
+    logging.info("Generating complementary tickers for %s...", ticker)
     complementary_tickers = generate_complementary_tickers(ticker)
     if not complementary_tickers:
-        logging.warning(f"No complementary tickers generated for {ticker}.")
-    logging.info(f"Complementary tickers for {ticker}: {complementary_tickers}")
+        logging.warning("No complementary tickers generated for %s.", ticker)
+    logging.info("Complementary tickers for %s: %s", ticker, complementary_tickers)
 
     # Generate theme-specific queries
-    logging.info(f"Generating theme-specific queries for {ticker}...")
+    enter_stage(memory, 'theme_queries')
+    logging.info("Generating theme-specific queries for %s...", ticker)
     theme_queries = generate_theme_queries(ticker)
-    logging.info(f"Theme-specific queries for {ticker}: {theme_queries}")
+    logging.info("Theme-specific queries for %s: %s", ticker, theme_queries)
 
     # Prepare queries for the SERPER API
-    queries = {
-        'serper_stock_context': f'{ticker} stock analysis',
-        'serper_geopolitics': f'Geopolitical events affecting {ticker}',
-        'serper_sector_news': f'{ticker} sector news'
-    }
+    def plan_queries():
+        queries, query_categories = base_queries(ticker)
+
+        # Include theme-specific queries, skipping those that recently added no unique results
+        redundant_queries = set() if args.refresh else load_redundant_queries(ticker, db_path=db_path)
+        for idx, query in enumerate(theme_queries):
+            if query in redundant_queries:
+                logging.info("Skipping theme query that was redundant in a recent run: %s", query)
+                continue
+            filename = f'serper_theme_query_{idx}'
+            queries[filename] = query
+            query_categories[filename] = categorize_theme_query(ticker, query)
+        return queries, query_categories
+
+    queries, query_categories = checkpoint(ticker, 'queries', plan_queries)
+
+    # Fetch data from SERPER API, reusing today's results from the warehouse when available
+    enter_stage(memory, 'serper')
+    from serper_api import fetch_serper_data, merge_serper_results, query_overlap_stats
+    prefetcher = None
+    if args.prefetch > 0:
+        from prefetch import ArticlePrefetcher
+        prefetcher = ArticlePrefetcher(ticker, top_k=args.prefetch, use_index=not args.refresh,
+                                       as_of_date=run_date, db_path=db_path)
+    logging.info("Fetching data from SERPER API...")
 
-    # Include theme-specific queries
-    for idx, query in enumerate(theme_queries):
-        filename = f'serper_theme_query_{idx}'
-        queries[filename] = query
+    def search():
+        serper_responses = {}
+        for filename, query in queries.items():
+            cached = None if args.refresh else load_serper_results(ticker, query, as_of_date=run_date, db_path=db_path)
+            if cached is not None:
+                logging.info("Using stored SERPER results for query: %s", query)
+                data = cached
+            else:
+                logging.info("Fetching data for query: %s", query)
+                data = fetch_serper_data(query, f'{ticker}_{filename}')
+                if data is not None:
+                    store_serper_results(ticker, query, query_categories[filename], data, as_of_date=run_date, db_path=db_path)
+            serper_responses[filename] = data
+        return serper_responses
 
-    # Fetch data from SERPER API
-    logging.info("Fetching data from SERPER API...")
-    for filename, query in queries.items():
-        logging.info(f"Fetching data for query: {query}")
-        fetch_serper_data(query, filename)
+    serper_responses = checkpoint(ticker, 'serper', search)
 
     # Data Processing
+    enter_stage(memory, 'processing')
+    from data_processing import (
+        validate_data,
+        clean_stock_data,
+        clean_serper_data,
+        combine_data,
+        select_relevant_news
+    )
     logging.info("Processing data...")
-    # Load and clean stock data
-    stock_data_json = load_json_file(f'data/{ticker}_stock_data.json')
+    # Clean the stock data fetched above; its JSON file is shared by every run of the ticker
+    stock_data_json = {key: stock_data[key] for key in ('info', 'history') if key in stock_data}
     if validate_data(stock_data_json, ['info', 'history']):
         stock_data = clean_stock_data(stock_data_json)
+        if stock_data:
+            store_stock_data(ticker, stock_data, stock_period, as_of_date=run_date, db_path=db_path)
+            stock_data['history'] = memory.spill_bars(stock_data['history'])
+            stock_data['intraday'] = memory.spill_bars(intraday_bars)
     else:
         logging.error("Stock data validation failed due to missing 'info' or 'history' keys.")
         stock_data = None
+    # The raw bar dictionaries are no longer needed once the history is held as arrays
+    del stock_data_json
 
-    # Load and clean SERPER data
-    serper_data_dict = {}
-    for filename in queries.keys():
-        filepath = f'data/{filename}.json'
-        serper_data = load_json_file(filepath)
-        if validate_data(serper_data, ['organic']):
-            serper_data = clean_serper_data(serper_data)
-            # Map filename to category
-            if filename == 'serper_stock_context':
-                category = 'STOCK CONTEXT'
-            elif filename == 'serper_geopolitics':
-                category = 'GEOPOLITICS CONTEXT'
-            elif filename == 'serper_sector_news':
-                category = 'SECTOR CONTEXT'
-            else:
-                category = 'OTHER'
-            serper_data_dict[category] = serper_data
+    # Load and clean SERPER data, grouping the responses of every query by category; the base
+    # queries come first, which query_overlap_stats relies on to never flag them as redundant
+    category_responses = {}
+    for filename, query in queries.items():
+        serper_data = serper_responses.get(filename)
+        if validate_data(serper_data, ['organic']) and clean_serper_data(serper_data):
+            category_responses.setdefault(query_categories[filename], {})[query] = serper_data
         else:
-            logging.error(f"SERPER data validation failed for {filepath}.")
+            logging.error("SERPER data validation failed for query '%s'.", query)
+
+    # Merge each category's results with URL deduplication, provenance and rank fusion
+    serper_data_dict = {}
+    for category, responses in category_responses.items():
+        serper_data_dict[category] = merge_serper_results(responses)
+        # Start extracting the category's strongest candidates while the remaining stages run
+        if prefetcher:
+            prefetcher.submit_candidates(category, serper_data_dict[category]['organic'])
+        stats = query_overlap_stats(responses)
+        store_query_stats(ticker, category, stats, as_of_date=run_date, db_path=db_path)
+        for query, stat in stats.items():
+            if stat['redundant'] and query in theme_queries:
+                logging.info("Theme query '%s' added no unique results to %s; it will be skipped in upcoming runs.", query, category)
+            elif stat['redundant']:
+                logging.info("Query '%s' added no unique results to %s.", query, category)
+        logging.info("%s: %s unique result(s) from %s queries.", category, len(serper_data_dict[category]['organic']), len(responses))
+
+    # Compare the ticker with its complementary tickers
+    enter_stage(memory, 'peer_comparison')
+    peer_comparison = None
+    if stock_data and complementary_tickers:
+        from peer_comparison import build_peer_comparison
+        logging.info("Building peer comparison for %s against %s...", ticker, complementary_tickers)
+        peer_comparison = checkpoint(ticker, 'peer_comparison', lambda: build_peer_comparison(
+            ticker, stock_data['history'], complementary_tickers, period=stock_period))
 
     # Combine data
     if stock_data and serper_data_dict:
         combined_data = combine_data(stock_data, serper_data_dict)
         # Save combined data
         os.makedirs('data', exist_ok=True)
-        with open('data/combined_data.json', 'w') as f:
+        combined_data_path = f'data/{ticker}_combined_data.json'
+        with open(combined_data_path, 'w') as f:
             json.dump(combined_data, f, indent=4)
-        logging.info("Combined data has been saved to data/combined_data.json.")
+        logging.info("Combined data has been saved to %s.", combined_data_path)
+        # Only the SERPER part is used from here on; drop the serialized history
+        del combined_data['stock_history']
 
         # Select relevant news articles
-        logging.info(f"Selecting top {top_n_articles} relevant news articles...")
-        relevant_articles = select_relevant_news(ticker, combined_data, top_n=top_n_articles)
+        enter_stage(memory, 'selection')
+        deadline = current_deadline()
+        if deadline and deadline.schedule_ratio() < 1.0:
+            # Behind schedule: extract fewer articles, keeping one per required category
+            reduced = min(top_n_articles, max(MIN_DEGRADED_ARTICLES, math.ceil(top_n_articles * deadline.schedule_ratio())))
+            if reduced < top_n_articles:
+                deadline.degrade(f"selecting {reduced} articles instead of {top_n_articles}")
+                top_n_articles = reduced
+        logging.info("Selecting top %s relevant news articles...", top_n_articles)
+        # The open circuits are pinned with the selection so that every pass asks the same question
+        blocked_domains = checkpoint(ticker, 'selection_blocked_domains', lambda: get_blocked_domains(db_path))
+        relevant_articles = checkpoint(ticker, 'selection', lambda: select_relevant_news(
+            ticker, combined_data, top_n=top_n_articles, blocked_domains=blocked_domains, db_path=db_path,
+            exclude_links=prefetcher.failed_links() if prefetcher else None))
         # Save relevant articles for further processing
-        with open('data/relevant_articles.json', 'w') as f:
-            json.dump(relevant_articles, f, indent=4)
-        logging.info("Relevant articles have been saved to data/relevant_articles.json.")
-
-        # Fetch full article content using Jina AI
-        logging.info("Fetching full article content...")
-        successful_articles, failed_articles, domain_failure_count = fetch_full_article_content(relevant_articles, max_retries=3)
-        logging.info(f"Successfully fetched {len(successful_articles)} articles.")
-        if failed_articles:
-            logging.warning(f"Failed to fetch {len(failed_articles)} articles.")
-
-        # Blacklist domains with consistent failures
-        blacklist_domains = set()
-        for domain, count in domain_failure_count.items():
-            if count >= 3:  # Blacklist if failed 3 times
-                blacklist_domains.add(domain)
-                logging.info(f"Blacklisted domain after multiple failures: {domain}")
-
-        # Attempt to replace failed articles, prioritizing missing contexts
-        # Identify which contexts are covered by successful articles
-        covered_contexts = set(article['category'] for article in successful_articles)
-        required_contexts = {'STOCK CONTEXT', 'GEOPOLITICS CONTEXT', 'SECTOR CONTEXT'}
-        missing_contexts = required_contexts - covered_contexts
-
-        while len(successful_articles) < top_n_articles and missing_contexts:
-            needed = top_n_articles - len(successful_articles)
-            logging.info(f"Attempting to select {needed} replacement article(s) to cover missing contexts: {missing_contexts}")
-            # Gather new candidates from missing contexts
-            all_selected_links = set(article['link'] for article in successful_articles)
-            new_candidates = []
-            for context in missing_contexts:
-                serper_data = combined_data['serper_data'].get(context, {})
-                for news in serper_data.get('organic', []):
-                    link = news.get('link', '')
-                    if link and link not in all_selected_links:
-                        domain = get_domain(link)
-                        if domain not in blacklist_domains:
-                            new_candidates.append({
-                                'title': news.get('title', ''),
-                                'snippet': news.get('snippet', ''),
-                                'link': link,
-                                'category': context
-                            })
-
-            if not new_candidates:
-                logging.warning("No more articles available for replacement in missing contexts.")
-                break
-
-            # Use GPT to select the top 'needed' articles from new_candidates
-            articles_text = ""
-            for idx, article in enumerate(new_candidates):
-                articles_text += f"Article {idx+1}:\nTitle: {article['title']}\nSnippet: {article['snippet']}\n\n"
-
-            prompt = f"""
-Based on the following articles, select the top {needed} most relevant to {ticker}'s stock performance, ensuring coverage of the missing contexts: {', '.join(missing_contexts)}.
-
-Articles:
-{articles_text}
-
-Please provide a list of the article numbers that are most relevant, formatted as a comma-separated list (e.g., "Selected articles: 1, 2, 3").
-"""
-
-            try:
-                response = openai.ChatCompletion.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=150,
-                    n=1,
-                    stop=None,
-                    temperature=0.5,
-                )
-
-                gpt_reply = response['choices'][0]['message']['content'].strip()
-                # Extract article numbers from GPT response
-                match = re.search(r'Selected articles:\s*(.*)', gpt_reply, re.IGNORECASE)
-                if match:
-                    article_numbers = re.findall(r'\d+', match.group(1))
-                    selected_indices = [int(num)-1 for num in article_numbers if num.isdigit()]
-                else:
-                    logging.error("Could not parse selected articles from GPT response.")
-                    selected_indices = []
-
-                # Remove duplicates and ensure valid indices
-                selected_indices = list(set(selected_indices))
-                selected_indices = [idx for idx in selected_indices if 0 <= idx < len(new_candidates)]
-
-                # Get the selected articles
-                gpt_selected_articles = [new_candidates[idx] for idx in selected_indices]
-
-                if not gpt_selected_articles:
-                    logging.warning("No valid articles selected by GPT for replacement.")
-                    break
-
-                # Fetch the content of the selected replacement articles
-                logging.info(f"Fetching content for {len(gpt_selected_articles)} replacement article(s)...")
-                replacement_success, replacement_failed, replacement_domain_failure_count = fetch_full_article_content(gpt_selected_articles, max_retries=3)
-                successful_articles.extend(replacement_success)
-                if replacement_failed:
-                    logging.warning(f"Failed to fetch {len(replacement_failed)} replacement article(s).")
-                    for article in replacement_failed:
-                        url = article.get('link', '')
-                        domain = get_domain(url)
-                        if domain:
-                            blacklist_domains.add(domain)
-                            logging.info(f"Blacklisted domain: {domain}")
-
-                # Update covered_contexts and missing_contexts
-                for article in replacement_success:
-                    covered_contexts.add(article['category'])
-                missing_contexts = required_contexts - covered_contexts
-
-                # Update blacklist_domains based on replacement failures
-                for domain, count in replacement_domain_failure_count.items():
-                    if count >= 3:
-                        blacklist_domains.add(domain)
-                        logging.info(f"Blacklisted domain after multiple failures: {domain}")
-
-            except openai.error.InvalidRequestError as e:
-                logging.error(f"OpenAI API request exceeded token limit: {e}")
-                break
-            except Exception as e:
-                logging.error(f"An error occurred during GPT analysis: {e}")
-                break
-
-        # If still not enough articles, attempt to fill with any available articles excluding blacklisted domains
-        if len(successful_articles) < top_n_articles:
-            needed = top_n_articles - len(successful_articles)
-            logging.info(f"Attempting to select {needed} additional replacement article(s) from any context.")
-            all_selected_links = set(article['link'] for article in successful_articles)
-            new_candidates = []
-            for category, serper_data in combined_data['serper_data'].items():
-                for news in serper_data.get('organic', []):
-                    link = news.get('link', '')
-                    if link and link not in all_selected_links:
-                        domain = get_domain(link)
-                        if domain not in blacklist_domains:
-                            new_candidates.append({
-                                'title': news.get('title', ''),
-                                'snippet': news.get('snippet', ''),
-                                'link': link,
-                                'category': category
-                            })
-
-            if new_candidates:
-                # Use GPT to select the top 'needed' articles from new_candidates
-                articles_text = ""
-                for idx, article in enumerate(new_candidates):
-                    articles_text += f"Article {idx+1}:\nTitle: {article['title']}\nSnippet: {article['snippet']}\n\n"
-
-                prompt = f"""
-Based on the following articles, select the top {needed} most relevant to {ticker}'s stock performance.
-
-Articles:
-{articles_text}
-
-Please provide a list of the article numbers that are most relevant, formatted as a comma-separated list (e.g., "Selected articles: 1, 2, 3").
-"""
-
-                try:
-                    response = openai.ChatCompletion.create(
-                        model="gpt-3.5-turbo",
-                        messages=[
-                            {"role": "user", "content": prompt}
-                        ],
-                        max_tokens=150,
-                        n=1,
-                        stop=None,
-                        temperature=0.5,
-                    )
-
-                    gpt_reply = response['choices'][0]['message']['content'].strip()
-                    # Extract article numbers from GPT response
-                    match = re.search(r'Selected articles:\s*(.*)', gpt_reply, re.IGNORECASE)
-                    if match:
-                        article_numbers = re.findall(r'\d+', match.group(1))
-                        selected_indices = [int(num)-1 for num in article_numbers if num.isdigit()]
-                    else:
-                        logging.error("Could not parse selected articles from GPT response.")
-                        selected_indices = []
-
-                    # Remove duplicates and ensure valid indices
-                    selected_indices = list(set(selected_indices))
-                    selected_indices = [idx for idx in selected_indices if 0 <= idx < len(new_candidates)]
-
-                    # Get the selected articles
-                    gpt_selected_articles = [new_candidates[idx] for idx in selected_indices]
-
-                    if not gpt_selected_articles:
-                        logging.warning("No valid articles selected by GPT for additional replacement.")
-                        pass
-                    else:
-                        # Fetch the content of the selected replacement articles
-                        logging.info(f"Fetching content for {len(gpt_selected_articles)} additional replacement article(s)...")
-                        replacement_success, replacement_failed, replacement_domain_failure_count = fetch_full_article_content(gpt_selected_articles, max_retries=3)
-                        successful_articles.extend(replacement_success)
-                        if replacement_failed:
-                            logging.warning(f"Failed to fetch {len(replacement_failed)} additional replacement article(s).")
-                            for article in replacement_failed:
-                                url = article.get('link', '')
-                                domain = get_domain(url)
-                                if domain:
-                                    blacklist_domains.add(domain)
-                                    logging.info(f"Blacklisted domain: {domain}")
-
-                        # Update blacklist_domains based on replacement failures
-                        for domain, count in replacement_domain_failure_count.items():
-                            if count >= 3:
-                                blacklist_domains.add(domain)
-                                logging.info(f"Blacklisted domain after multiple failures: {domain}")
-
-                except openai.error.InvalidRequestError as e:
-                    logging.error(f"OpenAI API request exceeded token limit: {e}")
-                except Exception as e:
-                    logging.error(f"An error occurred during GPT analysis: {e}")
-
-        # Trim the successful_articles to top_n_articles
-        final_articles = successful_articles[:top_n_articles]
-        logging.info(f"Final number of articles selected: {len(final_articles)}")
-
-        # Re-save full_articles.txt with the final articles
+        relevant_articles_path = f'data/{ticker}_relevant_articles.json'
+        with open(relevant_articles_path, 'w') as f:
+            json.dump([article.to_dict() for article in relevant_articles], f, indent=4)
+        logging.info("Relevant articles have been saved to %s.", relevant_articles_path)
+
+        # Fetch the full content of the selected articles, replacing those that fail
+        final_articles = memory.spill_articles(checkpoint(ticker, 'articles', lambda: extract_articles(
+            ticker, args, memory, combined_data, relevant_articles, top_n_articles, prefetcher, run_date)))
+        if prefetcher:
+            prefetcher.close()
+        logging.info("Final number of articles selected: %s", len(final_articles))
+
+        # Save the final articles to the ticker's own file
         combined_content_final = ""
         for article in final_articles:
-            title = article.get('title', '')
-            link = article.get('link', '')
-            category = article.get('category', 'OTHER')
-            full_content = article.get('full_content', '')
-            combined_content_final += f"Title: {title}\nLink: {link}\nCategory: {category}\nText:\n{full_content}\n\n"
+            combined_content_final += (f"Title: {article.title}\nLink: {article.link}\nCategory: {article.category}\n"
+                                       f"Text:\n{article.full_content}\n\n")
 
         if combined_content_final:
-            with open("data/full_articles.txt", 'w', encoding='utf-8') as f:
+            full_articles_path = f'data/{ticker}_full_articles.txt'
+            with open(full_articles_path, 'w', encoding='utf-8') as f:
                 f.write(combined_content_final.strip())
-            logging.info("Final full articles have been saved to data/full_articles.txt.")
+            logging.info("Final full articles have been saved to %s.", full_articles_path)
+            store_articles(ticker, final_articles, as_of_date=run_date, db_path=db_path)
         else:
             logging.warning("No articles were successfully fetched after replacements.")
+        del combined_content_final
 
         # Generate the final report
-
+        enter_stage(memory, 'report')
+
+        from report_generator import generate_report, REPORT_MAX_TOKENS
+        report_max_tokens = REPORT_MAX_TOKENS
+        if deadline:
+            affordable = int(deadline.stage_remaining() * REPORT_TOKENS_PER_SECOND)
+            if affordable < REPORT_MAX_TOKENS:
+                report_max_tokens = max(MIN_REPORT_TOKENS, affordable)
+                deadline.degrade(f"limiting the report to {report_max_tokens} tokens")
         logging.info("Generating the final report...")
         author_name = 'Gabriel T. H. S. Santos'
-        report = generate_report(ticker, stock_data, max_articles=top_n_articles, author_name=author_name)
+        report = generate_report(ticker, stock_data, max_articles=top_n_articles, articles=final_articles,
+                                 peer_comparison=peer_comparison, summarize=args.summarize,
+                                 sectioned=args.sectioned, max_tokens=report_max_tokens, db_path=db_path)
         if report:
-            # Ensure outputs directory exists
-            os.makedirs('outputs', exist_ok=True)
-            # Save the report as a text file
+            store_report(ticker, report, as_of_date=run_date, db_path=db_path)
+            index_report(ticker, report, as_of_date=run_date, db_path=db_path)
+            # Save the report as a text file, versioned in the artifact store
             report_file_path = f'outputs/{ticker}_final_report.txt'
-            with open(report_file_path, 'w', encoding='utf-8') as f:
-                f.write(report)
-            logging.info(f"Final report has been saved to {report_file_path}.")
+            report_key = input_key('report', 'txt', report)
+            store.put_bytes(report_key, 'report', 'txt', report.encode('utf-8'))
+            version = store.publish(report_key, report_file_path, ticker, 'final_report.txt')
+            logging.info("Final report has been saved to %s (version %s).", report_file_path, version)
+
+            # Render the requested output formats from the text report
+            enter_stage(memory, 'render')
+            if args.formats and deadline and not deadline.remaining():
+                deadline.degrade(f"skipping the {', '.join(args.formats)} rendering; the text report is saved")
+            elif args.formats:
+                from report_rendering import render_report
+                render_report(report, ticker, stock_data, formats=args.formats, author_name=author_name,
+                              peer_comparison=peer_comparison, store=store)
         else:
             logging.error("Failed to generate the final report.")
+        return report
     else:
         logging.error("Data combination failed due to previous errors.")
-        sys.exit(1)
-    # end of main()
+        if prefetcher:
+            prefetcher.close()
+        return None
+    # end of run_pipeline()
 
 if __name__ == '__main__':
     try:
         main()
     except Exception as e:
-        logging.exception(f"An unexpected error occurred: {e}")
+        logging.exception("An unexpected error occurred: %s", e)
         sys.exit(1)
\ No newline at end of file
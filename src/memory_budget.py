@@ -0,0 +1,243 @@
+# src/memory_budget.py
+
+import os
+import sys
+import mmap
+import time
+import logging
+import tempfile
+import threading
+import tracemalloc
+
+MB = 1024 * 1024
+# Arrays are aligned to this many bytes in the spill file so memory-mapped views are aligned
+ARRAY_ALIGNMENT = 64
+
+
+def current_rss_bytes():
+    """
+    Returns the resident set size of the process. Where /proc is not available, the peak RSS is
+    returned instead (or 0 if that is not available either).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class SpilledText:
+    """
+    Handle to a text stored in a spill file. str() reads it back through a memory map, so the text
+    only takes memory while it is being used.
+    """
+    __slots__ = ('_store', '_offset', '_length')
+
+    def __init__(self, store, offset, length):
+        self._store = store
+        self._offset = offset
+        self._length = length
+
+    def __str__(self):
+        return self._store.read(self._offset, self._length).decode('utf-8')
+
+    def __reduce__(self):
+        # Pickled (e.g. into a batch checkpoint) as the text itself; the spill file belongs to this run
+        return (str, (str(self),))
+
+
+class SpillStore:
+    """
+    Append-only temporary file holding spilled article bodies and price arrays. The file is
+    deleted when it is closed (or when the process exits).
+    """
+
+    def __init__(self, directory=None):
+        self._file = tempfile.TemporaryFile(prefix='hsfinance-spill-', dir=directory)
+        self._size = 0
+        self._map = None
+        self._lock = threading.Lock()
+        self.texts = 0
+        self.arrays = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    def _append(self, data, alignment=1):
+        with self._lock:
+            padding = -self._size % alignment
+            if padding:
+                self._file.write(b'\0' * padding)
+            offset = self._size + padding
+            self._file.write(data)
+            self._file.flush()
+            self._size = offset + len(data)
+        return offset
+
+    def read(self, offset, length):
+        """
+        Returns length bytes starting at offset.
+        """
+        if not length:
+            return b''
+        with self._lock:
+            if self._map is None or len(self._map) < offset + length:
+                # The file grew since it was mapped; existing handles read through the new map
+                if self._map is not None:
+                    self._map.close()
+                self._map = mmap.mmap(self._file.fileno(), self._size, access=mmap.ACCESS_READ)
+            return self._map[offset:offset + length]
+
+    def put_text(self, text):
+        """
+        Writes a text to the spill file and returns a SpilledText handle to it.
+        """
+        data = text.encode('utf-8')
+        self.texts += 1
+        return SpilledText(self, self._append(data), len(data))
+
+    def put_array(self, array):
+        """
+        Writes an array to the spill file and returns a read-only memory-mapped array with its contents.
+        """
+        import numpy as np
+        if not array.size or isinstance(array, np.memmap):
+            return array
+        array = np.ascontiguousarray(array)
+        offset = self._append(array.tobytes(), alignment=ARRAY_ALIGNMENT)
+        self.arrays += 1
+        return np.memmap(self._file, dtype=array.dtype, mode='r', offset=offset, shape=array.shape)
+
+    def close(self):
+        """
+        Deletes the spill file. Memory-mapped arrays already handed out stay readable.
+        """
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._file.close()
+
+
+class MemoryTracker:
+    """
+    Per-stage memory accounting of a pipeline run, with an optional memory budget.
+    At each stage boundary the RSS is sampled and, when tracing is enabled, the tracemalloc peak of
+    the stage is recorded. When the RSS is over the budget, spill_articles and spill_bars move
+    article bodies and price arrays to a memory-mapped spill file.
+    """
+
+    def __init__(self, budget_mb=None, trace=False, spill_dir=None):
+        self.budget_mb = budget_mb or None
+        self.spill_dir = spill_dir
+        self.stages = []
+        self._stage = None
+        self._store = None
+        self._started_tracing = trace and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        self.peak_rss = current_rss_bytes()
+
+    def _sample(self):
+        rss = current_rss_bytes()
+        self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+    def _close_stage(self):
+        if self._stage is None:
+            return
+        rss = self._sample()
+        stage = self._stage
+        stage['seconds'] = round(time.monotonic() - stage.pop('_started_at'), 3)
+        stage['rss_end_mb'] = round(rss / MB, 1)
+        stage['rss_delta_mb'] = round(stage['rss_end_mb'] - stage['rss_start_mb'], 1)
+        if tracemalloc.is_tracing():
+            stage['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / MB, 1)
+            tracemalloc.reset_peak()
+        self.stages.append(stage)
+        self._stage = None
+
+    def enter_stage(self, name):
+        """
+        Closes the current stage's record and starts one for the named stage.
+        """
+        self._close_stage()
+        self._stage = {'stage': name, 'rss_start_mb': round(self._sample() / MB, 1), '_started_at': time.monotonic()}
+
+    def over_budget(self):
+        """
+        Returns True if a budget is set and the RSS is over it.
+        """
+        return self.budget_mb is not None and self._sample() > self.budget_mb * MB
+
+    def _spill_store(self):
+        if self._store is None:
+            self._store = SpillStore(self.spill_dir)
+        return self._store
+
+    def spill_articles(self, articles):
+        """
+        Returns the articles with their bodies moved to the spill file if the run is over budget,
+        otherwise the articles unchanged.
+        """
+        if not articles or not self.over_budget():
+            return articles
+        from records import Article
+        store = self._spill_store()
+        texts_before = store.texts
+        spilled = [
+            article if not isinstance(article.content, str) else Article(hit=article.hit, content=store.put_text(article.content))
+            for article in articles
+        ]
+        if store.texts > texts_before:
+            logging.info("Over the %s MB memory budget: spilled %s article bodies to disk.", self.budget_mb, store.texts - texts_before)
+        return spilled
+
+    def spill_bars(self, bars):
+        """
+        Returns the bars (records.PriceBars or IntradayBars) backed by the spill file if the run is
+        over budget, otherwise the bars unchanged.
+        """
+        if bars is None or not len(bars) or not self.over_budget():
+            return bars
+        logging.info("Over the %s MB memory budget: spilled %s bars to disk.", self.budget_mb, len(bars))
+        return bars.map_arrays(self._spill_store().put_array)
+
+    def finish(self):
+        """
+        Closes the last stage and stops tracing if this tracker started it. The spill file is kept
+        until close() since spilled texts read from it.
+        """
+        self._close_stage()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def close(self):
+        """
+        Deletes the spill file.
+        """
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def summary(self):
+        """
+        Returns the memory accounting of the run as a JSON-serializable dictionary.
+        """
+        return {
+            'budget_mb': self.budget_mb,
+            'peak_rss_mb': round(self.peak_rss / MB, 1),
+            'spilled_texts': self._store.texts if self._store else 0,
+            'spilled_arrays': self._store.arrays if self._store else 0,
+            'spill_file_mb': round(self._store.size / MB, 1) if self._store else 0.0,
+            'stages': self.stages
+        }
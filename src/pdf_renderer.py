@@ -0,0 +1,332 @@
+# src/pdf_renderer.py
+
+import logging
+from functools import lru_cache
+import matplotlib
+# Select the non-interactive backend before pyplot is imported so no GUI toolkit is probed
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import pandas as pd
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import (
+    BaseDocTemplate, Paragraph, Spacer, Table, TableStyle,
+    PageBreak, Image, Frame, PageTemplate
+)
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.units import inch
+from reportlab.lib.colors import HexColor
+
+from artifact_store import ArtifactStore, input_key
+
+# Part of every chart's artifact key; bump it when the drawing code changes so stored charts are redrawn
+CHART_VERSION = 1
+
+
+def _chart(store, name, ticker, inputs, draw):
+    """
+    Returns the path of a chart rendered by draw(path), taken from the artifact store when a chart
+    with the same name, ticker and inputs was rendered before. Returns None if the chart failed.
+    """
+    key = input_key('chart', CHART_VERSION, name, ticker, inputs)
+    return store.get_or_create(key, 'chart', 'png', draw)
+
+
+def generate_stock_charts(bars, ticker, store=None):
+    """
+    Generates charts of the stock's recent performance (records.PriceBars) and saves them as images.
+    Returns a list of file paths to the generated charts.
+    """
+    store = store or ArtifactStore()
+    dates = pd.DatetimeIndex(bars.dates)
+
+    # Price over time
+    def draw_price(chart_path):
+        plt.figure(figsize=(10, 6))
+        plt.plot(dates, bars.close, label='Close Price')
+        plt.title(f'{ticker} Stock Price Over Time')
+        plt.xlabel('Date')
+        plt.ylabel('Close Price')
+        plt.legend()
+        plt.grid(True)
+        plt.savefig(chart_path)
+        plt.close()
+
+    # Volume over time
+    def draw_volume(chart_path):
+        plt.figure(figsize=(10, 6))
+        plt.bar(dates, bars.volume, label='Volume')
+        plt.title(f'{ticker} Trading Volume Over Time')
+        plt.xlabel('Date')
+        plt.ylabel('Volume')
+        plt.legend()
+        plt.grid(True)
+        plt.savefig(chart_path)
+        plt.close()
+
+    chart_paths = [
+        _chart(store, 'price', ticker, (bars.dates, bars.close), draw_price),
+        _chart(store, 'volume', ticker, (bars.dates, bars.volume), draw_volume)
+    ]
+    return [chart_path for chart_path in chart_paths if chart_path]
+
+
+def generate_indicator_charts(indicators, ticker, store=None):
+    """
+    Generates technical-indicator charts (moving averages, RSI, MACD and drawdown) for the ticker.
+    Returns a list of file paths to the generated charts.
+    """
+    if not indicators or ticker not in indicators['close'].columns:
+        return []
+
+    store = store or ArtifactStore()
+    close = indicators['close'][ticker]
+
+    # Price with moving averages
+    def draw_moving_averages(chart_path):
+        plt.figure(figsize=(10, 6))
+        plt.plot(close.index, close, label='Close Price')
+        plt.plot(close.index, indicators['sma_50'][ticker], label='SMA 50')
+        plt.plot(close.index, indicators['sma_200'][ticker], label='SMA 200')
+        plt.plot(close.index, indicators['ema_12'][ticker], label='EMA 12', alpha=0.6)
+        plt.title(f'{ticker} Price and Moving Averages')
+        plt.xlabel('Date')
+        plt.ylabel('Price')
+        plt.legend()
+        plt.grid(True)
+        plt.savefig(chart_path)
+        plt.close()
+
+    # RSI, MACD and drawdown on a shared date axis
+    def draw_indicators(chart_path):
+        fig, (ax_rsi, ax_macd, ax_drawdown) = plt.subplots(3, 1, figsize=(10, 9), sharex=True)
+        ax_rsi.plot(close.index, indicators['rsi_14'][ticker], label='RSI 14')
+        ax_rsi.axhline(70, color='red', linestyle='--', linewidth=0.8)
+        ax_rsi.axhline(30, color='green', linestyle='--', linewidth=0.8)
+        ax_rsi.set_ylim(0, 100)
+        ax_rsi.set_title(f'{ticker} Momentum and Drawdown')
+        ax_rsi.legend()
+        ax_rsi.grid(True)
+
+        ax_macd.plot(close.index, indicators['macd'][ticker], label='MACD')
+        ax_macd.plot(close.index, indicators['macd_signal'][ticker], label='Signal')
+        ax_macd.bar(close.index, indicators['macd_histogram'][ticker], label='Histogram', color='grey')
+        ax_macd.legend()
+        ax_macd.grid(True)
+
+        ax_drawdown.fill_between(close.index, indicators['drawdown'][ticker] * 100, 0, color='firebrick', alpha=0.4)
+        ax_drawdown.set_ylabel('Drawdown (%)')
+        ax_drawdown.set_xlabel('Date')
+        ax_drawdown.grid(True)
+
+        fig.tight_layout()
+        fig.savefig(chart_path)
+        plt.close(fig)
+
+    moving_averages = [indicators[name][ticker] for name in ('sma_50', 'sma_200', 'ema_12')]
+    momentum = [indicators[name][ticker] for name in ('rsi_14', 'macd', 'macd_signal', 'macd_histogram', 'drawdown')]
+    chart_paths = [
+        _chart(store, 'moving_averages', ticker, (close, moving_averages), draw_moving_averages),
+        _chart(store, 'indicators', ticker, momentum, draw_indicators)
+    ]
+    return [chart_path for chart_path in chart_paths if chart_path]
+
+
+def generate_intraday_chart(intraday, ticker, max_points=1000, store=None):
+    """
+    Generates a chart of intraday close prices (records.IntradayBars), resampled so that at most
+    max_points bars are drawn. Returns the file path to the generated chart, or None if there are no bars.
+    """
+    if intraday is None or not len(intraday):
+        return None
+    store = store or ArtifactStore()
+    bars = intraday.resample_for_display(max_points)
+
+    def draw(chart_path):
+        plt.figure(figsize=(10, 6))
+        # Plot against the bar position so overnight and weekend gaps are not drawn as flat lines
+        plt.plot(range(len(bars)), bars.close, label=f'Close ({bars.interval})')
+        positions = list(range(0, len(bars), max(len(bars) // 6, 1)))
+        plt.xticks(positions, [str(bars.dates[position]).replace('T', ' ')[:16] for position in positions], rotation=20)
+        plt.title(f'{ticker} Intraday Price (UTC)')
+        plt.ylabel('Price')
+        plt.legend()
+        plt.grid(True)
+        plt.tight_layout()
+        plt.savefig(chart_path)
+        plt.close()
+
+    return _chart(store, 'intraday', ticker, (bars.interval, bars.dates, bars.close), draw)
+
+
+def generate_peer_comparison_chart(comparison, store=None):
+    """
+    Generates a chart of the target's and peers' prices normalized to 100 at the first common date.
+    Returns the file path to the generated chart, or None if there is no comparison.
+    """
+    if not comparison:
+        return None
+
+    store = store or ArtifactStore()
+    normalized = comparison['normalized']
+    target = comparison['tickers'][0]
+
+    def draw(chart_path):
+        plt.figure(figsize=(10, 6))
+        for column in normalized.columns:
+            plt.plot(normalized.index, normalized[column], label=column,
+                     linewidth=2.5 if column == target else 1.2)
+        plt.axhline(100, color='black', linestyle='--', linewidth=0.8)
+        plt.title(f'{target} vs Peers (Normalized to 100)')
+        plt.xlabel('Date')
+        plt.ylabel('Normalized Price')
+        plt.legend()
+        plt.grid(True)
+        plt.savefig(chart_path)
+        plt.close()
+
+    return _chart(store, 'peer_comparison', target, normalized, draw)
+
+
+def add_header_footer(canvas, doc):
+    """
+    Adds the header and footer to each page.
+    """
+    canvas.saveState()
+    # Header
+    header_text = f"{doc.stock_name} ({doc.ticker})"
+    canvas.setFont('Helvetica-Bold', 10)
+    canvas.drawString(inch, doc.height + doc.topMargin - 0.5 * inch, header_text)
+    # Footer
+    footer_text = f"Page {canvas.getPageNumber()} | Generated on: {doc.generated_date}"
+    canvas.setFont('Helvetica', 9)
+    canvas.drawString(inch, 0.5 * inch, footer_text)
+    canvas.restoreState()
+
+
+@lru_cache(maxsize=1)
+def _pdf_styles():
+    """
+    Builds the paragraph and table styles once per process; every PDF of a batch reuses them.
+    """
+    normal_style = ParagraphStyle(
+        name='NormalStyle', fontName='Helvetica', fontSize=12, leading=14)
+    header_style = ParagraphStyle(
+        name='HeaderStyle', fontName='Helvetica-Bold', fontSize=18, leading=22, spaceAfter=10, spaceBefore=20)
+    return {
+        'title': ParagraphStyle(
+            name='TitleStyle', fontName='Helvetica-Bold', fontSize=24, leading=28, alignment=TA_CENTER, spaceAfter=20),
+        'subtitle': ParagraphStyle(
+            name='SubtitleStyle', fontName='Helvetica', fontSize=14, leading=18, alignment=TA_CENTER, spaceAfter=10),
+        'normal': normal_style,
+        'bullet': ParagraphStyle(
+            name='BulletStyle', parent=normal_style, leftIndent=20, bulletIndent=10),
+        'small': ParagraphStyle(
+            name='SmallStyle', parent=normal_style, fontSize=10),
+        # Header style with background color
+        'header_background': ParagraphStyle(
+            name='HeaderBackgroundStyle', parent=header_style, backColor=HexColor('#D3D3D3'), alignment=TA_CENTER),
+        'table': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, -1), colors.white),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+        ])
+    }
+
+
+def save_report_as_pdf(model, pdf_file_path, store=None):
+    """
+    Saves a parsed report (report_rendering.ReportModel) as a professionally formatted PDF file.
+    Charts are taken from the artifact store (store, or the default one) when their inputs are unchanged.
+    Returns True if the PDF was written.
+    """
+    try:
+        ticker = model.ticker
+        doc = BaseDocTemplate(pdf_file_path, pagesize=letter,
+                              leftMargin=inch, rightMargin=inch,
+                              topMargin=inch, bottomMargin=inch)
+
+        # Store stock name, ticker, and generated date in the doc for access in header/footer
+        doc.stock_name = model.long_name
+        doc.ticker = ticker
+        doc.generated_date = model.generated_date
+        doc.author_name = model.author_name
+
+        # Define frames
+        frame_cover = Frame(doc.leftMargin, doc.bottomMargin, doc.width, doc.height, id='cover_frame')
+        frame_content = Frame(doc.leftMargin, doc.bottomMargin, doc.width, doc.height - inch, id='content_frame')
+
+        # Define PageTemplates
+        cover_template = PageTemplate(id='CoverPage', frames=frame_cover)
+        content_template = PageTemplate(id='ContentPage', frames=frame_content, onPage=add_header_footer)
+
+        doc.addPageTemplates([cover_template, content_template])
+
+        elements = []
+        styles = _pdf_styles()
+        header_background_style = styles['header_background']
+
+        # Cover Page
+        cover_title = Paragraph(f"{ticker} Stock Analysis Report", styles['title'])
+        cover_subtitle = Paragraph(f"Generated on: {doc.generated_date}", styles['subtitle'])
+        cover_author = Paragraph(f"Developed by: {model.author_name}", styles['subtitle'])
+        elements.extend([Spacer(1, 2*inch), cover_title, Spacer(1, 0.2*inch), cover_subtitle, cover_author, PageBreak()])
+
+        # Analysis of Recent Performance
+        elements.append(Paragraph("Analysis of Recent Performance", header_background_style))
+        table = Table([list(row) for row in model.summary_rows], hAlign='LEFT', colWidths=[150, 200])
+        table.setStyle(styles['table'])
+        elements.append(table)
+        elements.append(Spacer(1, 12))
+
+        # Generate and add stock summary charts
+        store = store or ArtifactStore()
+        chart_paths = generate_stock_charts(model.bars, ticker, store=store) if len(model.bars) else []
+        chart_paths.extend(generate_indicator_charts(model.indicators, ticker, store=store))
+        intraday_chart_path = generate_intraday_chart(model.intraday, ticker, store=store)
+        if intraday_chart_path:
+            chart_paths.append(intraday_chart_path)
+        for chart_path in chart_paths:
+            elements.append(Image(chart_path, width=500, height=300))
+            elements.append(Spacer(1, 12))
+
+        # Peer comparison table and chart
+        if model.peer_rows:
+            elements.append(Paragraph("Peer Comparison", header_background_style))
+            peer_table = Table([list(model.peer_header)] + [list(row) for row in model.peer_rows], hAlign='LEFT')
+            peer_table.setStyle(styles['table'])
+            elements.append(peer_table)
+            elements.append(Spacer(1, 12))
+            peer_chart_path = generate_peer_comparison_chart(model.peer_comparison, store=store)
+            if peer_chart_path:
+                elements.append(Image(peer_chart_path, width=500, height=300))
+                elements.append(Spacer(1, 12))
+
+        # Report sections
+        for section in model.sections:
+            elements.append(Paragraph(section.heading, header_background_style))
+            for kind, text in section.blocks:
+                if kind == 'bullet':
+                    elements.append(Paragraph(f'• {text}', styles['bullet']))
+                else:
+                    elements.append(Paragraph(text, styles['normal']))
+                elements.append(Spacer(1, 6))
+            elements.append(Spacer(1, 12))
+
+        # Sources section
+        if model.sources:
+            elements.append(Paragraph("Sources", header_background_style))
+            for source in model.sources:
+                elements.append(Paragraph(source, styles['small']))
+                elements.append(Spacer(1, 4))
+
+        # Build the PDF
+        doc.build(elements)
+        return True
+    except Exception as e:
+        logging.error("An error occurred while saving the report as PDF: %s", e)
+        return False
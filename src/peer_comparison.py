@@ -0,0 +1,169 @@
+# src/peer_comparison.py
+
+import logging
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from indicators import build_price_panel, TRADING_DAYS_PER_YEAR
+from deadline import network_timeout
+
+
+def _normalize_index(frame):
+    """
+    Drops timezone information and intraday components so panels from different sources align by date.
+    """
+    index = pd.DatetimeIndex(frame.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    frame.index = index.normalize()
+    return frame[~frame.index.duplicated(keep='last')]
+
+
+def fetch_peer_close_panel(tickers, period='1y'):
+    """
+    Downloads the close prices of several tickers in a single bulk request. Prices are adjusted for
+    dividends and splits, like the Ticker.history prices of the target they are compared with.
+    Returns a DataFrame indexed by date with one column per ticker (empty on failure).
+    """
+    if not tickers:
+        return pd.DataFrame()
+    try:
+        data = yf.download(tickers, period=period, group_by='column', auto_adjust=True,
+                           threads=True, progress=False, timeout=network_timeout(10))
+        if data is None or data.empty:
+            logging.warning("No peer history returned for %s.", tickers)
+            return pd.DataFrame()
+        close = data['Close']
+        if isinstance(close, pd.Series):
+            close = close.to_frame(name=tickers[0])
+        close = close.dropna(axis=1, how='all')
+        missing = [t for t in tickers if t not in close.columns]
+        if missing:
+            logging.warning("No peer history available for: %s", missing)
+        return _normalize_index(close.astype(np.float64))
+    except Exception as e:
+        logging.error("An error occurred while fetching peer history for %s: %s", tickers, e)
+        return pd.DataFrame()
+
+
+def align_panel(ticker, history, peer_close):
+    """
+    Aligns the target ticker's close prices with the peer panel on their common dates.
+    The target is always the first column.
+    """
+    target_close = build_price_panel({ticker: history}, 'Close')
+    if target_close.empty:
+        return pd.DataFrame()
+    target_close = _normalize_index(target_close)
+    peers = peer_close.drop(columns=[ticker], errors='ignore')
+    panel = pd.concat([target_close, peers], axis=1, join='inner')
+    # Only keep dates on which every series traded
+    return panel.dropna(how='any')
+
+
+def compute_peer_matrix(panel, periods_per_year=TRADING_DAYS_PER_YEAR):
+    """
+    Computes correlation, beta and relative-performance matrices over an aligned close panel.
+    All statistics are computed with array operations over the whole panel.
+    Returns a dictionary of DataFrames/Series, or None if there is not enough overlapping history.
+    """
+    if panel.shape[0] < 3 or panel.shape[1] < 2:
+        return None
+
+    tickers = list(panel.columns)
+    prices = panel.to_numpy(dtype=np.float64)
+    returns = prices[1:] / prices[:-1] - 1.0
+
+    covariance = np.cov(returns, rowvar=False)
+    variances = np.diag(covariance)
+    std = np.sqrt(variances)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = covariance / np.outer(std, std)
+        # beta[i, j]: sensitivity of ticker i's returns to ticker j's returns
+        beta = covariance / variances[np.newaxis, :]
+
+    total_return = prices[-1] / prices[0] - 1.0
+    relative_performance = total_return[:, np.newaxis] - total_return[np.newaxis, :]
+    volatility = returns.std(axis=0, ddof=1) * np.sqrt(periods_per_year)
+    normalized = panel / panel.iloc[0] * 100.0
+
+    return {
+        'tickers': tickers,
+        'start': panel.index[0],
+        'end': panel.index[-1],
+        'observations': int(panel.shape[0]),
+        'correlation': pd.DataFrame(correlation, index=tickers, columns=tickers),
+        'beta': pd.DataFrame(beta, index=tickers, columns=tickers),
+        'relative_performance': pd.DataFrame(relative_performance, index=tickers, columns=tickers),
+        'total_return': pd.Series(total_return, index=tickers),
+        'volatility': pd.Series(volatility, index=tickers),
+        'normalized': normalized,
+    }
+
+
+def build_peer_comparison(ticker, history, peer_tickers, period='1y'):
+    """
+    Runs the peer-comparison stage: bulk-fetches peer history, aligns it with the target's history
+    and computes the comparison matrices. Returns None if no comparison could be made.
+    """
+    peer_tickers = [t for t in peer_tickers if t and t != ticker]
+    if not peer_tickers:
+        logging.warning("No peers available to compare with %s.", ticker)
+        return None
+
+    peer_close = fetch_peer_close_panel(peer_tickers, period=period)
+    if peer_close.empty:
+        return None
+
+    panel = align_panel(ticker, history, peer_close)
+    comparison = compute_peer_matrix(panel)
+    if comparison is None:
+        logging.warning("Not enough overlapping history to compare %s with %s.", ticker, peer_tickers)
+        return None
+
+    logging.info("Compared %s with %s over %s common dates.", ticker, comparison['tickers'][1:], comparison['observations'])
+    return comparison
+
+
+def peer_comparison_rows(comparison):
+    """
+    Returns one row per ticker (target first) with the statistics shown in the report:
+    ticker, period return, volatility, correlation with the target, beta of the target against the
+    ticker, and the target's outperformance versus the ticker.
+    """
+    target = comparison['tickers'][0]
+    rows = []
+    for peer in comparison['tickers']:
+        rows.append({
+            'ticker': peer,
+            'total_return': comparison['total_return'][peer],
+            'volatility': comparison['volatility'][peer],
+            'correlation': comparison['correlation'].loc[target, peer],
+            'beta': comparison['beta'].loc[target, peer],
+            'outperformance': comparison['relative_performance'].loc[target, peer],
+        })
+    return rows
+
+
+def summarize_peer_comparison(comparison):
+    """
+    Produces a compact text block describing the peer comparison for the report prompt.
+    """
+    if not comparison:
+        return ''
+    target = comparison['tickers'][0]
+    lines = [
+        f"Peer comparison of {target} with {', '.join(comparison['tickers'][1:])} "
+        f"({comparison['observations']} common trading days, "
+        f"{comparison['start'].strftime('%Y-%m-%d')} to {comparison['end'].strftime('%Y-%m-%d')}):"
+    ]
+    for row in peer_comparison_rows(comparison):
+        line = (f"- {row['ticker']}: period return {row['total_return']:+.2%}, "
+                f"annualized volatility {row['volatility']:.2%}")
+        if row['ticker'] != target:
+            line += (f", correlation with {target} {row['correlation']:.2f}, "
+                     f"{target} beta vs {row['ticker']} {row['beta']:.2f}, "
+                     f"{target} outperformance {row['outperformance']:+.2%}")
+        lines.append(line)
+    return '\n'.join(lines)
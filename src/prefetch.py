@@ -0,0 +1,115 @@
+# src/prefetch.py
+
+import logging
+import threading
+
+from jina_ai_module import get_jina_headers, fetch_article_text
+from domain_health import get_blocked_domains
+from search_index import index_articles
+from utils import get_domain
+from records import SearchHit, Article
+from structured_logging import ContextThreadPoolExecutor
+
+
+class ArticlePrefetcher:
+    """
+    Speculatively extracts the top-K SERPER candidates of each category in background threads
+    while article selection runs. Selected articles are then served from the prefetched content,
+    failures are known before selection finishes, and unused extractions are either cancelled
+    (if they have not started) or written to the search index for later runs.
+    """
+
+    def __init__(self, ticker, top_k=2, max_workers=4, max_retries=3, use_index=True, as_of_date=None, db_path=None):
+        self.ticker = ticker
+        self.top_k = top_k
+        self.max_retries = max_retries
+        self.use_index = use_index
+        self.as_of_date = as_of_date
+        self.db_path = db_path
+        self.headers = get_jina_headers()
+        self._executor = ContextThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._hits = {}
+        self._claimed = set()
+        self._submitted_by_category = {}
+
+    def submit_candidates(self, category, organic_results):
+        """
+        Starts extracting the top-K candidates of a category, given its merged results in rank
+        (reciprocal rank fusion) order. At most top_k links are submitted per category over the
+        whole run, however many queries the category has. Links from blocked domains and links
+        already submitted are skipped.
+        """
+        if self.headers is None or self.top_k <= 0:
+            return
+        blocked_domains = get_blocked_domains(self.db_path)
+        submitted = 0
+        for news in organic_results:
+            link = news.get('link', '')
+            if not link or get_domain(link) in blocked_domains:
+                continue
+            with self._lock:
+                if self._submitted_by_category.get(category, 0) >= self.top_k:
+                    break
+                if link in self._futures:
+                    continue
+                self._hits[link] = SearchHit.from_result(news, category)
+                self._futures[link] = self._executor.submit(
+                    fetch_article_text, link, self.headers, self.max_retries, self.use_index, self.db_path
+                )
+                self._submitted_by_category[category] = self._submitted_by_category.get(category, 0) + 1
+            submitted += 1
+        if submitted:
+            logging.info("Prefetching %s %s candidate(s) for %s.", submitted, category, self.ticker)
+
+    def claim(self, url):
+        """
+        Returns the (full_text, failure_reason) result for a prefetched URL, waiting for it if the
+        extraction is still running. Returns None if the URL was never prefetched.
+        """
+        with self._lock:
+            future = self._futures.get(url)
+            if future is None:
+                return None
+            self._claimed.add(url)
+        if future.cancelled():
+            return None
+        try:
+            return future.result()
+        except Exception as e:
+            logging.error("Prefetch failed for URL %s: %s", url, e)
+            return None, str(e)
+
+    def failed_links(self):
+        """
+        Returns the links whose prefetch has already completed without content.
+        """
+        with self._lock:
+            items = list(self._futures.items())
+        return {
+            link for link, future in items
+            if future.done() and not future.cancelled() and future.exception() is None and not future.result()[0]
+        }
+
+    def close(self):
+        """
+        Cancels prefetches that have not started and indexes completed but unused extractions
+        so that later runs can reuse them without a network call.
+        """
+        with self._lock:
+            unclaimed = {link: future for link, future in self._futures.items() if link not in self._claimed}
+        cancelled = sum(1 for future in unclaimed.values() if future.cancel())
+        self._executor.shutdown(wait=True)
+
+        cached = []
+        for link, future in unclaimed.items():
+            if future.cancelled() or future.exception() is not None:
+                continue
+            full_text, _ = future.result()
+            if full_text:
+                cached.append(Article(hit=self._hits[link], content=full_text))
+        if cached:
+            index_articles(self.ticker, cached, as_of_date=self.as_of_date, db_path=self.db_path)
+        logging.info("Prefetch summary for %s: %s submitted, %s used, %s cancelled, %s cached for later runs.",
+                     self.ticker, len(self._futures), len(self._claimed), cancelled, len(cached))
@@ -0,0 +1,419 @@
+# src/records.py
+
+from dataclasses import dataclass
+from enum import Enum
+
+import numpy as np
+import pandas as pd
+
+
+class Category(str, Enum):
+    """
+    Report section an article belongs to. Members are singletons, so every record of a category
+    shares one interned value, and they compare and hash equal to their plain string values
+    (Category.STOCK == 'STOCK CONTEXT'), which keeps dictionaries keyed by the strings working.
+    """
+    STOCK = 'STOCK CONTEXT'
+    GEOPOLITICS = 'GEOPOLITICS CONTEXT'
+    SECTOR = 'SECTOR CONTEXT'
+    OTHER = 'OTHER'
+
+    __str__ = str.__str__
+    __format__ = str.__format__
+
+    @classmethod
+    def parse(cls, value):
+        """
+        Returns the category matching a string (case-insensitive), or OTHER if there is none.
+        """
+        if isinstance(value, cls):
+            return value
+        try:
+            return cls(str(value or '').strip().upper())
+        except ValueError:
+            return cls.OTHER
+
+
+# Categories every report tries to cover with at least one article
+REQUIRED_CATEGORIES = (Category.STOCK, Category.GEOPOLITICS, Category.SECTOR)
+
+
+@dataclass(frozen=True, slots=True)
+class SearchHit:
+    """
+    A news search result that is a candidate for the report.
+    """
+    title: str
+    snippet: str
+    link: str
+    category: Category
+    rrf_score: float = 0.0
+
+    @classmethod
+    def from_result(cls, result, category):
+        """
+        Builds a hit from a (merged) SERPER organic result.
+        """
+        return cls(
+            title=result.get('title', ''),
+            snippet=result.get('snippet', ''),
+            link=result.get('link', ''),
+            category=Category.parse(category),
+            rrf_score=result.get('rrf_score', 0.0)
+        )
+
+    def to_dict(self):
+        """
+        Returns the hit as a JSON-serializable dictionary.
+        """
+        return {
+            'title': self.title,
+            'snippet': self.snippet,
+            'link': self.link,
+            'category': self.category.value,
+            'rrf_score': self.rrf_score
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class Article:
+    """
+    A search hit together with its extracted text. The article owns the text; lists of selected,
+    replacement and final articles share the same record instead of copying it.
+    content is the text itself, or a handle to it once a run over its memory budget spilled it
+    to disk (see memory_budget.SpilledText); full_content always returns the text.
+    """
+    hit: SearchHit
+    content: object
+
+    @property
+    def full_content(self):
+        return str(self.content)
+
+    @property
+    def title(self):
+        return self.hit.title
+
+    @property
+    def snippet(self):
+        return self.hit.snippet
+
+    @property
+    def link(self):
+        return self.hit.link
+
+    @property
+    def category(self):
+        return self.hit.category
+
+    def to_dict(self):
+        """
+        Returns the article as a JSON-serializable dictionary.
+        """
+        article = self.hit.to_dict()
+        article['full_content'] = self.full_content
+        return article
+
+
+class PriceBars:
+    """
+    Column-oriented price history: one NumPy array per field instead of one dictionary per bar.
+    Bars are ordered by date.
+    """
+    __slots__ = ('dates', 'open', 'high', 'low', 'close', 'volume', 'dividends', 'stock_splits')
+
+    # Maps the Yahoo Finance column names to the attributes holding them
+    FIELDS = {
+        'Open': 'open',
+        'High': 'high',
+        'Low': 'low',
+        'Close': 'close',
+        'Volume': 'volume',
+        'Dividends': 'dividends',
+        'Stock Splits': 'stock_splits'
+    }
+
+    def __init__(self, dates, open, high, low, close, volume, dividends=None, stock_splits=None):
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        size = len(self.dates)
+        self.open = np.asarray(open, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.volume = np.asarray(volume, dtype=np.float64)
+        self.dividends = np.zeros(size) if dividends is None else np.asarray(dividends, dtype=np.float64)
+        self.stock_splits = np.zeros(size) if stock_splits is None else np.asarray(stock_splits, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.dates)
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Builds bars from a DataFrame with a 'Date' column and Yahoo Finance field columns.
+        Rows with an invalid date are dropped; missing fields are filled with NaN.
+        """
+        # Keep the exchange-local calendar date of each bar ('2024-01-02 00:00:00-05:00' -> 2024-01-02)
+        dates = pd.to_datetime(df['Date'].astype(str).str[:10], errors='coerce')
+        valid = (~dates.isna()).to_numpy()
+        dates = dates[valid]
+
+        def column(name):
+            if name not in df.columns:
+                return np.full(int(valid.sum()), np.nan)
+            return pd.to_numeric(df[name][valid], errors='coerce').to_numpy(dtype=np.float64)
+
+        bars = cls(dates.to_numpy(dtype='datetime64[D]'),
+                   **{attribute: column(name) for name, attribute in cls.FIELDS.items()})
+        order = np.argsort(bars.dates, kind='stable')
+        return bars.take(order)
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Builds bars from a list of bar dictionaries (as stored in the stock data JSON file).
+        """
+        if isinstance(records, cls):
+            return records
+        df = pd.DataFrame(list(records or []))
+        if df.empty or 'Date' not in df.columns:
+            return cls([], [], [], [], [], [])
+        return cls.from_frame(df)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds bars from (date, open, high, low, close, volume, dividends, stock_splits) tuples.
+        """
+        rows = list(rows)
+        if not rows:
+            return cls([], [], [], [], [], [])
+        columns = list(zip(*rows))
+        # SQLite returns NULL as None, which the float arrays store as NaN
+        return cls(columns[0], *(np.array(column, dtype=np.float64) for column in columns[1:]))
+
+    def take(self, indices):
+        """
+        Returns the bars at the given positions (an index array or boolean mask).
+        """
+        return PriceBars(self.dates[indices], *(getattr(self, attribute)[indices] for attribute in self.FIELDS.values()))
+
+    def map_arrays(self, function):
+        """
+        Returns a copy of the bars with every array replaced by function(array), e.g. to move the
+        arrays to memory-mapped files. Broadcast views (which take no memory) are kept as they are.
+        """
+        copy = object.__new__(type(self))
+        for cls in type(self).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                value = getattr(self, slot)
+                if isinstance(value, np.ndarray) and 0 not in value.strides:
+                    value = function(value)
+                setattr(copy, slot, value)
+        return copy
+
+    def field(self, name):
+        """
+        Returns the array for a Yahoo Finance column name (e.g. 'Close') or attribute name.
+        """
+        return getattr(self, self.FIELDS.get(name, name))
+
+    def series(self, name):
+        """
+        Returns one field as a Series indexed by date.
+        """
+        return pd.Series(self.field(name), index=pd.DatetimeIndex(self.dates), name=name)
+
+    def ffill(self):
+        """
+        Forward-fills missing values of every field in place.
+        """
+        for attribute in self.FIELDS.values():
+            values = getattr(self, attribute)
+            missing = np.isnan(values)
+            if missing.any():
+                positions = np.where(~missing, np.arange(len(values)), 0)
+                np.maximum.accumulate(positions, out=positions)
+                filled = values[positions]
+                # Leading gaps have nothing to fill from
+                filled[missing & (np.cumsum(~missing) == 0)] = np.nan
+                setattr(self, attribute, filled)
+        return self
+
+    def date_strings(self):
+        """
+        Returns the bar dates as 'YYYY-MM-DD' strings.
+        """
+        return np.datetime_as_string(self.dates, unit='D')
+
+    def rows(self):
+        """
+        Yields one (date, open, high, low, close, volume, dividends, stock_splits) tuple per bar,
+        with NaN converted to None.
+        """
+        columns = [getattr(self, attribute) for attribute in self.FIELDS.values()]
+        for position, bar_date in enumerate(self.date_strings()):
+            yield (str(bar_date), *(None if np.isnan(column[position]) else float(column[position]) for column in columns))
+
+    def to_records(self):
+        """
+        Returns the bars as a list of dictionaries keyed by the Yahoo Finance column names,
+        for JSON serialization.
+        """
+        names = ['Date', *self.FIELDS]
+        return [dict(zip(names, row)) for row in self.rows()]
+
+
+# Binary layout of stored intraday bars: int64 epoch seconds (UTC), float32 prices, int64 volume
+INTRADAY_DTYPE = np.dtype([
+    ('ts', '<i8'), ('open', '<f4'), ('high', '<f4'), ('low', '<f4'), ('close', '<f4'), ('volume', '<i8')
+])
+
+
+def pandas_rule(interval):
+    """
+    Converts a Yahoo Finance interval ('5m', '1h', '1d') to a pandas resampling rule ('5min', '1h', '1D').
+    """
+    if interval.endswith('m') and not interval.endswith('mo'):
+        return f"{interval[:-1]}min"
+    if interval.endswith('d'):
+        return f"{interval[:-1]}D"
+    return interval
+
+
+class IntradayBars(PriceBars):
+    """
+    Compact intraday bars: timestamps are stored as int64 seconds (UTC), prices as float32 and
+    volume as int64. Dividends and splits are not tracked intraday and read as zero.
+    """
+    __slots__ = ('interval',)
+
+    def __init__(self, dates, open, high, low, close, volume, dividends=None, stock_splits=None, interval='1m'):
+        self.dates = np.asarray(dates, dtype='datetime64[s]')
+        size = len(self.dates)
+        self.open = np.asarray(open, dtype=np.float32)
+        self.high = np.asarray(high, dtype=np.float32)
+        self.low = np.asarray(low, dtype=np.float32)
+        self.close = np.asarray(close, dtype=np.float32)
+        self.volume = np.nan_to_num(np.asarray(volume, dtype=np.float64)).astype(np.int64)
+        # Read-only zero views that take no memory
+        self.dividends = np.broadcast_to(np.float32(0), (size,))
+        self.stock_splits = self.dividends
+        self.interval = interval
+
+    @property
+    def timestamps(self):
+        """
+        Epoch seconds (UTC) of each bar, as a view of the date array.
+        """
+        return self.dates.view(np.int64)
+
+    @classmethod
+    def empty(cls, interval):
+        """
+        Returns bars with no rows.
+        """
+        return cls([], [], [], [], [], [], interval=interval)
+
+    @classmethod
+    def from_history_frame(cls, df, interval):
+        """
+        Builds bars from a DataFrame returned by yfinance's Ticker.history (indexed by timestamp).
+        """
+        if df is None or df.empty:
+            return cls.empty(interval)
+        index = pd.DatetimeIndex(df.index)
+        index = index.tz_convert('UTC') if index.tz is not None else index.tz_localize('UTC')
+        seconds = index.as_unit('s').asi8
+        return cls(seconds.astype('datetime64[s]'), df['Open'].to_numpy(), df['High'].to_numpy(), df['Low'].to_numpy(),
+                   df['Close'].to_numpy(), df['Volume'].to_numpy(), interval=interval)
+
+    @classmethod
+    def from_bytes(cls, payload, interval):
+        """
+        Decodes bars stored with to_bytes.
+        """
+        records = np.frombuffer(payload, dtype=INTRADAY_DTYPE)
+        return cls(records['ts'].astype('datetime64[s]'), records['open'], records['high'], records['low'],
+                   records['close'], records['volume'], interval=interval)
+
+    def to_bytes(self):
+        """
+        Encodes the bars in the INTRADAY_DTYPE binary layout (32 bytes per bar).
+        """
+        records = np.empty(len(self), dtype=INTRADAY_DTYPE)
+        records['ts'] = self.timestamps
+        for name in ('open', 'high', 'low', 'close', 'volume'):
+            records[name] = getattr(self, name)
+        return records.tobytes()
+
+    @classmethod
+    def concat(cls, parts, interval):
+        """
+        Stitches bars fetched in several chunks together, ordered by time; overlapping timestamps
+        keep the bar from the later part.
+        """
+        parts = [part for part in parts if part is not None and len(part)]
+        if not parts:
+            return cls.empty(interval)
+        combined = cls(
+            np.concatenate([part.dates for part in parts]),
+            *(np.concatenate([getattr(part, name) for part in parts]) for name in ('open', 'high', 'low', 'close', 'volume')),
+            interval=interval
+        )
+        # Reverse so that np.unique keeps the last occurrence of each timestamp
+        reversed_ts = combined.timestamps[::-1]
+        _, first = np.unique(reversed_ts, return_index=True)
+        return combined.take(np.sort(len(combined) - 1 - first))
+
+    def take(self, indices):
+        return IntradayBars(self.dates[indices], self.open[indices], self.high[indices], self.low[indices],
+                            self.close[indices], self.volume[indices], interval=self.interval)
+
+    def session_dates(self):
+        """
+        Returns the UTC calendar date of each bar, used as its session.
+        """
+        return self.dates.astype('datetime64[D]')
+
+    def split_sessions(self):
+        """
+        Returns a dictionary mapping each 'YYYY-MM-DD' session date to its bars.
+        """
+        days = self.session_dates()
+        unique_days, starts = np.unique(days, return_index=True)
+        bounds = list(starts[1:]) + [len(self)]
+        return {
+            str(day): self.take(slice(start, end))
+            for day, start, end in zip(unique_days, starts, bounds)
+        }
+
+    def resample(self, rule):
+        """
+        Aggregates the bars to a coarser pandas rule (e.g. '15min', '1h'): first open, max high,
+        min low, last close and summed volume. Periods without trades are dropped.
+        """
+        if not len(self):
+            return IntradayBars.empty(rule)
+        frame = pd.DataFrame({name: getattr(self, name) for name in ('open', 'high', 'low', 'close', 'volume')},
+                             index=pd.DatetimeIndex(self.dates))
+        resampled = frame.resample(rule, label='left', closed='left').agg(
+            {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+        ).dropna(subset=['close'])
+        return IntradayBars(resampled.index.to_numpy(dtype='datetime64[s]'), resampled['open'], resampled['high'],
+                            resampled['low'], resampled['close'], resampled['volume'], interval=rule)
+
+    def resample_for_display(self, max_points):
+        """
+        Resamples to the finest standard rule that leaves at most max_points bars (for charts).
+        """
+        for rule in ('1min', '5min', '15min', '30min', '1h', '4h', '1D'):
+            if pd.Timedelta(rule) < pd.Timedelta(pandas_rule(self.interval)):
+                continue
+            bars = self if pd.Timedelta(rule) == pd.Timedelta(pandas_rule(self.interval)) else self.resample(rule)
+            if len(bars) <= max_points:
+                return bars
+        return self.resample('1D')
+
+    def date_strings(self):
+        return np.datetime_as_string(self.dates, unit='s')
@@ -0,0 +1,443 @@
+# src/report_rendering.py
+
+import os
+import re
+import html
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from indicators import compute_indicators_from_histories
+from peer_comparison import peer_comparison_rows
+from records import PriceBars, IntradayBars
+from warehouse import today
+from artifact_store import ArtifactStore, input_key
+
+# Output backends; 'pdf' is the only one that needs matplotlib and reportlab
+OUTPUT_FORMATS = ('pdf', 'html', 'markdown')
+OUTPUT_EXTENSIONS = {'pdf': 'pdf', 'html': 'html', 'markdown': 'md'}
+# Part of every report output's artifact key; bump it when a backend's output changes
+RENDER_VERSION = 1
+
+SVG_WIDTH = 720
+SVG_HEIGHT = 260
+SVG_MARGIN = 40
+# Series are downsampled to at most this many points per chart
+MAX_SVG_POINTS = 400
+SVG_COLORS = ('#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f')
+
+# Shared by every HTML report of a batch
+HTML_STYLESHEET = """
+body { font-family: Helvetica, Arial, sans-serif; max-width: 800px; margin: 2em auto; color: #222; line-height: 1.45; }
+header { text-align: center; margin-bottom: 2em; }
+h1 { font-size: 1.9em; margin-bottom: 0.2em; }
+h2 { background: #d3d3d3; padding: 0.3em 0.5em; text-align: center; font-size: 1.3em; }
+table { border-collapse: collapse; margin: 1em 0; font-size: 0.9em; }
+td, th { border: 1px solid #555; padding: 0.25em 0.6em; text-align: left; }
+th { background: #eee; }
+svg { display: block; margin: 1em 0; }
+svg text { font-size: 11px; fill: #333; }
+.sources p { font-size: 0.85em; margin: 0.2em 0; }
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class ReportSection:
+    """
+    One section of the report. Blocks are ('bullet' | 'paragraph', text) pairs.
+    """
+    heading: str
+    blocks: tuple
+
+
+@dataclass(frozen=True, slots=True)
+class ReportModel:
+    """
+    A parsed report shared by every output backend. Chart data (bars, indicators, peer comparison)
+    is referenced, not copied.
+    """
+    ticker: str
+    long_name: str
+    author_name: str
+    generated_date: str
+    summary_rows: tuple
+    peer_header: tuple
+    peer_rows: tuple
+    sections: tuple
+    sources: tuple
+    bars: PriceBars
+    indicators: dict
+    peer_comparison: dict
+    intraday: IntradayBars = None
+
+
+def _summary_rows(stock_info):
+    """
+    Returns the (label, value) rows of the stock summary table.
+    """
+    return (
+        ('Current Price', stock_info.get('currentPrice', 'N/A')),
+        ('Previous Close', stock_info.get('previousClose', 'N/A')),
+        ('Open', stock_info.get('open', 'N/A')),
+        ("Day's Range", f"{stock_info.get('dayLow', 'N/A')} - {stock_info.get('dayHigh', 'N/A')}"),
+        ('52-Week Range', f"{stock_info.get('fiftyTwoWeekLow', 'N/A')} - {stock_info.get('fiftyTwoWeekHigh', 'N/A')}"),
+        ('Volume', stock_info.get('volume', 'N/A')),
+        ('Average Volume', stock_info.get('averageVolume', 'N/A')),
+        ('Market Cap', stock_info.get('marketCap', 'N/A')),
+        ('PE Ratio (TTM)', stock_info.get('trailingPE', 'N/A'))
+    )
+
+
+def _peer_table(ticker, peer_comparison):
+    """
+    Returns the header and the formatted rows of the peer comparison table.
+    """
+    if not peer_comparison:
+        return (), ()
+    header = ('Ticker', 'Period Return', 'Volatility', f'Correlation w/ {ticker}', f'{ticker} Beta', f'{ticker} Outperf.')
+    rows = []
+    for row in peer_comparison_rows(peer_comparison):
+        is_target = row['ticker'] == ticker
+        rows.append((
+            row['ticker'],
+            f"{row['total_return']:+.2%}",
+            f"{row['volatility']:.2%}",
+            '-' if is_target else f"{row['correlation']:.2f}",
+            '-' if is_target else f"{row['beta']:.2f}",
+            '-' if is_target else f"{row['outperformance']:+.2%}",
+        ))
+    return header, tuple(rows)
+
+
+def parse_report_sections(report_text):
+    """
+    Splits the model's report text into sections (at lines starting with a bold heading) and the
+    lines of its Sources section.
+    Returns a tuple (sections, sources).
+    """
+    if '**Sources:**' in report_text:
+        main_content, sources_content = report_text.split('**Sources:**', 1)
+    else:
+        main_content, sources_content = report_text, ''
+
+    sections = []
+    for section in re.split(r'\n(?=\*\*)', main_content):
+        if not section.strip():
+            continue
+        lines = section.strip().split('\n')
+        blocks = []
+        for para in lines[1:]:
+            para = para.strip()
+            if not para:
+                continue
+            if para.startswith('- '):
+                blocks.append(('bullet', para[2:]))
+            else:
+                blocks.append(('paragraph', para))
+        sections.append(ReportSection(heading=lines[0].strip().strip('* ').rstrip(':'), blocks=tuple(blocks)))
+
+    sources = tuple(line.strip() for line in sources_content.strip().split('\n') if line.strip())
+    return tuple(sections), sources
+
+
+def build_report_model(report_text, ticker, stock_data, author_name, indicators=None, peer_comparison=None,
+                       generated_date=None):
+    """
+    Parses the report text once into the model every backend renders from.
+    """
+    stock_info = stock_data.get('info', {})
+    bars = PriceBars.from_records(stock_data.get('history', []))
+    if indicators is None:
+        indicators = compute_indicators_from_histories({ticker: bars})
+    sections, sources = parse_report_sections(report_text)
+    peer_header, peer_rows = _peer_table(ticker, peer_comparison)
+    return ReportModel(
+        ticker=ticker,
+        long_name=stock_info.get('longName', ticker),
+        author_name=author_name,
+        generated_date=generated_date or pd.Timestamp.now().strftime('%Y-%m-%d'),
+        summary_rows=_summary_rows(stock_info),
+        peer_header=peer_header,
+        peer_rows=peer_rows,
+        sections=sections,
+        sources=sources,
+        bars=bars,
+        indicators=indicators,
+        peer_comparison=peer_comparison,
+        intraday=stock_data.get('intraday')
+    )
+
+
+def render_markdown(model):
+    """
+    Renders the report as Markdown.
+    """
+    lines = [
+        f"# {model.ticker} Stock Analysis Report",
+        '',
+        f"*{model.long_name} | Generated on: {model.generated_date} | Developed by: {model.author_name}*",
+        '',
+        '## Analysis of Recent Performance',
+        '',
+        '| Metric | Value |',
+        '| --- | --- |',
+        *(f"| {label} | {value} |" for label, value in model.summary_rows),
+        ''
+    ]
+    if model.peer_rows:
+        lines += [
+            '## Peer Comparison',
+            '',
+            f"| {' | '.join(model.peer_header)} |",
+            f"|{' --- |' * len(model.peer_header)}",
+            *(f"| {' | '.join(row)} |" for row in model.peer_rows),
+            ''
+        ]
+    for section in model.sections:
+        lines += [f"## {section.heading}", '']
+        for kind, text in section.blocks:
+            if kind == 'bullet':
+                lines.append(f"- {text}")
+                continue
+            if lines[-1]:
+                lines.append('')
+            lines += [text, '']
+        if lines[-1]:
+            lines.append('')
+    if model.sources:
+        lines += ['## Sources', '', *(f"{source}  " for source in model.sources), '']
+    return '\n'.join(lines)
+
+
+def _downsample(values, max_points=MAX_SVG_POINTS):
+    """
+    Returns (positions, values) keeping at most max_points evenly spaced points.
+    """
+    positions = np.arange(len(values))
+    if len(values) <= max_points:
+        return positions, values
+    keep = np.unique(np.linspace(0, len(values) - 1, max_points).astype(np.int64))
+    return positions[keep], values[keep]
+
+
+def svg_chart(title, dates, series, bar_series=False, reference_lines=()):
+    """
+    Renders one or more aligned series as an inline SVG chart (lines, or bars if bar_series).
+    series is a list of (label, values) pairs of the same length as dates.
+    """
+    if not len(dates) or not series:
+        return ''
+    values = np.concatenate([np.asarray(data, dtype=np.float64) for _, data in series] + [np.asarray(reference_lines, dtype=np.float64)])
+    finite = values[np.isfinite(values)]
+    if not finite.size:
+        return ''
+    low, high = float(finite.min()), float(finite.max())
+    if bar_series:
+        low = min(low, 0.0)
+    span = (high - low) or 1.0
+    plot_width = SVG_WIDTH - 2 * SVG_MARGIN
+    plot_height = SVG_HEIGHT - 2 * SVG_MARGIN
+    last = max(len(dates) - 1, 1)
+
+    def x(position):
+        return SVG_MARGIN + plot_width * position / last
+
+    def y(value):
+        return SVG_MARGIN + plot_height * (high - value) / span
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{SVG_WIDTH}" height="{SVG_HEIGHT}" viewBox="0 0 {SVG_WIDTH} {SVG_HEIGHT}">',
+        f'<text x="{SVG_WIDTH / 2}" y="18" text-anchor="middle" font-weight="bold">{html.escape(title)}</text>',
+        f'<rect x="{SVG_MARGIN}" y="{SVG_MARGIN}" width="{plot_width}" height="{plot_height}" fill="none" stroke="#ccc"/>',
+        f'<text x="{SVG_MARGIN - 4}" y="{SVG_MARGIN + 4}" text-anchor="end">{high:,.4g}</text>',
+        f'<text x="{SVG_MARGIN - 4}" y="{SVG_MARGIN + plot_height}" text-anchor="end">{low:,.4g}</text>',
+        f'<text x="{SVG_MARGIN}" y="{SVG_HEIGHT - 12}">{pd.Timestamp(dates[0]):%Y-%m-%d}</text>',
+        f'<text x="{SVG_MARGIN + plot_width}" y="{SVG_HEIGHT - 12}" text-anchor="end">{pd.Timestamp(dates[-1]):%Y-%m-%d}</text>',
+    ]
+    for level in reference_lines:
+        parts.append(f'<line x1="{SVG_MARGIN}" x2="{SVG_MARGIN + plot_width}" y1="{y(level):.1f}" y2="{y(level):.1f}" '
+                     f'stroke="#000" stroke-dasharray="4 3" stroke-width="0.7"/>')
+
+    for index, (label, data) in enumerate(series):
+        color = SVG_COLORS[index % len(SVG_COLORS)]
+        positions, points = _downsample(np.asarray(data, dtype=np.float64))
+        if bar_series:
+            bar_width = max(plot_width / len(positions) - 1, 1)
+            parts.extend(
+                f'<rect x="{x(position) - bar_width / 2:.1f}" y="{y(max(value, 0)):.1f}" width="{bar_width:.1f}" '
+                f'height="{abs(y(value) - y(0)):.1f}" fill="{color}"/>'
+                for position, value in zip(positions, points) if np.isfinite(value)
+            )
+        else:
+            # Missing values split the line into separate segments
+            segment = []
+            for position, value in zip(positions, points):
+                if np.isfinite(value):
+                    segment.append(f'{x(position):.1f},{y(value):.1f}')
+                    continue
+                if len(segment) > 1:
+                    parts.append(f'<polyline points="{" ".join(segment)}" fill="none" stroke="{color}" stroke-width="1.5"/>')
+                segment = []
+            if len(segment) > 1:
+                parts.append(f'<polyline points="{" ".join(segment)}" fill="none" stroke="{color}" stroke-width="1.5"/>')
+        parts.append(f'<text x="{SVG_MARGIN + 8 + 110 * index}" y="{SVG_MARGIN - 8}" fill="{color}">{html.escape(label)}</text>')
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+def _html_charts(model):
+    """
+    Returns the inline SVG charts of the HTML report.
+    """
+    ticker = model.ticker
+    charts = []
+    indicators = model.indicators
+    if indicators and ticker in indicators['close'].columns:
+        close = indicators['close'][ticker]
+        dates = close.index.to_numpy()
+        charts.append(svg_chart(f'{ticker} Price and Moving Averages', dates, [
+            ('Close Price', close.to_numpy()),
+            ('SMA 50', indicators['sma_50'][ticker].to_numpy()),
+            ('SMA 200', indicators['sma_200'][ticker].to_numpy()),
+        ]))
+        charts.append(svg_chart(f'{ticker} RSI (14)', dates, [('RSI', indicators['rsi_14'][ticker].to_numpy())],
+                                reference_lines=(30, 70)))
+        charts.append(svg_chart(f'{ticker} Drawdown (%)', dates, [('Drawdown', indicators['drawdown'][ticker].to_numpy() * 100)],
+                                reference_lines=(0,)))
+    elif len(model.bars):
+        charts.append(svg_chart(f'{ticker} Stock Price Over Time', model.bars.dates, [('Close Price', model.bars.close)]))
+    if model.intraday is not None and len(model.intraday):
+        # Resampled on demand so the chart stays small whatever the interval and period
+        intraday = model.intraday.resample_for_display(MAX_SVG_POINTS)
+        charts.append(svg_chart(f'{ticker} Intraday Price ({intraday.interval} bars, UTC)', intraday.dates,
+                                [('Close Price', intraday.close)]))
+    if len(model.bars):
+        charts.append(svg_chart(f'{ticker} Trading Volume Over Time', model.bars.dates, [('Volume', model.bars.volume)],
+                                bar_series=True))
+    return [chart for chart in charts if chart]
+
+
+def _inline_markup(text):
+    """
+    Escapes text for HTML and converts **bold** spans.
+    """
+    return re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', html.escape(text))
+
+
+def _html_table(header, rows):
+    """
+    Renders a table; header may be empty.
+    """
+    parts = ['<table>']
+    if header:
+        parts.append('<tr>' + ''.join(f'<th>{html.escape(str(cell))}</th>' for cell in header) + '</tr>')
+    parts.extend('<tr>' + ''.join(f'<td>{html.escape(str(cell))}</td>' for cell in row) + '</tr>' for row in rows)
+    parts.append('</table>')
+    return '\n'.join(parts)
+
+
+def render_html(model):
+    """
+    Renders the report as a self-contained HTML page with inline SVG charts.
+    """
+    title = f"{model.ticker} Stock Analysis Report"
+    body = [
+        f"<header><h1>{html.escape(title)}</h1>",
+        f"<p>{html.escape(model.long_name)} ({html.escape(model.ticker)})<br>Generated on: {model.generated_date}<br>"
+        f"Developed by: {html.escape(model.author_name)}</p></header>",
+        "<h2>Analysis of Recent Performance</h2>",
+        _html_table((), model.summary_rows),
+        *_html_charts(model)
+    ]
+    if model.peer_rows:
+        body += ["<h2>Peer Comparison</h2>", _html_table(model.peer_header, model.peer_rows)]
+        normalized = model.peer_comparison['normalized']
+        body.append(svg_chart(f"{model.ticker} vs Peers (Normalized to 100)", normalized.index.to_numpy(),
+                              [(column, normalized[column].to_numpy()) for column in normalized.columns],
+                              reference_lines=(100,)))
+    for section in model.sections:
+        body.append(f"<h2>{_inline_markup(section.heading)}</h2>")
+        bullets = []
+        for kind, text in section.blocks:
+            if kind == 'bullet':
+                bullets.append(f"<li>{_inline_markup(text)}</li>")
+                continue
+            if bullets:
+                body.append('<ul>' + ''.join(bullets) + '</ul>')
+                bullets = []
+            body.append(f"<p>{_inline_markup(text)}</p>")
+        if bullets:
+            body.append('<ul>' + ''.join(bullets) + '</ul>')
+    if model.sources:
+        body.append("<h2>Sources</h2>")
+        body.append('<div class="sources">' + ''.join(f"<p>{_inline_markup(source)}</p>" for source in model.sources) + '</div>')
+
+    return (
+        '<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n'
+        f'<title>{html.escape(title)}</title>\n<style>{HTML_STYLESHEET}</style>\n</head>\n<body>\n'
+        + '\n'.join(body)
+        + '\n</body>\n</html>\n'
+    )
+
+
+def _write_text(path, text):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def render_report(report_text, ticker, stock_data, formats=('pdf',), author_name='Author Name',
+                  indicators=None, peer_comparison=None, output_dir='outputs', store=None):
+    """
+    Renders the report text with every requested backend ('pdf', 'html', 'markdown') from one parsed model.
+    Each output is stored in the artifact store (store, or the default one) under the hash of its
+    inputs and published to output_dir as a new version; an output whose inputs are unchanged is
+    copied from the store without parsing or rendering anything.
+    The PDF backend, and with it matplotlib and reportlab, is only loaded when PDF output is requested.
+    Returns a dictionary mapping each format to the path written.
+    """
+    store = store or ArtifactStore()
+    generated_date = today()
+    model = None
+
+    def build_model():
+        nonlocal model
+        if model is None:
+            model = build_report_model(report_text, ticker, stock_data, author_name, indicators=indicators,
+                                       peer_comparison=peer_comparison, generated_date=generated_date)
+        return model
+
+    def write(output_format, path):
+        if output_format == 'pdf':
+            from pdf_renderer import save_report_as_pdf
+            return save_report_as_pdf(build_model(), path, store=store)
+        _write_text(path, render_html(build_model()) if output_format == 'html' else render_markdown(build_model()))
+
+    os.makedirs(output_dir, exist_ok=True)
+    written = {}
+    for output_format in dict.fromkeys(formats):
+        extension = OUTPUT_EXTENSIONS[output_format]
+        name = f"final_report.{extension}"
+        path = os.path.join(output_dir, f"{ticker}_{name}")
+        try:
+            key = input_key('report', RENDER_VERSION, output_format, report_text, ticker, stock_data, author_name,
+                            generated_date, indicators, peer_comparison)
+            artifact = store.lookup(key)
+            reused = artifact is not None
+            if not reused:
+                artifact = store.create(key, 'report', extension,
+                                        lambda artifact_path: write(output_format, artifact_path))
+            if artifact is None:
+                continue
+            version = store.publish(key, path, ticker, name)
+            written[output_format] = path
+            logging.info("Report has been saved as %s to %s (version %s%s).", output_format.upper(), path, version,
+                         ', unchanged inputs' if reused else '')
+        except Exception as e:
+            logging.error("An error occurred while rendering the %s report: %s", output_format, e)
+    try:
+        store.evict()
+    except Exception as e:
+        logging.error("An error occurred while evicting artifacts: %s", e)
+    return written
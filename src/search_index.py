@@ -0,0 +1,268 @@
+# src/search_index.py
+
+import sys
+import hashlib
+import sqlite3
+import logging
+import argparse
+from contextlib import contextmanager
+
+from warehouse import connect as warehouse_connect, get_db_path, today, utc_now
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_documents (
+    id INTEGER PRIMARY KEY,
+    doc_type TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    doc_key TEXT NOT NULL,
+    as_of_date TEXT NOT NULL,
+    category TEXT,
+    title TEXT,
+    link TEXT,
+    body TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    indexed_at TEXT NOT NULL,
+    UNIQUE (doc_type, ticker, doc_key)
+);
+CREATE INDEX IF NOT EXISTS idx_search_documents_ticker_date
+    ON search_documents (ticker, as_of_date);
+CREATE INDEX IF NOT EXISTS idx_search_documents_link ON search_documents (link);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS search_documents_fts USING fts5(
+    title, body,
+    content='search_documents', content_rowid='id',
+    tokenize='porter unicode61'
+);
+
+CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN
+    INSERT INTO search_documents_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN
+    INSERT INTO search_documents_fts (search_documents_fts, rowid, title, body)
+    VALUES ('delete', old.id, old.title, old.body);
+END;
+CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN
+    INSERT INTO search_documents_fts (search_documents_fts, rowid, title, body)
+    VALUES ('delete', old.id, old.title, old.body);
+    INSERT INTO search_documents_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+END;
+"""
+
+_initialized_paths = set()
+
+
+@contextmanager
+def connect(db_path=None):
+    """
+    Opens a warehouse connection and makes sure the full-text search tables exist.
+    """
+    path = db_path or get_db_path()
+    with warehouse_connect(path) as conn:
+        if path not in _initialized_paths:
+            conn.executescript(SCHEMA)
+            _initialized_paths.add(path)
+        yield conn
+
+
+def _content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _upsert_document(conn, doc_type, ticker, doc_key, as_of_date, category, title, link, body):
+    """
+    Inserts or updates a single document. Returns True if the index changed.
+    Documents whose content hash is unchanged are left untouched.
+    """
+    content_hash = _content_hash(f"{title}\n{body}")
+    existing = conn.execute(
+        "SELECT id, content_hash FROM search_documents WHERE doc_type = ? AND ticker = ? AND doc_key = ?",
+        (doc_type, ticker, doc_key)
+    ).fetchone()
+    if existing and existing['content_hash'] == content_hash:
+        return False
+
+    if existing:
+        conn.execute(
+            """
+            UPDATE search_documents SET
+                as_of_date = ?, category = ?, title = ?, link = ?, body = ?,
+                content_hash = ?, indexed_at = ?
+            WHERE id = ?
+            """,
+            (as_of_date, category, title, link, body, content_hash, utc_now(), existing['id'])
+        )
+    else:
+        conn.execute(
+            """
+            INSERT INTO search_documents
+                (doc_type, ticker, doc_key, as_of_date, category, title, link, body, content_hash, indexed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (doc_type, ticker, doc_key, as_of_date, category, title, link, body, content_hash, utc_now())
+        )
+    return True
+
+
+def index_articles(ticker, articles, as_of_date=None, db_path=None):
+    """
+    Incrementally indexes fetched articles (records.Article) for a ticker.
+    Articles without content are skipped. Returns the number of documents added or updated.
+    """
+    as_of_date = as_of_date or today()
+    changed = 0
+    try:
+        with connect(db_path) as conn:
+            for article in articles:
+                link = article.link
+                body = article.full_content
+                if not link or not body:
+                    continue
+                if _upsert_document(conn, 'article', ticker, link, as_of_date,
+                                    article.category, article.title, link, body):
+                    changed += 1
+        logging.info("Indexed %s new or updated article(s) for %s.", changed, ticker)
+    except sqlite3.Error as e:
+        logging.error("An error occurred while indexing articles for %s: %s", ticker, e)
+    return changed
+
+
+def index_report(ticker, report_text, as_of_date=None, db_path=None):
+    """
+    Incrementally indexes a generated report. Reports are keyed by ticker and date.
+    Returns True if the index changed.
+    """
+    as_of_date = as_of_date or today()
+    try:
+        with connect(db_path) as conn:
+            changed = _upsert_document(conn, 'report', ticker, as_of_date, as_of_date, None,
+                                       f"{ticker} report {as_of_date}", None, report_text)
+        if changed:
+            logging.info("Indexed report for %s (%s).", ticker, as_of_date)
+        return changed
+    except sqlite3.Error as e:
+        logging.error("An error occurred while indexing the report for %s: %s", ticker, e)
+        return False
+
+
+def index_from_warehouse(db_path=None):
+    """
+    Indexes every article and report already stored in the warehouse that is not yet in the index.
+    Returns the number of documents added or updated.
+    """
+    changed = 0
+    try:
+        with connect(db_path) as conn:
+            articles = conn.execute(
+                "SELECT ticker, as_of_date, link, title, category, full_content FROM articles "
+                "WHERE full_content IS NOT NULL AND full_content != '' ORDER BY as_of_date"
+            ).fetchall()
+            for row in articles:
+                if _upsert_document(conn, 'article', row['ticker'], row['link'], row['as_of_date'],
+                                    row['category'], row['title'], row['link'], row['full_content']):
+                    changed += 1
+            reports = conn.execute("SELECT ticker, as_of_date, report_text FROM reports").fetchall()
+            for row in reports:
+                if _upsert_document(conn, 'report', row['ticker'], row['as_of_date'], row['as_of_date'], None,
+                                    f"{row['ticker']} report {row['as_of_date']}", None, row['report_text']):
+                    changed += 1
+        logging.info("Indexed %s document(s) from the warehouse.", changed)
+    except sqlite3.Error as e:
+        logging.error("An error occurred while indexing the warehouse: %s", e)
+    return changed
+
+
+def search(query, tickers=None, doc_type=None, category=None, start_date=None, end_date=None, limit=20, db_path=None):
+    """
+    Runs an FTS5 query (e.g. '"export controls"' or 'tariff AND chips') over indexed articles and reports.
+    Returns a list of dictionaries ordered by relevance, each with a highlighted 'excerpt'.
+    """
+    sql = """
+        SELECT d.doc_type, d.ticker, d.as_of_date, d.category, d.title, d.link,
+               snippet(search_documents_fts, 1, '[', ']', '...', 24) AS excerpt,
+               bm25(search_documents_fts) AS score
+        FROM search_documents_fts
+        JOIN search_documents AS d ON d.id = search_documents_fts.rowid
+        WHERE search_documents_fts MATCH ?
+    """
+    params = [query]
+    if tickers:
+        sql += f" AND d.ticker IN ({', '.join('?' for _ in tickers)})"
+        params.extend(t.upper() for t in tickers)
+    if doc_type:
+        sql += " AND d.doc_type = ?"
+        params.append(doc_type)
+    if category:
+        sql += " AND d.category = ?"
+        params.append(category)
+    if start_date:
+        sql += " AND d.as_of_date >= ?"
+        params.append(start_date)
+    if end_date:
+        sql += " AND d.as_of_date <= ?"
+        params.append(end_date)
+    sql += " ORDER BY score LIMIT ?"
+    params.append(limit)
+
+    try:
+        with connect(db_path) as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+    except sqlite3.Error as e:
+        logging.error("An error occurred while searching for '%s': %s", query, e)
+        return []
+
+
+def get_indexed_article(link, db_path=None):
+    """
+    Returns the most recently indexed article text for a URL, or None if it was never fetched.
+    Lets later runs reuse previously extracted content without a network call.
+    """
+    try:
+        with connect(db_path) as conn:
+            row = conn.execute(
+                "SELECT body FROM search_documents WHERE doc_type = 'article' AND link = ? "
+                "ORDER BY as_of_date DESC LIMIT 1",
+                (link,)
+            ).fetchone()
+        return row['body'] if row else None
+    except sqlite3.Error as e:
+        logging.error("An error occurred while looking up indexed article %s: %s", link, e)
+        return None
+
+
+def parse_arguments():
+    """
+    Parses command-line arguments for the search CLI.
+    """
+    parser = argparse.ArgumentParser(description='Search collected articles and past reports.')
+    parser.add_argument('query', type=str, nargs='?', help='FTS5 query, e.g. \'"export controls"\'')
+    parser.add_argument('--tickers', type=str, nargs='*', help='Restrict results to these tickers')
+    parser.add_argument('--type', dest='doc_type', choices=['article', 'report'], help='Restrict results to one document type')
+    parser.add_argument('--category', type=str, help="Restrict results to a category (e.g. 'SECTOR CONTEXT')")
+    parser.add_argument('--since', type=str, help='Earliest date (YYYY-MM-DD)')
+    parser.add_argument('--until', type=str, help='Latest date (YYYY-MM-DD)')
+    parser.add_argument('--limit', type=int, default=20, help='Maximum number of results')
+    parser.add_argument('--db-path', type=str, default=None, help='Path to the SQLite research warehouse')
+    parser.add_argument('--reindex', action='store_true', help='Index warehouse articles and reports missing from the index')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_arguments()
+    if args.reindex:
+        print(f"Indexed {index_from_warehouse(args.db_path)} document(s).")
+    if not args.query:
+        if not args.reindex:
+            print("No query given.", file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0)
+
+    results = search(args.query, tickers=args.tickers, doc_type=args.doc_type, category=args.category,
+                     start_date=args.since, end_date=args.until, limit=args.limit, db_path=args.db_path)
+    for result in results:
+        location = result['link'] or f"{result['ticker']} report"
+        print(f"[{result['as_of_date']}] {result['ticker']} {result['doc_type']} - {result['title']}")
+        print(f"  {location}")
+        print(f"  {result['excerpt']}\n")
+    if not results:
+        print("No matching documents.")
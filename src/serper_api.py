@@ -5,10 +5,21 @@ import json
 import os
 from dotenv import load_dotenv
 import logging
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from deadline import network_timeout
+from hedging import hedged_call
+
+# Query-string parameters that only track the click and never change the page content
+TRACKING_PARAMS = {'gclid', 'fbclid', 'mc_cid', 'mc_eid', 'ref', 'ref_src', 'cmpid', 'guccounter', 'guce_referrer', 'guce_referrer_sig'}
+# Constant of the reciprocal rank fusion score: sum over queries of 1 / (RRF_K + rank)
+RRF_K = 60
+# Number of characters of an error response body included in the log
+MAX_ERROR_BODY_CHARS = 300
 
 def fetch_serper_data(query, filename):
     """
     Fetches data from the SERPER API based on the query and saves it as a JSON file.
+    The request is hedged when the run enables hedging (see hedging.hedged_call).
     """
     try:
         # Load environment variables from .env file
@@ -27,7 +38,8 @@ def fetch_serper_data(query, filename):
             'q': query
         }
 
-        response = requests.post(url, headers=headers, json=payload)
+        response = hedged_call('serper', requests.post, url, headers=headers, json=payload, timeout=network_timeout(),
+                               is_success=lambda response: response.status_code == 200)
 
         if response.status_code == 200 and 'organic' in response.json():
             data = response.json()
@@ -40,16 +52,105 @@ def fetch_serper_data(query, filename):
             with open(filepath, 'w') as f:
                 json.dump(data, f, indent=4)
 
-            logging.info(f"Data for '{query}' has been saved to {filepath}.")
+            logging.info("Data for '%s' has been saved to %s.", query, filepath)
             return data
         else:
-            logging.error(f"Unexpected response: {response.status_code} - {response.text}")
+            logging.error("Unexpected response: %s - %s", response.status_code, response.text[:MAX_ERROR_BODY_CHARS])
             return None
 
     except Exception as e:
-        logging.error(f"An error occurred while fetching data for query '{query}': {e}")
+        logging.error("An error occurred while fetching data for query '%s': %s", query, e)
         return None
 
+def canonicalize_url(url):
+    """
+    Normalizes a URL so the same page found by different queries is recognized as one hit:
+    lowercases the scheme and host, drops 'www.', fragments, tracking parameters and trailing slashes,
+    and sorts the remaining query parameters.
+    """
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit(('https' if parts.scheme in ('http', 'https') else parts.scheme.lower(),
+                       host, path, urlencode(query), ''))
+
+
+def merge_serper_results(results_by_query, rrf_k=RRF_K):
+    """
+    Merges the 'organic' results of several SERPER responses belonging to the same category.
+    Hits are deduplicated by canonical URL; each merged hit keeps the fields of its best-ranked
+    occurrence plus:
+        'queries': the queries that returned it (provenance),
+        'rrf_score': its reciprocal rank fusion score across queries.
+    Returns a SERPER-shaped dictionary whose 'organic' list is sorted by rrf_score.
+    """
+    merged = {}
+    for query, data in results_by_query.items():
+        if not data:
+            continue
+        for rank, hit in enumerate(data.get('organic', []), start=1):
+            link = hit.get('link', '')
+            if not link:
+                continue
+            key = canonicalize_url(link)
+            entry = merged.get(key)
+            if entry is None:
+                entry = dict(hit)
+                entry['queries'] = []
+                entry['rrf_score'] = 0.0
+                entry['best_rank'] = rank
+                merged[key] = entry
+            elif rank < entry['best_rank']:
+                # Keep the title/snippet of the best-ranked occurrence
+                entry.update({k: v for k, v in hit.items() if k not in ('queries', 'rrf_score', 'best_rank')})
+                entry['best_rank'] = rank
+            if query not in entry['queries']:
+                entry['queries'].append(query)
+                entry['rrf_score'] += 1.0 / (rrf_k + rank)
+
+    organic = sorted(merged.values(), key=lambda hit: (-hit['rrf_score'], hit['best_rank']))
+    for position, hit in enumerate(organic, start=1):
+        hit['position'] = position
+    return {
+        'searchParameters': {'queries': list(results_by_query.keys())},
+        'organic': organic
+    }
+
+
+def query_overlap_stats(results_by_query):
+    """
+    Computes, for each query of a category, how many hits it returned and how many of them the
+    queries kept before it did not return. Queries are evaluated greedily in the order given (the
+    base query first): a query with no such unique hits is redundant, since every page it found
+    would have been found anyway, and is not counted as kept. Of two queries that cover each other,
+    only the later one is therefore flagged, and skipping the redundant queries loses no results.
+    Returns a dictionary mapping each query to {'hits', 'unique_hits', 'redundant'}.
+    """
+    stats = {}
+    covered = set()
+    for query, data in results_by_query.items():
+        urls = {canonicalize_url(hit.get('link', '')) for hit in (data or {}).get('organic', []) if hit.get('link')}
+        unique_hits = len(urls - covered)
+        redundant = bool(stats) and unique_hits == 0
+        if not redundant:
+            covered |= urls
+        stats[query] = {
+            'hits': len(urls),
+            'unique_hits': unique_hits,
+            'redundant': redundant
+        }
+    return stats
+
+
 if __name__ == '__main__':
     # Example usage
     fetch_serper_data('AAPL stock analysis', 'serper_stock_context')
@@ -0,0 +1,173 @@
+# src/structured_logging.py
+
+import os
+import sys
+import json
+import uuid
+import queue
+import atexit
+import logging
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+DEFAULT_LOG_PATH = 'logs/hsfinance.jsonl'
+# Size-based rotation of the JSON-lines log: 10 MB per file, five old files kept
+MAX_LOG_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+# Longer messages (e.g. whole HTTP bodies or prompts) are truncated when they are written
+MAX_MESSAGE_CHARS = 2000
+MAX_EXCEPTION_CHARS = 8000
+CONSOLE_FORMAT = '%(asctime)s - %(levelname)s - %(context)s%(message)s'
+# Arguments of these types cannot change before the listener thread formats the message
+IMMUTABLE_ARG_TYPES = (str, int, float, bool, type(None), bytes)
+
+_run_id = contextvars.ContextVar('run_id', default=None)
+_ticker = contextvars.ContextVar('ticker', default=None)
+_stage = contextvars.ContextVar('stage', default=None)
+_CONTEXT_VARS = {'run_id': _run_id, 'ticker': _ticker, 'stage': _stage}
+
+_process_run_id = None
+_listener = None
+
+
+def new_run_id():
+    """
+    Returns a short random run identifier.
+    """
+    return uuid.uuid4().hex[:12]
+
+
+def truncate(text, max_chars):
+    """
+    Truncates text to max_chars characters, noting how much was cut.
+    """
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... [{len(text) - max_chars} more characters]"
+
+
+def set_log_context(**fields):
+    """
+    Sets run_id, ticker and/or stage for the log records of the current context (thread or task).
+    """
+    for name, value in fields.items():
+        _CONTEXT_VARS[name].set(value)
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    Sets run_id, ticker and/or stage for the log records emitted inside the block, restoring the
+    previous values (including stages set with set_log_context) on exit.
+    """
+    tokens = {name: _CONTEXT_VARS[name].set(value) for name, value in fields.items()}
+    # Stages set inside the block are reset with it
+    tokens.setdefault('stage', _stage.set(_stage.get()))
+    try:
+        yield
+    finally:
+        for name, token in tokens.items():
+            _CONTEXT_VARS[name].reset(token)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor whose tasks run in a copy of the submitter's context, so their log records
+    keep the run, ticker and stage of the code that submitted them.
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Queue handler that does as little as possible in the logging thread: it attaches the log
+    context and leaves formatting to the listener thread. The message is only merged with its
+    arguments here when an argument is mutable and could change before it is formatted.
+    """
+
+    def prepare(self, record):
+        record.run_id = _run_id.get() or _process_run_id
+        record.ticker = _ticker.get()
+        record.stage = _stage.get()
+        if record.args and not all(isinstance(arg, IMMUTABLE_ARG_TYPES) for arg in record.args):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info and not record.exc_text:
+            # Tracebacks reference the frames of the logging thread; render them now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line, with the log context and truncated message.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'run_id': getattr(record, 'run_id', None),
+            'ticker': getattr(record, 'ticker', None),
+            'stage': getattr(record, 'stage', None),
+            'message': truncate(record.getMessage(), MAX_MESSAGE_CHARS)
+        }
+        if record.exc_text:
+            entry['exception'] = truncate(record.exc_text, MAX_EXCEPTION_CHARS)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """
+    Human-readable console format with a [ticker/stage] prefix and truncated messages.
+    """
+
+    def format(self, record):
+        parts = [part for part in (getattr(record, 'ticker', None), getattr(record, 'stage', None)) if part]
+        record.context = f"[{'/'.join(parts)}] " if parts else ''
+        record.message = truncate(record.getMessage(), MAX_MESSAGE_CHARS)
+        record.asctime = self.formatTime(record)
+        text = self.formatMessage(record)
+        if record.exc_text:
+            text = f"{text}\n{truncate(record.exc_text, MAX_EXCEPTION_CHARS)}"
+        return text
+
+
+def configure_logging(log_path=DEFAULT_LOG_PATH, level=logging.INFO, run_id=None):
+    """
+    Configures non-blocking logging: every thread only puts records on a queue, and a listener
+    thread writes them to the console and to a size-rotated JSON-lines file.
+    run_id is the default run identifier of the process's records. Returns the run identifier.
+    """
+    global _process_run_id, _listener
+    _process_run_id = run_id or _process_run_id or new_run_id()
+    if _listener is not None:
+        return _process_run_id
+
+    directory = os.path.dirname(log_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    file_handler = RotatingFileHandler(log_path, maxBytes=MAX_LOG_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    file_handler.setFormatter(JsonLinesFormatter())
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(ConsoleFormatter(CONSOLE_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, file_handler, console_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(ContextQueueHandler(log_queue))
+    root.setLevel(level)
+    return _process_run_id
@@ -0,0 +1,168 @@
+# src/summarizer.py
+
+import os
+import hashlib
+import sqlite3
+import logging
+from contextlib import contextmanager
+
+import openai
+from dotenv import load_dotenv
+
+from warehouse import connect as warehouse_connect, get_db_path, utc_now
+from structured_logging import ContextThreadPoolExecutor
+from deadline import network_timeout
+from llm import chat_completion
+
+SUMMARY_MODEL = "gpt-3.5-turbo"
+SUMMARY_MAX_TOKENS = 300
+# Upper bound on the article text sent to a single summary call
+MAX_INPUT_CHARS = 12000
+# Used when a summary call fails, so the report still gets the opening of the article
+FALLBACK_CHARS = 1500
+# System message of every summary call; the article follows in the user message
+SUMMARY_INSTRUCTIONS = """
+Condense the news article in the user message into at most 8 short bullet points of facts.
+Keep concrete numbers, dates, company names, guidance, regulatory actions and market reactions.
+Do not add opinions or information that is not in the article.
+""".strip()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS article_summaries (
+    content_hash TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    model TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+"""
+
+_initialized_paths = set()
+
+
+@contextmanager
+def connect(db_path=None):
+    """
+    Opens a warehouse connection and makes sure the summary cache table exists.
+    """
+    path = db_path or get_db_path()
+    with warehouse_connect(path) as conn:
+        if path not in _initialized_paths:
+            conn.executescript(SCHEMA)
+            _initialized_paths.add(path)
+        yield conn
+
+
+def content_hash(text):
+    """
+    Returns the cache key for an article body.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def load_cached_summaries(hashes, db_path=None):
+    """
+    Returns a dictionary mapping each cached content hash to its summary.
+    """
+    hashes = list(hashes)
+    if not hashes:
+        return {}
+    try:
+        with connect(db_path) as conn:
+            rows = conn.execute(
+                f"SELECT content_hash, summary FROM article_summaries "
+                f"WHERE model = ? AND content_hash IN ({', '.join('?' for _ in hashes)})",
+                [SUMMARY_MODEL, *hashes]
+            ).fetchall()
+        return {row['content_hash']: row['summary'] for row in rows}
+    except sqlite3.Error as e:
+        logging.error("An error occurred while loading cached summaries: %s", e)
+        return {}
+
+
+def store_summaries(summaries, db_path=None):
+    """
+    Stores a dictionary mapping content hashes to summaries.
+    """
+    if not summaries:
+        return
+    created_at = utc_now()
+    try:
+        with connect(db_path) as conn:
+            conn.executemany(
+                """
+                INSERT INTO article_summaries (content_hash, summary, model, created_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (content_hash) DO UPDATE SET
+                    summary = excluded.summary, model = excluded.model, created_at = excluded.created_at
+                """,
+                [(key, summary, SUMMARY_MODEL, created_at) for key, summary in summaries.items()]
+            )
+    except sqlite3.Error as e:
+        logging.error("An error occurred while storing summaries: %s", e)
+
+
+def summarize_article(title, text):
+    """
+    Condenses one article into a short list of facts with a small model call.
+    The prompt does not mention any ticker so the summary can be reused by every ticker citing the article.
+    Returns the summary, or None if the call failed.
+    """
+    content = f"Title: {title}\n\nArticle:\n{text[:MAX_INPUT_CHARS]}"
+    try:
+        response = chat_completion(
+            f'summary:{content_hash(text)}',
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": content}
+            ],
+            max_tokens=SUMMARY_MAX_TOKENS,
+            n=1,
+            stop=None,
+            temperature=0.2,
+            request_timeout=network_timeout(),
+        )
+        return response['choices'][0]['message']['content'].strip()
+    except Exception as e:
+        logging.error("An error occurred while summarizing '%s': %s", title, e)
+        return None
+
+
+def summarize_articles(articles, max_workers=4, db_path=None):
+    """
+    Map step of the map-reduce report mode: returns one fact summary per article (records.Article), in order.
+    Summaries are cached by content hash, so an article shared by several tickers or runs is
+    summarized only once. Missing summaries are produced by concurrent model calls; if a call fails,
+    the beginning of the article is used instead.
+    """
+    load_dotenv()
+    OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+    if OPENAI_API_KEY is None:
+        raise ValueError("OPENAI_API_KEY environment variable is not set.")
+    openai.api_key = OPENAI_API_KEY
+
+    hashes = [content_hash(article.full_content) for article in articles]
+    summaries = load_cached_summaries(set(hashes), db_path=db_path)
+
+    # Summarize each distinct missing body once
+    pending = {}
+    for key, article in zip(hashes, articles):
+        if key not in summaries and key not in pending and article.full_content:
+            pending[key] = article
+    logging.info("Summaries: %s cached or empty, %s to generate.", len(articles) - len(pending), len(pending))
+
+    if pending:
+        with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                key: executor.submit(summarize_article, article.title, article.full_content)
+                for key, article in pending.items()
+            }
+            generated = {key: future.result() for key, future in futures.items()}
+        new_summaries = {key: summary for key, summary in generated.items() if summary}
+        store_summaries(new_summaries, db_path=db_path)
+        summaries.update(new_summaries)
+
+    return [
+        summaries.get(key) or article.full_content[:FALLBACK_CHARS]
+        for key, article in zip(hashes, articles)
+    ]
@@ -0,0 +1,108 @@
+# src/text_cleaning.py
+
+import re
+
+MARKDOWN_IMAGE = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+MARKDOWN_LINK = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+BARE_URL = re.compile(r'(?:https?://|www\.)\S+')
+WHITESPACE = re.compile(r'[ \t\u00a0\u200b]+')
+SENTENCE_END = re.compile(r'[.!?]["\')\]]?(?=\s|$)')
+BOILERPLATE = re.compile(
+    r'\b(cookies?|subscribe|subscription|sign up|sign in|log in|newsletter|advertisement|sponsored|'
+    r'all rights reserved|privacy policy|terms of (?:use|service)|share (?:this|on)|follow us|'
+    r'read more|related (?:articles|stories)|skip to|download the app|accept all|manage preferences)\b',
+    re.IGNORECASE
+)
+
+# Lines whose text is mostly link anchors are navigation, link lists or "related" blocks
+MAX_LINK_RATIO = 0.5
+# Lines shorter than this without a sentence ending are menu items, bylines or buttons
+MIN_LINE_WORDS = 5
+# Short lines mentioning boilerplate vocabulary (cookie banners, sign-up prompts) are dropped
+MAX_BOILERPLATE_LINE_WORDS = 25
+# Paragraphs scoring below this are dropped (see _score_paragraph)
+MIN_PARAGRAPH_SCORE = 8
+# If cleaning keeps less than this fraction of the words, the page is unusual; keep the link-stripped text
+MIN_KEPT_FRACTION = 0.05
+
+
+def _strip_links(line):
+    """
+    Removes images and bare URLs and replaces markdown links by their anchor text.
+    Returns the stripped line and the number of characters that were link anchors.
+    """
+    line = MARKDOWN_IMAGE.sub('', line)
+    anchor_chars = sum(len(match.group(1)) for match in MARKDOWN_LINK.finditer(line))
+    line = MARKDOWN_LINK.sub(r'\1', line)
+    line = BARE_URL.sub('', line)
+    return WHITESPACE.sub(' ', line).strip(), anchor_chars
+
+
+def _is_noise_line(line):
+    """
+    Returns True for lines that look like navigation or banner text rather than article prose.
+    """
+    words = len(line.split())
+    if words < MIN_LINE_WORDS and not SENTENCE_END.search(line):
+        return True
+    return words < MAX_BOILERPLATE_LINE_WORDS and BOILERPLATE.search(line) is not None
+
+
+def _score_paragraph(lines):
+    """
+    Scores a paragraph by how much it looks like article prose: long, with complete sentences,
+    and without boilerplate vocabulary.
+    """
+    text = ' '.join(lines)
+    words = len(text.split())
+    sentences = len(SENTENCE_END.findall(text))
+    boilerplate_hits = len(BOILERPLATE.findall(text))
+    return words + 5 * sentences - 15 * boilerplate_hits
+
+
+def clean_article_text(text):
+    """
+    Fast boilerplate removal and normalization for extracted article text:
+    strips links and URLs, drops link-dominated, duplicate and navigation-like lines, then keeps only paragraphs that
+    score as article prose (navigation menus, cookie banners and link lists score low).
+    Returns the cleaned text.
+    """
+    if not text:
+        return ''
+
+    seen_lines = set()
+    paragraphs = []
+    current = []
+    total_words = 0
+    stripped_lines = []
+
+    for raw_line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
+        if not raw_line.strip():
+            if current:
+                paragraphs.append(current)
+                current = []
+            continue
+
+        line, anchor_chars = _strip_links(raw_line)
+        if not line:
+            continue
+        stripped_lines.append(line)
+        total_words += len(line.split())
+
+        if anchor_chars and anchor_chars / max(len(line), 1) > MAX_LINK_RATIO:
+            continue
+
+        key = line.lower()
+        if key in seen_lines or _is_noise_line(line):
+            continue
+        seen_lines.add(key)
+        current.append(line)
+    if current:
+        paragraphs.append(current)
+
+    kept = [' '.join(lines) for lines in paragraphs if _score_paragraph(lines) >= MIN_PARAGRAPH_SCORE]
+    cleaned = '\n\n'.join(kept)
+
+    if total_words and len(cleaned.split()) < MIN_KEPT_FRACTION * total_words:
+        return '\n'.join(stripped_lines)
+    return cleaned
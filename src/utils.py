@@ -0,0 +1,14 @@
+# src/utils.py
+
+from urllib.parse import urlparse
+
+def get_domain(url):
+    """
+    Extracts the domain from a given URL.
+    """
+    try:
+        parsed_url = urlparse(url)
+        domain = parsed_url.netloc.lower()
+        return domain
+    except:
+        return ''
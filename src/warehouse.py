@@ -0,0 +1,584 @@
+# src/warehouse.py
+
+import os
+import json
+import sqlite3
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_DB_PATH = os.path.join('data', 'hsfinance.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stock_snapshots (
+    ticker TEXT NOT NULL,
+    as_of_date TEXT NOT NULL,
+    period TEXT NOT NULL,
+    info_json TEXT NOT NULL,
+    fetched_at TEXT NOT NULL,
+    PRIMARY KEY (ticker, as_of_date, period)
+);
+
+CREATE TABLE IF NOT EXISTS quote_info (
+    ticker TEXT PRIMARY KEY,
+    info_json TEXT NOT NULL,
+    fetched_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS price_history (
+    ticker TEXT NOT NULL,
+    bar_date TEXT NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume REAL,
+    dividends REAL,
+    stock_splits REAL,
+    PRIMARY KEY (ticker, bar_date)
+);
+
+CREATE TABLE IF NOT EXISTS intraday_bars (
+    ticker TEXT NOT NULL,
+    interval TEXT NOT NULL,
+    session_date TEXT NOT NULL,
+    bars INTEGER NOT NULL,
+    payload BLOB NOT NULL,
+    fetched_at TEXT NOT NULL,
+    PRIMARY KEY (ticker, interval, session_date)
+);
+
+CREATE TABLE IF NOT EXISTS serper_results (
+    ticker TEXT NOT NULL,
+    as_of_date TEXT NOT NULL,
+    query TEXT NOT NULL,
+    category TEXT NOT NULL,
+    payload_json TEXT NOT NULL,
+    fetched_at TEXT NOT NULL,
+    PRIMARY KEY (ticker, as_of_date, query)
+);
+CREATE INDEX IF NOT EXISTS idx_serper_results_category
+    ON serper_results (ticker, category, as_of_date);
+
+CREATE TABLE IF NOT EXISTS serper_query_stats (
+    ticker TEXT NOT NULL,
+    as_of_date TEXT NOT NULL,
+    query TEXT NOT NULL,
+    category TEXT NOT NULL,
+    hits INTEGER NOT NULL,
+    unique_hits INTEGER NOT NULL,
+    redundant INTEGER NOT NULL,
+    PRIMARY KEY (ticker, as_of_date, query)
+);
+
+CREATE TABLE IF NOT EXISTS articles (
+    ticker TEXT NOT NULL,
+    as_of_date TEXT NOT NULL,
+    link TEXT NOT NULL,
+    title TEXT,
+    category TEXT,
+    snippet TEXT,
+    full_content TEXT,
+    fetched_at TEXT NOT NULL,
+    PRIMARY KEY (ticker, as_of_date, link)
+);
+CREATE INDEX IF NOT EXISTS idx_articles_link ON articles (link);
+CREATE INDEX IF NOT EXISTS idx_articles_category ON articles (ticker, category, as_of_date);
+
+CREATE TABLE IF NOT EXISTS reports (
+    ticker TEXT NOT NULL,
+    as_of_date TEXT NOT NULL,
+    report_text TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (ticker, as_of_date)
+);
+"""
+
+# Database paths whose schema has already been created in this process
+_initialized_paths = set()
+
+
+def get_db_path():
+    """
+    Returns the warehouse path, honouring the HSFINANCE_DB_PATH environment variable.
+    """
+    return os.getenv('HSFINANCE_DB_PATH', DEFAULT_DB_PATH)
+
+
+def today():
+    """
+    Returns the current date as a YYYY-MM-DD string, used as the warehouse date key.
+    """
+    return datetime.now().strftime('%Y-%m-%d')
+
+
+def utc_now():
+    """
+    Returns the current UTC time as an ISO-8601 string.
+    """
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+@contextmanager
+def connect(db_path=None):
+    """
+    Opens a connection to the warehouse in WAL mode, creating the schema on first use.
+    Commits on success and rolls back on error.
+    """
+    path = db_path or get_db_path()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        if path not in _initialized_paths:
+            conn.executescript(SCHEMA)
+            _initialized_paths.add(path)
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _price_rows(ticker, history):
+    """
+    Converts a price history (records.PriceBars or a list of bar dictionaries) to price_history rows.
+    """
+    if isinstance(history, list):
+        rows = (
+            (row.get('Date'), row.get('Open'), row.get('High'), row.get('Low'), row.get('Close'),
+             row.get('Volume'), row.get('Dividends'), row.get('Stock Splits'))
+            for row in history
+        )
+    else:
+        # records.PriceBars
+        rows = history.rows()
+    return [(ticker, str(bar_date), *values) for bar_date, *values in rows if bar_date]
+
+
+def _upsert_price_rows(conn, bars):
+    conn.executemany(
+        """
+        INSERT INTO price_history
+            (ticker, bar_date, open, high, low, close, volume, dividends, stock_splits)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (ticker, bar_date) DO UPDATE SET
+            open = excluded.open, high = excluded.high, low = excluded.low,
+            close = excluded.close, volume = excluded.volume,
+            dividends = excluded.dividends, stock_splits = excluded.stock_splits
+        """,
+        bars
+    )
+
+
+def store_stock_data(ticker, stock_data, period, as_of_date=None, db_path=None):
+    """
+    Upserts the quote snapshot and the price history bars for the given ticker.
+    """
+    as_of_date = as_of_date or today()
+    bars = _price_rows(ticker, stock_data.get('history', []))
+
+    try:
+        with connect(db_path) as conn:
+            conn.execute(
+                """
+                INSERT INTO stock_snapshots (ticker, as_of_date, period, info_json, fetched_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (ticker, as_of_date, period) DO UPDATE SET
+                    info_json = excluded.info_json,
+                    fetched_at = excluded.fetched_at
+                """,
+                (ticker, as_of_date, period, json.dumps(stock_data.get('info', {})), utc_now())
+            )
+            _upsert_price_rows(conn, bars)
+        logging.info("Stored stock data for %s (%s bars) in the warehouse.", ticker, len(bars))
+        return True
+    except sqlite3.Error as e:
+        logging.error("An error occurred while storing stock data for %s: %s", ticker, e)
+        return False
+
+
+def store_quote_info(ticker, info, db_path=None):
+    """
+    Caches the full yfinance .info payload of a ticker, replacing the previous one.
+    """
+    try:
+        with connect(db_path) as conn:
+            conn.execute(
+                """
+                INSERT INTO quote_info (ticker, info_json, fetched_at) VALUES (?, ?, ?)
+                ON CONFLICT (ticker) DO UPDATE SET
+                    info_json = excluded.info_json,
+                    fetched_at = excluded.fetched_at
+                """,
+                (ticker, json.dumps(info), utc_now())
+            )
+        return True
+    except sqlite3.Error as e:
+        logging.error("An error occurred while caching the quote info of %s: %s", ticker, e)
+        return False
+
+
+def load_quote_info(ticker, max_age_days=7, db_path=None):
+    """
+    Returns the cached .info payload of a ticker, or None if there is none or it is older than max_age_days.
+    """
+    since = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).isoformat(timespec='seconds')
+    try:
+        with connect(db_path) as conn:
+            row = conn.execute(
+                "SELECT info_json FROM quote_info WHERE ticker = ? AND fetched_at >= ?", (ticker, since)
+            ).fetchone()
+        return json.loads(row['info_json']) if row else None
+    except sqlite3.Error as e:
+        logging.error("An error occurred while loading the quote info of %s: %s", ticker, e)
+        return None
+
+
+def store_price_history(ticker, history, db_path=None):
+    """
+    Upserts price history bars (records.PriceBars or a list of bar dictionaries) without a snapshot,
+    e.g. the bars of an incremental refresh.
+    """
+    bars = _price_rows(ticker, history)
+    try:
+        with connect(db_path) as conn:
+            _upsert_price_rows(conn, bars)
+        return True
+    except sqlite3.Error as e:
+        logging.error("An error occurred while storing price history for %s: %s", ticker, e)
+        return False
+
+
+def latest_bar_date(ticker, db_path=None):
+    """
+    Returns the date of the most recent stored price bar for a ticker, or None.
+    """
+    try:
+        with connect(db_path) as conn:
+            row = conn.execute("SELECT MAX(bar_date) AS bar_date FROM price_history WHERE ticker = ?", (ticker,)).fetchone()
+        return row['bar_date']
+    except sqlite3.Error as e:
+        logging.error("An error occurred while loading the latest bar date for %s: %s", ticker, e)
+        return None
+
+
+def load_stock_data(ticker, as_of_date=None, period=None, start_date=None, end_date=None, db_path=None):
+    """
+    Loads the latest stock info snapshot (optionally for a given date and period) together with
+    the price history between start_date and end_date.
+    Returns a dictionary with 'info' and 'history' keys, or None if nothing is stored.
+    """
+    snapshot_sql = "SELECT info_json FROM stock_snapshots WHERE ticker = ?"
+    snapshot_params = [ticker]
+    if as_of_date:
+        snapshot_sql += " AND as_of_date = ?"
+        snapshot_params.append(as_of_date)
+    if period:
+        snapshot_sql += " AND period = ?"
+        snapshot_params.append(period)
+    snapshot_sql += " ORDER BY as_of_date DESC, fetched_at DESC LIMIT 1"
+
+    try:
+        with connect(db_path) as conn:
+            snapshot = conn.execute(snapshot_sql, snapshot_params).fetchone()
+            if snapshot is None:
+                return None
+            history = load_price_history(ticker, start_date, end_date, conn=conn)
+        return {
+            'info': json.loads(snapshot['info_json']),
+            'history': history
+        }
+    except sqlite3.Error as e:
+        logging.error("An error occurred while loading stock data for %s: %s", ticker, e)
+        return None
+
+
+def load_price_history(ticker, start_date=None, end_date=None, conn=None, db_path=None):
+    """
+    Returns the stored price bars for a ticker as records.PriceBars ordered by date.
+    """
+    # Imported here so that importing the warehouse does not load NumPy and pandas
+    from records import PriceBars
+
+    sql = """
+        SELECT bar_date, open, high, low, close, volume, dividends, stock_splits
+        FROM price_history WHERE ticker = ?
+    """
+    params = [ticker]
+    if start_date:
+        sql += " AND bar_date >= ?"
+        params.append(start_date)
+    if end_date:
+        sql += " AND bar_date <= ?"
+        params.append(end_date)
+    sql += " ORDER BY bar_date"
+
+    def _rows(connection):
+        return PriceBars.from_rows(tuple(row) for row in connection.execute(sql, params))
+
+    if conn is not None:
+        return _rows(conn)
+    with connect(db_path) as connection:
+        return _rows(connection)
+
+
+def store_intraday_sessions(ticker, interval, sessions, db_path=None):
+    """
+    Upserts intraday bars, one row per UTC session date. sessions maps each 'YYYY-MM-DD' date to its
+    records.IntradayBars (possibly empty, for days without trading); bars are stored in their compact
+    binary layout.
+    """
+    fetched_at = utc_now()
+    rows = [
+        (ticker, interval, session_date, len(bars), bars.to_bytes(), fetched_at)
+        for session_date, bars in sessions.items()
+    ]
+    try:
+        with connect(db_path) as conn:
+            conn.executemany(
+                """
+                INSERT INTO intraday_bars (ticker, interval, session_date, bars, payload, fetched_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (ticker, interval, session_date) DO UPDATE SET
+                    bars = excluded.bars, payload = excluded.payload, fetched_at = excluded.fetched_at
+                """,
+                rows
+            )
+        return True
+    except sqlite3.Error as e:
+        logging.error("An error occurred while storing intraday bars for %s: %s", ticker, e)
+        return False
+
+
+def load_intraday_sessions(ticker, interval, start_date=None, end_date=None, db_path=None):
+    """
+    Returns a dictionary mapping each stored 'YYYY-MM-DD' session date to its records.IntradayBars.
+    Only sessions fetched after their UTC day had ended are returned: a session stored while it was
+    still trading is incomplete, so it is left out and fetched again.
+    """
+    # Imported here so that importing the warehouse does not load NumPy and pandas
+    from records import IntradayBars
+
+    sql = ("SELECT session_date, payload FROM intraday_bars WHERE ticker = ? AND interval = ? "
+           "AND substr(fetched_at, 1, 10) > session_date")
+    params = [ticker, interval]
+    if start_date:
+        sql += " AND session_date >= ?"
+        params.append(start_date)
+    if end_date:
+        sql += " AND session_date <= ?"
+        params.append(end_date)
+    try:
+        with connect(db_path) as conn:
+            return {
+                row['session_date']: IntradayBars.from_bytes(row['payload'], interval)
+                for row in conn.execute(sql, params)
+            }
+    except sqlite3.Error as e:
+        logging.error("An error occurred while loading intraday bars for %s: %s", ticker, e)
+        return {}
+
+
+def store_serper_results(ticker, query, category, data, as_of_date=None, db_path=None):
+    """
+    Upserts the raw SERPER response for a (ticker, date, query) key.
+    """
+    as_of_date = as_of_date or today()
+    try:
+        with connect(db_path) as conn:
+            conn.execute(
+                """
+                INSERT INTO serper_results (ticker, as_of_date, query, category, payload_json, fetched_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (ticker, as_of_date, query) DO UPDATE SET
+                    category = excluded.category,
+                    payload_json = excluded.payload_json,
+                    fetched_at = excluded.fetched_at
+                """,
+                (ticker, as_of_date, query, category, json.dumps(data), utc_now())
+            )
+        return True
+    except sqlite3.Error as e:
+        logging.error("An error occurred while storing SERPER results for '%s': %s", query, e)
+        return False
+
+
+def load_serper_results(ticker, query, as_of_date=None, db_path=None):
+    """
+    Returns the stored SERPER response for a query on the given date (today by default),
+    or None if the query has not been fetched for that date.
+    """
+    as_of_date = as_of_date or today()
+    try:
+        with connect(db_path) as conn:
+            row = conn.execute(
+                "SELECT payload_json FROM serper_results WHERE ticker = ? AND as_of_date = ? AND query = ?",
+                (ticker, as_of_date, query)
+            ).fetchone()
+        return json.loads(row['payload_json']) if row else None
+    except sqlite3.Error as e:
+        logging.error("An error occurred while loading SERPER results for '%s': %s", query, e)
+        return None
+
+
+def store_query_stats(ticker, category, stats, as_of_date=None, db_path=None):
+    """
+    Upserts the per-query overlap statistics (see serper_api.query_overlap_stats) of one category.
+    """
+    as_of_date = as_of_date or today()
+    rows = [
+        (ticker, as_of_date, query, category, stat['hits'], stat['unique_hits'], int(stat['redundant']))
+        for query, stat in stats.items()
+    ]
+    try:
+        with connect(db_path) as conn:
+            conn.executemany(
+                """
+                INSERT INTO serper_query_stats
+                    (ticker, as_of_date, query, category, hits, unique_hits, redundant)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (ticker, as_of_date, query) DO UPDATE SET
+                    category = excluded.category, hits = excluded.hits,
+                    unique_hits = excluded.unique_hits, redundant = excluded.redundant
+                """,
+                rows
+            )
+        return True
+    except sqlite3.Error as e:
+        logging.error("An error occurred while storing query statistics for %s: %s", ticker, e)
+        return False
+
+
+def load_redundant_queries(ticker, max_age_days=7, db_path=None):
+    """
+    Returns the queries whose most recent statistics within the last max_age_days flagged them as redundant.
+    Once the statistics expire, the query is sent again and re-evaluated.
+    """
+    since_date = (datetime.now() - timedelta(days=max_age_days)).strftime('%Y-%m-%d')
+    try:
+        with connect(db_path) as conn:
+            rows = conn.execute(
+                """
+                SELECT query, redundant FROM serper_query_stats AS s
+                WHERE ticker = ? AND as_of_date >= ? AND as_of_date = (
+                    SELECT MAX(as_of_date) FROM serper_query_stats
+                    WHERE ticker = s.ticker AND query = s.query
+                )
+                """,
+                (ticker, since_date)
+            ).fetchall()
+        return {row['query'] for row in rows if row['redundant']}
+    except sqlite3.Error as e:
+        logging.error("An error occurred while loading query statistics for %s: %s", ticker, e)
+        return set()
+
+
+def store_articles(ticker, articles, as_of_date=None, db_path=None):
+    """
+    Upserts fetched articles (records.Article) for the given ticker and date.
+    """
+    as_of_date = as_of_date or today()
+    fetched_at = utc_now()
+    rows = [
+        (
+            ticker, as_of_date, article.link, article.title,
+            article.category, article.snippet, article.full_content, fetched_at
+        )
+        for article in articles if article.link
+    ]
+    try:
+        with connect(db_path) as conn:
+            conn.executemany(
+                """
+                INSERT INTO articles
+                    (ticker, as_of_date, link, title, category, snippet, full_content, fetched_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (ticker, as_of_date, link) DO UPDATE SET
+                    title = excluded.title,
+                    category = excluded.category,
+                    snippet = excluded.snippet,
+                    full_content = excluded.full_content,
+                    fetched_at = excluded.fetched_at
+                """,
+                rows
+            )
+        logging.info("Stored %s article(s) for %s in the warehouse.", len(rows), ticker)
+        return True
+    except sqlite3.Error as e:
+        logging.error("An error occurred while storing articles for %s: %s", ticker, e)
+        return False
+
+
+def load_articles(ticker, as_of_date=None, category=None, db_path=None):
+    """
+    Returns the stored articles for a ticker, optionally filtered by date and category,
+    most recent first.
+    """
+    sql = "SELECT * FROM articles WHERE ticker = ?"
+    params = [ticker]
+    if as_of_date:
+        sql += " AND as_of_date = ?"
+        params.append(as_of_date)
+    if category:
+        sql += " AND category = ?"
+        params.append(category)
+    sql += " ORDER BY as_of_date DESC, fetched_at DESC"
+    try:
+        with connect(db_path) as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+    except sqlite3.Error as e:
+        logging.error("An error occurred while loading articles for %s: %s", ticker, e)
+        return []
+
+
+def store_report(ticker, report_text, as_of_date=None, db_path=None):
+    """
+    Upserts the generated report for the given ticker and date.
+    """
+    as_of_date = as_of_date or today()
+    try:
+        with connect(db_path) as conn:
+            conn.execute(
+                """
+                INSERT INTO reports (ticker, as_of_date, report_text, created_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (ticker, as_of_date) DO UPDATE SET
+                    report_text = excluded.report_text,
+                    created_at = excluded.created_at
+                """,
+                (ticker, as_of_date, report_text, utc_now())
+            )
+        return True
+    except sqlite3.Error as e:
+        logging.error("An error occurred while storing the report for %s: %s", ticker, e)
+        return False
+
+
+def load_reports(ticker, start_date=None, end_date=None, db_path=None):
+    """
+    Returns the stored reports for a ticker between start_date and end_date, most recent first.
+    """
+    sql = "SELECT ticker, as_of_date, report_text, created_at FROM reports WHERE ticker = ?"
+    params = [ticker]
+    if start_date:
+        sql += " AND as_of_date >= ?"
+        params.append(start_date)
+    if end_date:
+        sql += " AND as_of_date <= ?"
+        params.append(end_date)
+    sql += " ORDER BY as_of_date DESC"
+    try:
+        with connect(db_path) as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+    except sqlite3.Error as e:
+        logging.error("An error occurred while loading reports for %s: %s", ticker, e)
+        return []
@@ -0,0 +1,318 @@
+# src/watch.py
+
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from warehouse import (
+    connect as warehouse_connect,
+    get_db_path,
+    utc_now,
+    today,
+    store_serper_results,
+    store_price_history,
+    latest_bar_date,
+    load_price_history
+)
+from domain_health import get_blocked_domains
+from utils import get_domain
+from structured_logging import configure_logging, log_context
+from main import add_pipeline_arguments, check_environment, base_queries, run_pipeline
+
+DEFAULT_POLL_SECONDS = 300
+# Default triggers: relative price move since the last report, last bar volume over its trailing
+# average, and new relevant articles accumulated since the last report
+DEFAULT_PRICE_MOVE = 0.02
+DEFAULT_VOLUME_SPIKE = 2.0
+DEFAULT_NEW_ARTICLES = 3
+DEFAULT_COOLDOWN_MINUTES = 60
+VOLUME_LOOKBACK_BARS = 20
+# History fetched the first time a ticker is watched; later polls only fetch bars since the last stored one
+INITIAL_HISTORY_PERIOD = '3mo'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS watch_state (
+    ticker TEXT PRIMARY KEY,
+    last_price REAL,
+    last_checked_at TEXT,
+    pending_articles INTEGER NOT NULL DEFAULT 0,
+    report_price REAL,
+    reported_at REAL,
+    report_reasons TEXT
+);
+CREATE TABLE IF NOT EXISTS watch_seen_urls (
+    ticker TEXT NOT NULL,
+    link TEXT NOT NULL,
+    first_seen_at TEXT NOT NULL,
+    PRIMARY KEY (ticker, link)
+);
+"""
+
+_initialized_paths = set()
+
+
+@contextmanager
+def connect(db_path=None):
+    """
+    Opens a warehouse connection and makes sure the watch tables exist.
+    """
+    path = db_path or get_db_path()
+    with warehouse_connect(path) as conn:
+        if path not in _initialized_paths:
+            conn.executescript(SCHEMA)
+            _initialized_paths.add(path)
+        yield conn
+
+
+def get_watch_state(ticker, db_path=None):
+    """
+    Returns the watch state of a ticker as a dictionary, or None if it has never been polled.
+    """
+    try:
+        with connect(db_path) as conn:
+            row = conn.execute("SELECT * FROM watch_state WHERE ticker = ?", (ticker,)).fetchone()
+        return dict(row) if row else None
+    except sqlite3.Error as e:
+        logging.error("An error occurred while loading the watch state for %s: %s", ticker, e)
+        return None
+
+
+def record_poll(ticker, last_price, new_articles, db_path=None):
+    """
+    Records the latest polled price and adds newly seen articles to the pending count.
+    """
+    try:
+        with connect(db_path) as conn:
+            conn.execute(
+                """
+                INSERT INTO watch_state (ticker, last_price, last_checked_at, pending_articles)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (ticker) DO UPDATE SET
+                    last_price = COALESCE(excluded.last_price, last_price),
+                    last_checked_at = excluded.last_checked_at,
+                    pending_articles = pending_articles + excluded.pending_articles
+                """,
+                (ticker, last_price, utc_now(), new_articles)
+            )
+    except sqlite3.Error as e:
+        logging.error("An error occurred while recording the poll of %s: %s", ticker, e)
+
+
+def record_report(ticker, price, reasons, db_path=None):
+    """
+    Records a regenerated report: the price it was based on and why it was triggered.
+    Resets the pending article count.
+    """
+    try:
+        with connect(db_path) as conn:
+            conn.execute(
+                """
+                UPDATE watch_state SET report_price = ?, reported_at = ?, report_reasons = ?, pending_articles = 0
+                WHERE ticker = ?
+                """,
+                (price, time.time(), '; '.join(reasons), ticker)
+            )
+    except sqlite3.Error as e:
+        logging.error("An error occurred while recording the report of %s: %s", ticker, e)
+
+
+def mark_seen_urls(ticker, links, db_path=None):
+    """
+    Records links as seen for a ticker. Returns the subset that had not been seen before.
+    """
+    first_seen_at = utc_now()
+    new_links = set()
+    try:
+        with connect(db_path) as conn:
+            for link in links:
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO watch_seen_urls (ticker, link, first_seen_at) VALUES (?, ?, ?)",
+                    (ticker, link, first_seen_at)
+                ).rowcount
+                if inserted:
+                    new_links.add(link)
+    except sqlite3.Error as e:
+        logging.error("An error occurred while recording seen URLs for %s: %s", ticker, e)
+    return new_links
+
+
+def poll_quote(ticker):
+    """
+    Reads the latest price from yfinance's fast_info, which avoids the slow full quote summary.
+    Returns a dictionary with 'last_price' and 'previous_close', or None.
+    """
+    import yfinance as yf
+    try:
+        fast_info = yf.Ticker(ticker).fast_info
+        return {'last_price': float(fast_info.last_price), 'previous_close': float(fast_info.previous_close)}
+    except Exception as e:
+        logging.error("An error occurred while polling the quote of %s: %s", ticker, e)
+        return None
+
+
+def refresh_history(ticker, db_path=None):
+    """
+    Incrementally refreshes the daily price history: only bars from the last stored date on (which
+    may still be an open session) are fetched and upserted.
+    Returns the stored bars of the last VOLUME_LOOKBACK_BARS sessions and some margin, as records.PriceBars.
+    """
+    import yfinance as yf
+    from records import PriceBars
+
+    last_date = latest_bar_date(ticker, db_path=db_path)
+    try:
+        stock = yf.Ticker(ticker)
+        df = stock.history(start=last_date) if last_date else stock.history(period=INITIAL_HISTORY_PERIOD)
+        if not df.empty:
+            bars = PriceBars.from_frame(df.reset_index())
+            store_price_history(ticker, bars, db_path=db_path)
+            logging.info("Refreshed %s bar(s) of %s since %s.", len(bars), ticker, last_date or INITIAL_HISTORY_PERIOD)
+    except Exception as e:
+        logging.error("An error occurred while refreshing the history of %s: %s", ticker, e)
+
+    start_date = (datetime.now(timezone.utc) - timedelta(days=3 * VOLUME_LOOKBACK_BARS)).strftime('%Y-%m-%d')
+    return load_price_history(ticker, start_date=start_date, db_path=db_path)
+
+
+def check_new_articles(ticker, db_path=None):
+    """
+    Runs the base SERPER queries and returns the number of result URLs (canonicalized, from domains
+    that are not blocked) that have not been seen for the ticker before. The results are stored in
+    the warehouse, so a regenerated report reuses them instead of querying again.
+    """
+    from serper_api import fetch_serper_data, canonicalize_url
+
+    queries, query_categories = base_queries(ticker)
+    blocked_domains = get_blocked_domains(db_path)
+    links = set()
+    for filename, query in queries.items():
+        data = fetch_serper_data(query, f'{ticker}_{filename}')
+        if data is None:
+            continue
+        store_serper_results(ticker, query, query_categories[filename], data, as_of_date=today(), db_path=db_path)
+        for result in data.get('organic', []):
+            link = result.get('link', '')
+            if link and get_domain(link) not in blocked_domains:
+                links.add(canonicalize_url(link))
+    return len(mark_seen_urls(ticker, links, db_path=db_path))
+
+
+def volume_spike_ratio(bars, lookback=VOLUME_LOOKBACK_BARS):
+    """
+    Returns the volume of the last bar divided by the average volume of the lookback bars before it,
+    or None if there is not enough history.
+    """
+    if bars is None or len(bars) < 2:
+        return None
+    trailing = bars.volume[-1 - lookback:-1]
+    average = float(trailing[trailing == trailing].mean()) if len(trailing) else 0.0
+    if not average:
+        return None
+    return float(bars.volume[-1]) / average
+
+
+def evaluate_triggers(state, quote, bars, new_articles, args):
+    """
+    Returns the reasons for regenerating a ticker's report, or an empty list if none of the
+    configured triggers fired.
+    """
+    if state is None or state.get('reported_at') is None:
+        return ['initial report']
+
+    reasons = []
+    if quote:
+        reference = state.get('report_price') or quote['previous_close']
+        if reference:
+            move = quote['last_price'] / reference - 1.0
+            if abs(move) >= args.price_move:
+                reasons.append(f"price moved {move:+.2%} since the last report")
+    ratio = volume_spike_ratio(bars)
+    if ratio is not None and ratio >= args.volume_spike:
+        reasons.append(f"volume {ratio:.1f}x its {VOLUME_LOOKBACK_BARS}-bar average")
+    pending = (state.get('pending_articles') or 0) + new_articles
+    if pending >= args.new_articles:
+        reasons.append(f"{pending} new article(s)")
+
+    if reasons and time.time() - state['reported_at'] < args.cooldown_minutes * 60:
+        logging.info("Triggers fired but the cooldown is active: %s", ', '.join(reasons))
+        return []
+    return reasons
+
+
+def poll_ticker(ticker, args):
+    """
+    Polls one ticker and regenerates its report if a trigger fires.
+    Returns True if a report was generated.
+    """
+    db_path = args.db_path
+    state = get_watch_state(ticker, db_path=db_path)
+    quote = poll_quote(ticker)
+    bars = refresh_history(ticker, db_path=db_path)
+    new_articles = check_new_articles(ticker, db_path=db_path)
+    last_price = quote['last_price'] if quote else None
+    logging.info("Polled %s: price %s, %s new article(s).", ticker, last_price, new_articles)
+
+    reasons = evaluate_triggers(state, quote, bars, new_articles, args)
+    record_poll(ticker, last_price, new_articles, db_path=db_path)
+    if not reasons:
+        return False
+
+    logging.info("Regenerating the report of %s: %s", ticker, ', '.join(reasons))
+    if run_pipeline(ticker, args) is None:
+        logging.error("Report regeneration failed for %s; it will be retried on the next poll.", ticker)
+        return False
+    record_report(ticker, last_price, reasons, db_path=db_path)
+    return True
+
+
+def watch(tickers, args):
+    """
+    Polls every ticker of the watchlist each poll interval until interrupted (or for max_cycles cycles).
+    """
+    cycle = 0
+    while True:
+        cycle += 1
+        started_at = time.monotonic()
+        regenerated = 0
+        for ticker in tickers:
+            try:
+                with log_context(ticker=ticker, stage='watch'):
+                    regenerated += poll_ticker(ticker, args)
+            except Exception as e:
+                logging.exception("An error occurred while polling %s: %s", ticker, e)
+        logging.info("Watch cycle %s: %s of %s report(s) regenerated.", cycle, regenerated, len(tickers))
+
+        if args.max_cycles and cycle >= args.max_cycles:
+            return
+        time.sleep(max(args.poll_seconds - (time.monotonic() - started_at), 0))
+
+
+def parse_arguments():
+    """
+    Parses command-line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Watch a list of tickers and regenerate their reports when triggers fire.')
+    parser.add_argument('tickers', nargs='+', help='Stock ticker symbols to watch')
+    parser.add_argument('--poll-seconds', type=int, default=DEFAULT_POLL_SECONDS, help='Seconds between the starts of two polls of the watchlist')
+    parser.add_argument('--price-move', type=float, default=DEFAULT_PRICE_MOVE, help='Relative price move since the last report that triggers a new one (e.g. 0.02)')
+    parser.add_argument('--volume-spike', type=float, default=DEFAULT_VOLUME_SPIKE, help=f'Last bar volume over its {VOLUME_LOOKBACK_BARS}-bar average that triggers a new report')
+    parser.add_argument('--new-articles', type=int, default=DEFAULT_NEW_ARTICLES, help='Number of new relevant articles since the last report that triggers a new one')
+    parser.add_argument('--cooldown-minutes', type=int, default=DEFAULT_COOLDOWN_MINUTES, help='Minimum time between two reports of the same ticker')
+    parser.add_argument('--max-cycles', type=int, default=0, help='Stop after this many polls of the watchlist (0 runs until interrupted)')
+    add_pipeline_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    configure_logging()
+    if not check_environment():
+        sys.exit(1)
+    try:
+        watch([ticker.upper() for ticker in args.tickers], args)
+    except KeyboardInterrupt:
+        logging.info("Watch mode stopped.")
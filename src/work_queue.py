@@ -0,0 +1,390 @@
+# src/work_queue.py
+
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from warehouse import connect as warehouse_connect, get_db_path
+
+# Job states
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_LEASE_SECONDS = 15 * 60
+REDIS_PREFIX = 'hsfinance:queue'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue_jobs (
+    job_id TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    options TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_queue_jobs_status ON queue_jobs (status, enqueued_at);
+CREATE INDEX IF NOT EXISTS idx_queue_jobs_run ON queue_jobs (run_id);
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class Job:
+    """
+    A claimed job. lease_owner identifies the claim: a worker whose lease expired and was taken
+    over by another worker can no longer renew, ack or fail the job.
+    """
+    job_id: str
+    run_id: str
+    ticker: str
+    options: dict
+    attempts: int
+    lease_owner: str
+
+
+def job_id_for(run_id, ticker):
+    """
+    Returns the job id of a ticker in a run. Enqueuing the same ticker twice in a run is a no-op.
+    """
+    return f'{run_id}:{ticker}'
+
+
+def _decode_job_row(row):
+    """
+    Converts a stored job (SQLite row or Redis hash) into a plain dictionary for the run report.
+    """
+    job = dict(row)
+    job['options'] = json.loads(job.get('options') or '{}')
+    job['result'] = json.loads(job['result']) if job.get('result') else None
+    for key in ('attempts', 'max_attempts'):
+        job[key] = int(job.get(key) or 0)
+    for key in ('lease_expires_at', 'enqueued_at', 'started_at', 'finished_at'):
+        job[key] = float(job[key]) if job.get(key) not in (None, '') else None
+    return job
+
+
+class SQLiteQueue:
+    """
+    Work queue stored in a SQLite file (by default the warehouse). Claims run in an immediate
+    transaction, so concurrent workers sharing the file never claim the same job.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or get_db_path()
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self, immediate=False):
+        with warehouse_connect(self.db_path) as conn:
+            if not self._initialized:
+                conn.executescript(SCHEMA)
+                self._initialized = True
+            if immediate:
+                conn.execute('BEGIN IMMEDIATE')
+            yield conn
+
+    def enqueue(self, run_id, ticker, options, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Adds a job. Returns False if the job already exists.
+        """
+        with self._connect() as conn:
+            inserted = conn.execute(
+                """
+                INSERT OR IGNORE INTO queue_jobs (job_id, run_id, ticker, options, status, max_attempts, enqueued_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (job_id_for(run_id, ticker), run_id, ticker, json.dumps(options), PENDING, max_attempts, time.time())
+            ).rowcount
+        return bool(inserted)
+
+    def claim(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Leases the oldest pending job, or a job whose lease expired. Expired jobs that used up their
+        attempts are marked as failed instead. Returns a Job, or None if nothing can be claimed.
+        """
+        now = time.time()
+        with self._connect(immediate=True) as conn:
+            conn.execute(
+                """
+                UPDATE queue_jobs SET status = ?, lease_owner = NULL, finished_at = ?,
+                    last_error = COALESCE(last_error, 'lease expired')
+                WHERE status = ? AND lease_expires_at < ? AND attempts >= max_attempts
+                """,
+                (FAILED, now, LEASED, now)
+            )
+            row = conn.execute(
+                """
+                SELECT * FROM queue_jobs
+                WHERE status = ? OR (status = ? AND lease_expires_at < ?)
+                ORDER BY enqueued_at, job_id LIMIT 1
+                """,
+                (PENDING, LEASED, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                """
+                UPDATE queue_jobs SET status = ?, attempts = attempts + 1, lease_owner = ?,
+                    lease_expires_at = ?, started_at = ?
+                WHERE job_id = ?
+                """,
+                (LEASED, worker_id, now + lease_seconds, now, row['job_id'])
+            )
+        return Job(row['job_id'], row['run_id'], row['ticker'], json.loads(row['options']), row['attempts'] + 1, worker_id)
+
+    def renew(self, job, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Extends the lease of a job. Returns False if the worker no longer holds it.
+        """
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE queue_jobs SET lease_expires_at = ? WHERE job_id = ? AND status = ? AND lease_owner = ?",
+                (time.time() + lease_seconds, job.job_id, LEASED, job.lease_owner)
+            ).rowcount
+        return bool(updated)
+
+    def ack(self, job, result):
+        """
+        Marks a job as done with its result. Returns False if the worker no longer holds it.
+        """
+        with self._connect() as conn:
+            updated = conn.execute(
+                """
+                UPDATE queue_jobs SET status = ?, finished_at = ?, result = ?, lease_expires_at = NULL
+                WHERE job_id = ? AND status = ? AND lease_owner = ?
+                """,
+                (DONE, time.time(), json.dumps(result), job.job_id, LEASED, job.lease_owner)
+            ).rowcount
+        return bool(updated)
+
+    def fail(self, job, error):
+        """
+        Releases a job after a failed attempt: it goes back to pending, or is marked as failed once
+        it used up its attempts. Returns False if the worker no longer holds it.
+        """
+        with self._connect() as conn:
+            updated = conn.execute(
+                """
+                UPDATE queue_jobs SET
+                    status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END,
+                    finished_at = CASE WHEN attempts >= max_attempts THEN ? ELSE NULL END,
+                    lease_owner = NULL, lease_expires_at = NULL, last_error = ?
+                WHERE job_id = ? AND status = ? AND lease_owner = ?
+                """,
+                (FAILED, PENDING, time.time(), error, job.job_id, LEASED, job.lease_owner)
+            ).rowcount
+        return bool(updated)
+
+    def has_open_jobs(self):
+        """
+        Returns True while any job is pending or leased.
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT 1 FROM queue_jobs WHERE status IN (?, ?) LIMIT 1", (PENDING, LEASED)).fetchone()
+        return row is not None
+
+    def run_jobs(self, run_id):
+        """
+        Returns every job of a run as a dictionary.
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM queue_jobs WHERE run_id = ? ORDER BY enqueued_at, job_id", (run_id,)).fetchall()
+        return [_decode_job_row(row) for row in rows]
+
+
+# Lua scripts of the Redis backend: every state change runs on the server as one atomic step, so a
+# crash or a racing worker cannot leave a job popped but unleased, or requeued and leased at once.
+# The status strings are PENDING, LEASED, DONE and FAILED. The scripts build job keys from the prefix,
+# so the queue needs a single Redis server rather than a cluster.
+_REDIS_ENQUEUE = """
+if redis.call('HSETNX', KEYS[1], 'status', 'pending') == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'job_id', ARGV[1], 'run_id', ARGV[2], 'ticker', ARGV[3], 'options', ARGV[4],
+           'attempts', 0, 'max_attempts', ARGV[5], 'enqueued_at', ARGV[6])
+redis.call('SADD', KEYS[2], ARGV[1])
+redis.call('RPUSH', KEYS[3], ARGV[1])
+return 1
+"""
+
+# Requeues the jobs whose lease expired (or fails those that used up their attempts), then leases
+# the next pending job and returns {job_id, attempts, run_id, ticker, options}
+_REDIS_CLAIM = """
+local now = ARGV[2]
+for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], 0, now)) do
+    redis.call('ZREM', KEYS[2], job_id)
+    local key = ARGV[1] .. job_id
+    local attempts = tonumber(redis.call('HGET', key, 'attempts') or 0)
+    local max_attempts = tonumber(redis.call('HGET', key, 'max_attempts') or ARGV[5])
+    if attempts >= max_attempts then
+        redis.call('HSET', key, 'status', 'failed', 'finished_at', now, 'lease_owner', '', 'last_error', 'lease expired')
+    else
+        redis.call('HSET', key, 'status', 'pending', 'lease_owner', '')
+        redis.call('RPUSH', KEYS[1], job_id)
+    end
+end
+local job_id = redis.call('LPOP', KEYS[1])
+if not job_id then
+    return false
+end
+local key = ARGV[1] .. job_id
+local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+redis.call('HSET', key, 'status', 'leased', 'lease_owner', ARGV[3], 'lease_expires_at', ARGV[4], 'started_at', now)
+redis.call('ZADD', KEYS[2], ARGV[4], job_id)
+local fields = redis.call('HMGET', key, 'run_id', 'ticker', 'options')
+return {job_id, attempts, fields[1], fields[2], fields[3]}
+"""
+
+# Prefix of the scripts that change a leased job: KEYS[1] is the job's hash, ARGV[1] its id and
+# ARGV[2] the worker that must hold the lease; they return 0 if it does not
+_REDIS_HOLDS = """
+local fields = redis.call('HMGET', KEYS[1], 'status', 'lease_owner')
+if fields[1] ~= 'leased' or fields[2] ~= ARGV[2] then
+    return 0
+end
+"""
+
+_REDIS_RENEW = _REDIS_HOLDS + """
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+redis.call('HSET', KEYS[1], 'lease_expires_at', ARGV[3])
+return 1
+"""
+
+_REDIS_ACK = _REDIS_HOLDS + """
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HSET', KEYS[1], 'status', 'done', 'finished_at', ARGV[3], 'result', ARGV[4], 'lease_expires_at', '')
+return 1
+"""
+
+_REDIS_FAIL = _REDIS_HOLDS + """
+redis.call('ZREM', KEYS[2], ARGV[1])
+local attempts = tonumber(redis.call('HGET', KEYS[1], 'attempts') or 0)
+local max_attempts = tonumber(redis.call('HGET', KEYS[1], 'max_attempts') or ARGV[5])
+if attempts >= max_attempts then
+    redis.call('HSET', KEYS[1], 'status', 'failed', 'finished_at', ARGV[3], 'lease_owner', '', 'lease_expires_at', '', 'last_error', ARGV[4])
+else
+    redis.call('HSET', KEYS[1], 'status', 'pending', 'lease_owner', '', 'lease_expires_at', '', 'last_error', ARGV[4])
+    redis.call('RPUSH', KEYS[3], ARGV[1])
+end
+return 1
+"""
+
+
+class RedisQueue:
+    """
+    Work queue on a Redis-compatible server (with Lua scripting). Pending job ids are kept in a list,
+    leases in a sorted set scored by expiry, and job fields in one hash per job; enqueue, claim, renew,
+    ack and fail each run as one server-side script, so they are atomic.
+    The client must return strings (decode_responses=True).
+    """
+
+    def __init__(self, client, prefix=REDIS_PREFIX):
+        self.client = client
+        self.prefix = prefix
+        self.pending_key = f'{prefix}:pending'
+        self.leases_key = f'{prefix}:leases'
+        self._enqueue = client.register_script(_REDIS_ENQUEUE)
+        self._claim = client.register_script(_REDIS_CLAIM)
+        self._renew = client.register_script(_REDIS_RENEW)
+        self._ack = client.register_script(_REDIS_ACK)
+        self._fail = client.register_script(_REDIS_FAIL)
+
+    def _job_key(self, job_id):
+        return f'{self.prefix}:job:{job_id}'
+
+    def _run_key(self, run_id):
+        return f'{self.prefix}:run:{run_id}'
+
+    def enqueue(self, run_id, ticker, options, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Adds a job. Returns False if the job already exists.
+        """
+        job_id = job_id_for(run_id, ticker)
+        return bool(self._enqueue(
+            keys=[self._job_key(job_id), self._run_key(run_id), self.pending_key],
+            args=[job_id, run_id, ticker, json.dumps(options), max_attempts, time.time()]
+        ))
+
+    def claim(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Leases the next pending job, after requeuing jobs whose lease expired.
+        Returns a Job, or None if nothing can be claimed.
+        """
+        now = time.time()
+        claimed = self._claim(
+            keys=[self.pending_key, self.leases_key],
+            args=[self._job_key(''), now, worker_id, now + lease_seconds, DEFAULT_MAX_ATTEMPTS]
+        )
+        if not claimed:
+            return None
+        job_id, attempts, run_id, ticker, options = claimed
+        return Job(job_id, run_id, ticker, json.loads(options or '{}'), int(attempts), worker_id)
+
+    def renew(self, job, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Extends the lease of a job. Returns False if the worker no longer holds it.
+        """
+        return bool(self._renew(
+            keys=[self._job_key(job.job_id), self.leases_key],
+            args=[job.job_id, job.lease_owner, time.time() + lease_seconds]
+        ))
+
+    def ack(self, job, result):
+        """
+        Marks a job as done with its result. Returns False if the worker no longer holds it.
+        """
+        return bool(self._ack(
+            keys=[self._job_key(job.job_id), self.leases_key],
+            args=[job.job_id, job.lease_owner, time.time(), json.dumps(result)]
+        ))
+
+    def fail(self, job, error):
+        """
+        Releases a job after a failed attempt: it goes back to pending, or is marked as failed once
+        it used up its attempts. Returns False if the worker no longer holds it.
+        """
+        return bool(self._fail(
+            keys=[self._job_key(job.job_id), self.leases_key, self.pending_key],
+            args=[job.job_id, job.lease_owner, time.time(), error, DEFAULT_MAX_ATTEMPTS]
+        ))
+
+    def has_open_jobs(self):
+        """
+        Returns True while any job is pending or leased.
+        """
+        return bool(self.client.llen(self.pending_key) or self.client.zcard(self.leases_key))
+
+    def run_jobs(self, run_id):
+        """
+        Returns every job of a run as a dictionary.
+        """
+        jobs = [self.client.hgetall(self._job_key(job_id)) for job_id in self.client.smembers(self._run_key(run_id))]
+        return sorted((_decode_job_row(job) for job in jobs if job), key=lambda job: (job['enqueued_at'] or 0, job['job_id']))
+
+
+def open_queue(url=None):
+    """
+    Opens a queue from a URL:
+    - sqlite:///path/to/queue.db (or no URL: the warehouse file) for nodes sharing a file system;
+    - redis://host:port/db or rediss://... for a Redis-compatible server (needs the optional redis package);
+      to try it locally, start a server (e.g. redis-server --port 6379) and use redis://localhost:6379/0.
+    """
+    if not url:
+        return SQLiteQueue()
+    if url.startswith('sqlite:///'):
+        return SQLiteQueue(url[len('sqlite:///'):] or None)
+    if url.startswith(('redis://', 'rediss://')):
+        import redis
+        return RedisQueue(redis.Redis.from_url(url, decode_responses=True))
+    raise ValueError(f"Unsupported queue URL: {url}")
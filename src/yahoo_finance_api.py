@@ -3,27 +3,234 @@
 import yfinance as yf
 import json
 import os
+import math
+import numpy as np
 import pandas as pd
 import logging
+from records import IntradayBars
+from structured_logging import ContextThreadPoolExecutor
+from deadline import network_timeout
+from warehouse import store_intraday_sessions, load_intraday_sessions, store_quote_info, load_quote_info
 
 VALID_PERIODS = ['1d', '5d', '1mo', '3mo', '6mo', '1y', '2y', '5y', '10y', 'ytd', 'max']
 
-def fetch_stock_data(ticker, period='1y'):
+# Yahoo Finance limits per intraday interval: (maximum days per request, maximum days of history)
+INTRADAY_INTERVALS = {
+    '1m': (7, 30),
+    '2m': (60, 60),
+    '5m': (60, 60),
+    '15m': (60, 60),
+    '30m': (60, 60),
+    '60m': (730, 730),
+    '90m': (60, 60),
+    '1h': (730, 730),
+}
+# Approximate length of each period in calendar days
+PERIOD_DAYS = {'1d': 1, '5d': 5, '1mo': 31, '3mo': 92, '6mo': 183, '1y': 366, '2y': 731, '5y': 1827, '10y': 3653}
+# Smallest window worth a separate request; larger pulls are split into about max_workers windows
+MIN_CHUNK_DAYS = 7
+# yfinance's default request timeout, shortened when the run's deadline is close
+YAHOO_TIMEOUT = 10
+
+# Quote fields (named as in yfinance's .info) kept in a run's stock data: the ones the report and
+# its rendering use. Callers may request others.
+QUOTE_FIELDS = ('longName', 'currentPrice', 'previousClose', 'open', 'dayLow', 'dayHigh', 'volume', 'averageVolume',
+                'marketCap', 'trailingPE', 'fiftyTwoWeekLow', 'fiftyTwoWeekHigh')
+# Quote fields served by the fast_info attribute of the same value, which avoids the slow and
+# rate-limited full quote summary request behind .info
+FAST_INFO_FIELDS = {
+    'currentPrice': 'last_price',
+    'previousClose': 'regular_market_previous_close',
+    'open': 'open',
+    'dayLow': 'day_low',
+    'dayHigh': 'day_high',
+    'volume': 'last_volume',
+    'averageVolume': 'three_month_average_volume',
+    'averageVolume10days': 'ten_day_average_volume',
+    'marketCap': 'market_cap',
+    'fiftyTwoWeekLow': 'year_low',
+    'fiftyTwoWeekHigh': 'year_high',
+    'fiftyDayAverage': 'fifty_day_average',
+    'twoHundredDayAverage': 'two_hundred_day_average',
+    'currency': 'currency',
+}
+INTEGER_QUOTE_FIELDS = {'volume', 'averageVolume', 'averageVolume10days', 'marketCap'}
+# Other fields come from the full .info payload, cached for this many days. The trailing P/E is
+# recomputed from the current price and the cached trailing EPS, which only changes with earnings.
+INFO_CACHE_DAYS = 7
+
+def _period_days(period, max_history_days):
+    """
+    Returns the number of calendar days covered by a period, capped at the interval's history limit.
+    """
+    now = pd.Timestamp.now(tz='UTC')
+    if period == 'ytd':
+        days = now.dayofyear
+    else:
+        days = PERIOD_DAYS.get(period, max_history_days)
+    # Yahoo rejects start dates at the very edge of the history window
+    limit = max_history_days - 1
+    if days > limit:
+        logging.warning("Period '%s' exceeds the intraday history available from Yahoo Finance; using the last %s days.", period, limit)
+        days = limit
+    return days
+
+
+def _fetch_intraday_window(ticker, interval, start, end):
+    """
+    Fetches one request window of intraday bars and converts it to compact arrays right away,
+    so the DataFrame of each window is released before the others are stitched together.
+    Returns IntradayBars, or None if the request failed.
+    """
+    try:
+        df = yf.Ticker(ticker).history(start=start, end=end, interval=interval, actions=False, timeout=network_timeout(YAHOO_TIMEOUT))
+        return IntradayBars.from_history_frame(df, interval)
+    except Exception as e:
+        logging.error("An error occurred while fetching %s bars for %s from %s to %s: %s", interval, ticker, start, end, e)
+        return None
+
+
+def _missing_windows(session_days, stored_days, today, chunk_days):
+    """
+    Groups the session dates that must be fetched (not stored yet, or today's still-open session)
+    into runs of consecutive days of at most chunk_days each. Returns (start, end) date strings with
+    an exclusive end, as expected by yfinance.
+    """
+    windows = []
+    run = []
+    for day in session_days:
+        if day in stored_days and day != today:
+            if run:
+                windows.append(run)
+                run = []
+            continue
+        run.append(day)
+        if len(run) == chunk_days:
+            windows.append(run)
+            run = []
+    if run:
+        windows.append(run)
+    return [
+        (run[0], (pd.Timestamp(run[-1]) + pd.Timedelta(days=1)).strftime('%Y-%m-%d'))
+        for run in windows
+    ]
+
+
+def fetch_intraday_history(ticker, interval='5m', period='1mo', max_workers=4, db_path=None):
+    """
+    Fetches intraday bars within Yahoo Finance's per-request window limits.
+    The period is split into windows fetched concurrently and stitched together. Completed sessions
+    are kept in the warehouse in compact binary form, so later runs only fetch new sessions (and
+    today's, which may still be trading and is never stored).
+    Returns IntradayBars (float32 prices, int64 timestamps and volume), or None if the interval is not supported.
+    """
+    if interval not in INTRADAY_INTERVALS:
+        logging.error("Unsupported intraday interval '%s'. Options: %s", interval, ', '.join(INTRADAY_INTERVALS))
+        return None
+    max_request_days, max_history_days = INTRADAY_INTERVALS[interval]
+    days = _period_days(period, max_history_days)
+
+    now = pd.Timestamp.now(tz='UTC')
+    today = now.strftime('%Y-%m-%d')
+    session_days = [day.strftime('%Y-%m-%d') for day in pd.date_range(now.normalize() - pd.Timedelta(days=days), now.normalize(), freq='D')]
+    stored = load_intraday_sessions(ticker, interval, start_date=session_days[0], end_date=today, db_path=db_path)
+
+    chunk_days = min(max_request_days, max(MIN_CHUNK_DAYS, math.ceil(len(session_days) / max_workers)))
+    windows = _missing_windows(session_days, set(stored), today, chunk_days)
+    logging.info("Intraday %s history for %s: %s stored session(s), %s window(s) to fetch.",
+                 interval, ticker, len(stored), len(windows))
+
+    fetched = []
+    if windows:
+        with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(lambda window: _fetch_intraday_window(ticker, interval, *window), windows))
+        for (start, end), bars in zip(windows, results):
+            # Failed and empty windows are not stored, so they are requested again next time
+            if bars is None or not len(bars):
+                continue
+            sessions = bars.split_sessions()
+            # Days of a non-empty window without bars are weekends or holidays
+            for day in pd.date_range(start, end, freq='D', inclusive='left'):
+                sessions.setdefault(day.strftime('%Y-%m-%d'), IntradayBars.empty(interval))
+            # Today's session may still be trading; it is fetched again on every run until it has ended
+            sessions.pop(today, None)
+            store_intraday_sessions(ticker, interval, sessions, db_path=db_path)
+            fetched.append(bars)
+
+    bars = IntradayBars.concat([stored[day] for day in sorted(stored) if day != today] + fetched, interval)
+    # Drop bars before the start of the period (the first window starts at midnight UTC)
+    bars = bars.take(bars.session_dates() >= np.datetime64(session_days[0]))
+    logging.info("Loaded %s %s bars for %s.", len(bars), interval, ticker)
+    return bars
+
+
+def _fast_value(fast_info, field):
+    """
+    Returns a fast_info value converted to the type .info uses for the field, or None if it is not available.
+    """
+    try:
+        value = fast_info[FAST_INFO_FIELDS[field]]
+    except Exception as e:
+        logging.debug("fast_info has no %s: %s", field, e)
+        return None
+    if isinstance(value, str):
+        return value
+    if value is None or not math.isfinite(value):
+        return None
+    return int(value) if field in INTEGER_QUOTE_FIELDS else round(float(value), 4)
+
+
+def fetch_quote_snapshot(stock, fields=QUOTE_FIELDS, db_path=None):
+    """
+    Returns a dictionary with the requested .info fields of a yfinance Ticker.
+    Fields with a fast_info equivalent are read from it; the full .info payload is only requested
+    when another field is needed and no cached copy younger than INFO_CACHE_DAYS exists.
+    Fields that are not available are left out.
+    """
+    snapshot = {}
+    fast_info = stock.fast_info
+    for field in fields:
+        if field in FAST_INFO_FIELDS:
+            value = _fast_value(fast_info, field)
+            if value is not None:
+                snapshot[field] = value
+
+    missing = [field for field in fields if field not in snapshot]
+    if not missing:
+        return snapshot
+    info = load_quote_info(stock.ticker, max_age_days=INFO_CACHE_DAYS, db_path=db_path)
+    if info is None:
+        logging.info("Fetching the full quote info of %s for %s.", stock.ticker, ', '.join(missing))
+        info = stock.info or {}
+        if info:
+            store_quote_info(stock.ticker, info, db_path=db_path)
+    for field in missing:
+        if field == 'trailingPE' and (info.get('trailingEps') or 0) > 0 and 'currentPrice' in snapshot:
+            snapshot[field] = round(snapshot['currentPrice'] / info['trailingEps'], 2)
+        elif field in info:
+            snapshot[field] = info[field]
+    return snapshot
+
+
+def fetch_stock_data(ticker, period='1y', interval='1d', db_path=None, quote_fields=QUOTE_FIELDS):
     """
     Fetches stock data for the given ticker using yfinance and saves it as a JSON file.
     Parameters:
         ticker (str): The stock ticker symbol.
         period (str): The period over which to fetch stock data (e.g., '1y', '6mo', '1mo').
+        interval (str): Bar interval. Daily history is always fetched; with an intraday interval
+            (e.g. '5m'), intraday bars for the same period are added under 'intraday' (not saved to JSON).
+        quote_fields: The .info fields kept under 'info' (see fetch_quote_snapshot).
     """
     try:
         stock = yf.Ticker(ticker)
-        stock_info = stock.info
+        stock_info = fetch_quote_snapshot(stock, fields=quote_fields, db_path=db_path)
         if not stock_info:
             raise ValueError(f"No stock info available for {ticker}.")
 
-        stock_history = stock.history(period=period)
+        stock_history = stock.history(period=period, timeout=network_timeout(YAHOO_TIMEOUT))
         if stock_history.empty:
-            logging.warning(f"No historical data available for {ticker} over period '{period}'.")
+            logging.warning("No historical data available for %s over period '%s'.", ticker, period)
             return None
 
         stock_history.reset_index(inplace=True)
@@ -47,11 +254,14 @@ def fetch_stock_data(ticker, period='1y'):
         with open(f'data/{ticker}_stock_data.json', 'w') as f:
             json.dump(data, f, indent=4)
 
-        logging.info(f"Stock data for {ticker} has been saved to data/{ticker}_stock_data.json.")
+        logging.info("Stock data for %s has been saved to data/%s_stock_data.json.", ticker, ticker)
+
+        if interval in INTRADAY_INTERVALS:
+            data['intraday'] = fetch_intraday_history(ticker, interval=interval, period=period, db_path=db_path)
         return data
 
     except Exception as e:
-        logging.error(f"An error occurred while fetching data for {ticker}: {e}")
+        logging.error("An error occurred while fetching data for %s: %s", ticker, e)
         return None
 
 if __name__ == '__main__':